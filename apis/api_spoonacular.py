@@ -1,22 +1,76 @@
 """Fetching from Spoonacular API endpoints."""
 
 import requests
-from datetime import datetime
-from crud import db, create_recipe, get_recipe_by_spoonacular_id, create_ingredient, create_recipe_nutrient, get_or_create_nutrient
+import threading
+from crud import db, normalize_search_key, get_recipe_search_by_key, update_recipe_search, is_recipe_search_fresh, get_recipes_by_ids
+from recipe_ingest import ingest_spoonacular_recipes
+from apis.spoonacular_client import SpoonacularClient, SPOONACULAR_BASE_URL
+from apis.spoonacular_replay import get_transport_from_environment
+from single_flight import SingleFlight
+import ingredient_index
+import nutrient_matrix
+import recipe_autocomplete
 import os 
 
 
-API_KEY = os.environ['SPOONACULAR_KEY']
-SPOONACULAR_BASE_URL = "https://api.spoonacular.com/recipes"
+# read when the client is created, not at import, so replay and the fake server work without a key
+def get_api_key():
+    """Return the Spoonacular API key from the environment."""
+
+    return os.environ.get('SPOONACULAR_KEY', '')
+
+
+_client = None # this worker's shared client, so every search reuses its pooled connections
+_client_lock = threading.Lock()
+
+# concurrent identical searches (same normalized query + filters) share one fetch and ingest
+spoonacular_search_flights = SingleFlight()
+
+
+def get_spoonacular_client():
+    """Return this worker's shared Spoonacular client, creating it on first use."""
+
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SpoonacularClient(
+                    get_api_key(),
+                    base_url=os.environ.get('SPOONACULAR_BASE_URL', SPOONACULAR_BASE_URL), # ex. the local fake server
+                    transport=get_transport_from_environment() # live, record or replay
+                )
+
+    return _client
+
+
+def set_spoonacular_client(client):
+    """Replace this worker's shared Spoonacular client (ex. with one using a stub transport)."""
+
+    global _client
+
+    with _client_lock:
+        _client = client
+
+
+def get_spoonacular_stats():
+    """Return this worker's Spoonacular client latency stats and search coalescing counters
+    (printed at the end of warm_catalog.py, and served by the server's /api/stats).
+    """
+
+    return {
+        "client": get_spoonacular_client().get_stats(),
+        "search_flights": spoonacular_search_flights.get_stats(),
+    }
 
-def get_and_cache_spoonacular_recipes(recipe_query, user_allergens=None, user_diet_restrictions=None, user_likes=None, user_dislikes=None, limit=50):
-    """Send search recipes request to Spoonacular API. Cache and return fetched recipes."""
 
-    headers = {'x-api-key': API_KEY} # can put api key for spoonacular in header or query string 
+def build_spoonacular_search_params(recipe_query, user_allergens=None, user_diet_restrictions=None, user_likes=None, user_dislikes=None, limit=50, offset=0):
+    """Return complexSearch params for a query and a user's filters."""
 
     spoonacular_params = {
         'query': recipe_query, # natural language recipe search query
         'number': limit, # how many recipes to return
+        'offset': offset, # how many results to skip, for paging
         'instructionsRequired': True,
         'addRecipeInformation': True, 
         'addRecipeNutrition': True,
@@ -35,79 +89,74 @@ def get_and_cache_spoonacular_recipes(recipe_query, user_allergens=None, user_di
     
     if user_dislikes:
         spoonacular_params['excludeIngredients'] = ', '.join(user_dislikes)
-    
-    # try and except????
-    response = requests.get(f'{SPOONACULAR_BASE_URL}/complexSearch', headers=headers, params=spoonacular_params)
-    response = response.json()
 
+    return spoonacular_params
+
+
+def get_and_cache_spoonacular_recipes(recipe_query, user_allergens=None, user_diet_restrictions=None, user_likes=None, user_dislikes=None, limit=50, offset=0):
+    """Send search recipes request to Spoonacular API. Cache and return fetched recipes."""
+
+    spoonacular_params = build_spoonacular_search_params(
+        recipe_query, user_allergens, user_diet_restrictions, user_likes, user_dislikes, limit, offset
+    )
+    search_key = normalize_search_key(recipe_query, user_allergens, user_diet_restrictions, user_likes, user_dislikes)
+
+    # a fresh search (including one Spoonacular had no results for) resolves to its cached
+    # recipe_ids with one primary key lookup, without calling Spoonacular again
+    if not offset:
+        recipe_search = get_recipe_search_by_key(search_key)
+
+        if is_recipe_search_fresh(recipe_search):
+            return get_recipes_by_ids((recipe_search.recipe_ids or [])[:limit])
+
+    # recipe ids, not Recipe objects, are shared between callers: each caller loads them in its own session
+    recipe_ids, _ = spoonacular_search_flights.do(
+        (search_key, limit, offset),
+        _fetch_and_cache_recipe_ids,
+        recipe_query,
+        search_key,
+        spoonacular_params
+    )
+
+    return get_recipes_by_ids(recipe_ids)
+
+
+def _fetch_and_cache_recipe_ids(recipe_query, search_key, spoonacular_params):
+    """Fetch and cache a page of results, returning their recipe ids (none if Spoonacular fails)."""
+
+    try:
+        recipe_ids, _ = fetch_and_cache_spoonacular_page(recipe_query, search_key, spoonacular_params)
+    except requests.RequestException as error:
+        # search keeps working from the local catalog; the query stays unfetched so it's retried next time
+        print(f"Spoonacular search for '{recipe_query}' failed: {error}")
+        return []
+
+    return recipe_ids
+
+
+def fetch_and_cache_spoonacular_page(recipe_query, search_key, spoonacular_params):
+    """Send a complexSearch request and cache its results in one transaction.
+    returns (recipe ids in result order, ingest stats). raises requests.RequestException if Spoonacular fails.
+    """
+
+    response = get_spoonacular_client().complex_search(spoonacular_params)
     spoonacular_recipes = response.get('results', [])
-    cached_recipes_from_database = []
-
-    # new_recipes_to_add = []
-    new_ingredients_to_add = []
-    new_recipe_nutrients_to_add = []
-
-    for recipe in spoonacular_recipes:
-        
-        # check if a recipe is already in database
-        existing_recipe = get_recipe_by_spoonacular_id(recipe['id'])
-
-        if not existing_recipe: # if not in database
-            # create new recipe in database
-            new_recipe = create_recipe(
-                spoonacular_id=recipe['id'],
-                title=recipe.get('title', 'No title'),
-                source=recipe.get('sourceName', 'N/A'),
-                url=recipe.get('sourceUrl', 'N/A'),
-                servings=recipe.get('servings', 1),
-                instructions=recipe.get('instructions', 'No instructions provided'),
-                diets=recipe.get('diets', []),
-                texture=None
-            )
-            db.session.add(new_recipe)
-            db.session.commit()
-            # new_recipes_to_add.append(new_recipe) # add to list of recipes to add/commit
-
-            # cache ingredients
-            if 'extendedIngredients' in recipe:
-                for ingredient in recipe['extendedIngredients']:
-                    new_ingredient = create_ingredient(
-                        recipe_id=new_recipe.recipe_id,
-                        name=ingredient.get('name', 'N/A'),
-                        quantity=ingredient.get('amount', 0.0),
-                        unit=ingredient.get('unit', 'unit')
-                    )
-                    new_ingredients_to_add.append(new_ingredient) # add to list of ingredients to add/commit
-            
-            # cache nutrients
-            # from setting 'addRecipeNutrition' param to True
-            if 'nutrition' in recipe and 'nutrients' in recipe['nutrition']:
-                for nutrient in recipe['nutrition']['nutrients']:
-
-                    nutrient_in_recipe = get_or_create_nutrient(nutrient['name'], nutrient['unit'])
-
-                    new_recipe_nutrient = create_recipe_nutrient(
-                        recipe_id=new_recipe.recipe_id,
-                        nutrient_id=nutrient_in_recipe.nutrient_id,
-                        quantity=nutrient['amount'] # total amount per recipe, not per serving
-                    )
-                    new_recipe_nutrients_to_add.append(new_recipe_nutrient)
-
-            cached_recipes_from_database.append(new_recipe) # append to list of recipes cached during this fetch
-
-        else:
-            cached_recipes_from_database.append(existing_recipe)
-        
-        # db.session.add_all(new_recipes_to_add)
-        db.session.add_all(new_ingredients_to_add)
-        db.session.add_all(new_recipe_nutrients_to_add)
-        db.session.commit()
-    
-    return cached_recipes_from_database
-        
 
+    cached_recipes_from_database, inserted_recipe_ids, ingest_stats = ingest_spoonacular_recipes(spoonacular_recipes, commit=False)
+    ingest_stats["results"] = len(spoonacular_recipes)
+    recipe_ids = [recipe.recipe_id for recipe in cached_recipes_from_database]
 
+    # remember this query + filter set's results (or that it had none) and when they were fetched,
+    # in the same transaction as the ingest; only the first page stands for the search
+    if not spoonacular_params.get('offset'):
+        db.session.add(update_recipe_search(search_key, recipe_query, recipe_ids))
 
+    db.session.commit()
 
+    # this worker sees its own new recipes right away, other workers on their next refresh;
+    # recipes that were already cached haven't changed
+    ingredient_index.index_recipes(inserted_recipe_ids)
+    nutrient_matrix.refresh_recipes(inserted_recipe_ids)
+    recipe_autocomplete.index_recipes(inserted_recipe_ids)
 
-        
+    return recipe_ids, ingest_stats
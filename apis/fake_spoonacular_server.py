@@ -0,0 +1,115 @@
+"""A local stand-in for Spoonacular's complexSearch endpoint, for offline load testing.
+
+serves saved `results` payloads (recorded cassettes, or any JSON files with a "results" list)
+with configurable latency and error injection. point the app at it with:
+
+    python -m apis.fake_spoonacular_server --payloads spoonacular_cassettes --latency-ms 400
+    SPOONACULAR_BASE_URL=http://localhost:6061/recipes python3 server.py
+
+a request that matches a recorded cassette gets the recorded body. any other query gets
+`number` results sampled from the saved payloads, seeded by the query so repeats are
+stable. with --unique-ids each query + position gets its own spoonacular id, so ingest
+inserts new rows at scale, the same as it would with the real catalog.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import time
+
+from flask import Flask, request, jsonify
+
+from apis.spoonacular_replay import get_cassette_key
+
+
+SYNTHETIC_ID_START = 1_000_000_000 # far above real Spoonacular ids
+
+
+def load_payloads(payload_dir):
+    """Return (cassette bodies by key, pool of every saved result) from a directory of JSON files."""
+
+    cassettes = {}
+    result_pool = []
+
+    for payload_path in glob.glob(os.path.join(payload_dir, "*.json")):
+        with open(payload_path) as payload_file:
+            payload = json.load(payload_file)
+
+        body = payload.get("body", payload) # a cassette, or a bare complexSearch response
+
+        if "path" in payload and "params" in payload:
+            cassettes[get_cassette_key(payload["path"], payload["params"])] = body
+
+        result_pool.extend(body.get("results", []))
+
+    return cassettes, result_pool
+
+
+def get_synthetic_id(query, position):
+    """Return a stable spoonacular id for a result position of a query."""
+
+    digest = hashlib.sha1(f"{query}|{position}".encode()).hexdigest()
+
+    return SYNTHETIC_ID_START + int(digest[:12], 16) % 1_000_000_000
+
+
+def create_app(payload_dir, latency_ms=0, jitter_ms=0, error_rate=0.0, unique_ids=True):
+    """Return a Flask app serving /recipes/complexSearch from saved payloads."""
+
+    cassettes, result_pool = load_payloads(payload_dir)
+    fake_app = Flask(__name__)
+
+    @fake_app.route("/recipes/complexSearch")
+    def complex_search():
+        time.sleep((latency_ms + random.uniform(0, jitter_ms)) / 1000)
+
+        if random.random() < error_rate:
+            return jsonify({"status": "failure", "message": "injected error"}), 503
+
+        cassette_body = cassettes.get(get_cassette_key(request.path, request.args.items(multi=True)))
+        if cassette_body is not None:
+            return jsonify(cassette_body)
+
+        query = request.args.get("query", "")
+        number = int(request.args.get("number", 10))
+        offset = int(request.args.get("offset", 0))
+
+        if not result_pool:
+            return jsonify({"results": [], "offset": offset, "number": number, "totalResults": 0})
+
+        query_random = random.Random(query)
+        results = []
+
+        for position in range(offset, offset + number):
+            result = dict(query_random.choice(result_pool))
+
+            if unique_ids:
+                result["id"] = get_synthetic_id(query, position)
+
+            results.append(result)
+
+        return jsonify({"results": results, "offset": offset, "number": number, "totalResults": offset + number})
+
+    return fake_app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", default="spoonacular_cassettes", help="directory of saved JSON payloads")
+    parser.add_argument("--port", type=int, default=6061)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--no-unique-ids", action="store_true", help="serve saved results with their original ids")
+    args = parser.parse_args()
+
+    create_app(
+        args.payloads,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        unique_ids=not args.no_unique_ids
+    ).run(port=args.port, threaded=True)
@@ -0,0 +1,136 @@
+"""Pooled, keep-alive HTTP client for the Spoonacular API."""
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+SPOONACULAR_BASE_URL = "https://api.spoonacular.com/recipes"
+
+CONNECT_TIMEOUT = 3.05 # seconds to open a connection
+READ_TIMEOUT = 10 # seconds to wait for a response
+MAX_RETRIES = 3 # retries after the first attempt
+BACKOFF_BASE = 0.5 # seconds, doubled on every retry
+BACKOFF_MAX = 8 # seconds
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+POOL_SIZE = 10 # keep-alive connections kept open per host
+
+
+class SpoonacularClient:
+    """A Spoonacular API client with a pooled keep-alive session, timeouts,
+    bounded retries with jittered backoff on 429 and 5xx responses, and latency stats.
+
+    pass a transport (a requests transport adapter) to serve requests from a local stub
+    instead of the live API.
+    """
+
+    def __init__(self, api_key, base_url=SPOONACULAR_BASE_URL, transport=None,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        self.session.headers['x-api-key'] = api_key # can put api key for spoonacular in header or query string
+
+        if transport is None:
+            # retries are handled in get(), so the adapter itself never retries
+            transport = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+
+        self.session.mount("https://", transport)
+        self.session.mount("http://", transport)
+
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Clear the per-call latency stats."""
+
+        with self._stats_lock:
+            self._stats = {
+                "calls": 0,
+                "attempts": 0,
+                "retries": 0,
+                "errors": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0,
+            }
+
+    def get_stats(self):
+        """Return a dictionary of call counts and latency stats (seconds)."""
+
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        stats["average_latency"] = stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0
+
+        return stats
+
+    def _record_call(self, latency, attempts, failed):
+        """Add one call to the stats."""
+
+        with self._stats_lock:
+            self._stats["calls"] += 1
+            self._stats["attempts"] += attempts
+            self._stats["retries"] += attempts - 1
+            self._stats["errors"] += 1 if failed else 0
+            self._stats["total_latency"] += latency
+            self._stats["max_latency"] = max(self._stats["max_latency"], latency)
+
+    def _get_backoff(self, retry_number, response=None):
+        """Return seconds to wait before a retry: Retry-After if the API sent one,
+        otherwise exponential backoff with full jitter.
+        """
+
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return min(float(response.headers["Retry-After"]), self.backoff_max)
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry_number))
+
+    def get(self, path, params=None):
+        """Send a GET request to a Spoonacular endpoint and return the decoded JSON.
+        raises requests.RequestException once retries run out.
+        """
+
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        start_time = time.perf_counter()
+        attempts = 0
+
+        try:
+            while True:
+                attempts += 1
+                response = None
+
+                try:
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempts > self.max_retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUS_CODES or attempts > self.max_retries:
+                        response.raise_for_status()
+                        result = response.json()
+                        break
+
+                time.sleep(self._get_backoff(attempts - 1, response))
+
+        except requests.RequestException:
+            self._record_call(time.perf_counter() - start_time, attempts, failed=True)
+            raise
+
+        self._record_call(time.perf_counter() - start_time, attempts, failed=False)
+
+        return result
+
+    def complex_search(self, params):
+        """Send a complexSearch request and return the decoded JSON."""
+
+        return self.get("complexSearch", params=params)
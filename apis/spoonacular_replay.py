@@ -0,0 +1,135 @@
+"""Record/replay transports for the Spoonacular client, for offline benchmarks and load tests.
+
+SPOONACULAR_TRANSPORT=record saves every successful live response as a cassette (one JSON
+file per endpoint + params) in SPOONACULAR_CASSETTE_DIR. SPOONACULAR_TRANSPORT=replay serves
+those cassettes with no network, with optional latency and error injection:
+
+    SPOONACULAR_REPLAY_LATENCY_MS    added to every response (default 0)
+    SPOONACULAR_REPLAY_JITTER_MS     random extra latency, 0 to this many ms (default 0)
+    SPOONACULAR_REPLAY_ERROR_RATE    fraction of requests answered with a 503 (default 0)
+"""
+
+import hashlib
+import json
+import os
+import random
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+
+DEFAULT_CASSETTE_DIR = "spoonacular_cassettes"
+IGNORED_PARAMS = {"apiKey"} # never part of a cassette key, never saved
+
+
+def get_cassette_key(path, params):
+    """Return a stable key for an endpoint path and its query params (order-insensitive)."""
+
+    normalized_params = sorted((name, str(value)) for name, value in params if name not in IGNORED_PARAMS)
+    key_source = json.dumps([path.rstrip("/").rsplit("/", 1)[-1], normalized_params])
+
+    return hashlib.sha1(key_source.encode()).hexdigest()
+
+
+def get_request_cassette_key(request):
+    """Return the cassette key for a prepared requests.Request."""
+
+    url = urlsplit(request.url)
+
+    return get_cassette_key(url.path, parse_qsl(url.query))
+
+
+def build_json_response(request, status_code, body):
+    """Return a requests Response with a JSON body, as if it came from the network."""
+
+    response = Response()
+    response.request = request
+    response.url = request.url
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+    response._content = json.dumps(body).encode()
+    response.encoding = "utf-8"
+
+    return response
+
+
+class RecordingTransport(HTTPAdapter):
+    """A live transport that also saves every successful JSON response as a cassette."""
+
+    def __init__(self, cassette_dir=DEFAULT_CASSETTE_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 200:
+            url = urlsplit(request.url)
+            cassette = {
+                "path": url.path,
+                "params": [[name, value] for name, value in parse_qsl(url.query) if name not in IGNORED_PARAMS],
+                "body": response.json(),
+            }
+            cassette_path = os.path.join(self.cassette_dir, f"{get_request_cassette_key(request)}.json")
+
+            with open(cassette_path, "w") as cassette_file:
+                json.dump(cassette, cassette_file)
+
+        return response
+
+
+class ReplayTransport(BaseAdapter):
+    """An offline transport that answers from saved cassettes.
+    requests with no cassette get a 404, like an unknown endpoint.
+    """
+
+    def __init__(self, cassette_dir=DEFAULT_CASSETTE_DIR, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        super().__init__()
+        self.cassette_dir = cassette_dir
+        self.latency = latency # seconds
+        self.jitter = jitter # seconds
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    def send(self, request, **kwargs):
+        time.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+        if self.random.random() < self.error_rate:
+            return build_json_response(request, 503, {"status": "failure", "message": "injected error"})
+
+        cassette_path = os.path.join(self.cassette_dir, f"{get_request_cassette_key(request)}.json")
+
+        if not os.path.exists(cassette_path):
+            return build_json_response(request, 404, {"status": "failure", "message": "no cassette for request"})
+
+        with open(cassette_path) as cassette_file:
+            cassette = json.load(cassette_file)
+
+        return build_json_response(request, 200, cassette["body"])
+
+    def close(self):
+        pass
+
+
+def get_transport_from_environment():
+    """Return the transport chosen by SPOONACULAR_TRANSPORT, or None for the default live transport."""
+
+    mode = os.environ.get("SPOONACULAR_TRANSPORT", "live")
+    cassette_dir = os.environ.get("SPOONACULAR_CASSETTE_DIR", DEFAULT_CASSETTE_DIR)
+
+    if mode == "record":
+        return RecordingTransport(cassette_dir)
+
+    if mode == "replay":
+        return ReplayTransport(
+            cassette_dir,
+            latency=float(os.environ.get("SPOONACULAR_REPLAY_LATENCY_MS", 0)) / 1000,
+            jitter=float(os.environ.get("SPOONACULAR_REPLAY_JITTER_MS", 0)) / 1000,
+            error_rate=float(os.environ.get("SPOONACULAR_REPLAY_ERROR_RATE", 0)),
+        )
+
+    return None
@@ -0,0 +1,90 @@
+"""Background Spoonacular ingest, so search requests never wait on the API.
+
+searches that need Spoonacular enqueue a fetch job on a small bounded thread pool and
+answer right away from the local catalog. the frontend polls the job for the
+recipes it added.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from model import db
+from apis.api_spoonacular import get_and_cache_spoonacular_recipes
+
+
+MAX_WORKERS = 2 # concurrent Spoonacular fetches per worker process
+MAX_QUEUED_JOBS = 50 # jobs waiting or running; more than this and new fetches are dropped
+MAX_FINISHED_JOBS = 500 # finished jobs kept around for polling
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="spoonacular-ingest")
+_lock = threading.Lock()
+_jobs = OrderedDict() # job_id -> job dictionary
+_active_job_ids_by_search_key = {} # search_key -> job_id of its queued or running job
+
+
+def _run_job(app, job_id, fetch_kwargs):
+    """Fetch and cache recipes for a job, in its own app context (and so its own db session)."""
+
+    job = _jobs[job_id]
+    job["status"] = "running"
+
+    with app.app_context():
+        try:
+            recipes = get_and_cache_spoonacular_recipes(**fetch_kwargs)
+            job["recipe_ids"] = [recipe.recipe_id for recipe in recipes]
+            job["status"] = "done"
+        except Exception as error:
+            db.session.rollback()
+            print(f"Background Spoonacular ingest for '{fetch_kwargs.get('recipe_query')}' failed: {error}")
+            job["status"] = "failed"
+
+    with _lock:
+        _active_job_ids_by_search_key.pop(job["search_key"], None)
+        _forget_finished_jobs()
+
+
+def _forget_finished_jobs():
+    """Drop the oldest finished jobs past MAX_FINISHED_JOBS. Caller holds _lock."""
+
+    finished_job_ids = [job_id for job_id, job in _jobs.items() if job["status"] in ("done", "failed")]
+
+    for job_id in finished_job_ids[:max(0, len(finished_job_ids) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def enqueue_spoonacular_fetch(search_key, **fetch_kwargs):
+    """Queue a get_and_cache_spoonacular_recipes call and return its job_id.
+
+    a search already queued or running returns the existing job_id.
+    returns None if the queue is full; the search is then simply retried on a later request.
+    """
+
+    app = current_app._get_current_object()
+
+    with _lock:
+        if search_key in _active_job_ids_by_search_key:
+            return _active_job_ids_by_search_key[search_key]
+
+        if len(_active_job_ids_by_search_key) >= MAX_QUEUED_JOBS:
+            return None
+
+        job_id = uuid.uuid4().hex
+        _jobs[job_id] = {"status": "queued", "search_key": search_key, "recipe_ids": []}
+        _active_job_ids_by_search_key[search_key] = job_id
+
+    _executor.submit(_run_job, app, job_id, fetch_kwargs)
+
+    return job_id
+
+
+def get_job(job_id):
+    """Return a copy of a job dictionary (status, search_key, recipe_ids), or None if unknown."""
+
+    with _lock:
+        job = _jobs.get(job_id)
+
+        return dict(job) if job else None
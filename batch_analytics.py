@@ -0,0 +1,330 @@
+"""Nightly population analytics: every user's weekly logging and protein/fiber/calcium goal adherence.
+
+users are split into partitions (user_id % partitions) summarized in a process pool. each
+process streams its partition's logged recipes in chunks through a server-side cursor, totals
+every user-day's nutrients from the per-serving nutrient matrix (see nutrient_matrix), reduces
+them to user-weeks with numpy and bulk-upserts weekly_nutrition_summaries. finished partitions
+are checkpointed, so an interrupted run redoes only the partitions it hadn't finished.
+
+    python3 batch_analytics.py --weeks 4 --partitions 16 --processes 4
+"""
+
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from model import db, connect_to_db, User, NutritionGoal, MealLog, MealLogRecipe, WeeklyNutritionSummary
+from checkpoints import Checkpoint
+from meal_plan_nutrition import get_daily_targets
+import nutrient_matrix
+
+
+SUMMARY_NUTRIENTS = {"Protein": "protein", "Fiber": "fiber", "Calcium": "calcium"} # nutrient -> column prefix
+CHUNK_SIZE = 20_000 # logged recipes fetched per round trip of the server-side cursor
+
+
+def init_worker(db_uri):
+    """Connect a pool process to the database (each process has its own engine)."""
+
+    from server import app
+
+    connect_to_db(app, db_uri=db_uri, echo=False)
+    app.app_context().push()
+
+
+def get_partition_user_ids(partition, partitions):
+    """Return the sorted user_ids in a partition."""
+
+    return db.session.execute(
+        select(User.user_id).where(User.user_id % partitions == partition).order_by(User.user_id)
+    ).scalars().all()
+
+
+def get_partition_goals(partition, partitions):
+    """Return {user_id: [nutrition goals]} for a partition's users."""
+
+    goals_by_user = {}
+
+    for user_id, goal in db.session.execute(
+        select(NutritionGoal.user_id, NutritionGoal.goal).where(NutritionGoal.user_id % partitions == partition)
+    ):
+        goals_by_user.setdefault(user_id, []).append(goal.lower())
+
+    return goals_by_user
+
+
+def stream_partition_logs(partition, partitions, period_start, period_end, chunk_size):
+    """Yield lists of (user_id, log_date, recipe_id, serving_size), ordered by user, never
+    splitting a user across lists, streamed from a server-side cursor.
+    """
+
+    log_query = select(
+        MealLog.user_id, MealLog.log_date, MealLogRecipe.recipe_id, MealLogRecipe.serving_size
+    ).join(MealLogRecipe, MealLogRecipe.meal_log_id == MealLog.meal_log_id).where(
+        MealLog.user_id % partitions == partition,
+        MealLog.log_date.between(period_start, period_end)
+    ).order_by(MealLog.user_id, MealLog.log_date).execution_options(yield_per=chunk_size)
+
+    carried_rows = []
+
+    for chunk in db.session.execute(log_query).partitions():
+        log_rows = carried_rows + [tuple(row) for row in chunk]
+        last_user_id = log_rows[-1][0]
+
+        # the last user's logs may continue in the next chunk
+        split = len(log_rows)
+        while split and log_rows[split - 1][0] == last_user_id:
+            split -= 1
+
+        carried_rows = log_rows[split:]
+
+        if split:
+            yield log_rows[:split]
+
+    if carried_rows:
+        yield carried_rows
+
+
+def summarize_logs(log_rows, goals_by_user, period_start, computed_at):
+    """Return weekly_nutrition_summaries rows for the user-weeks with logs among log_rows."""
+
+    # nutrients of every user-day, from the per-serving matrix
+    user_days, daily_totals = nutrient_matrix.get_grouped_nutrient_totals(
+        ((user_id, log_date), recipe_id, serving_size) for user_id, log_date, recipe_id, serving_size in log_rows
+    )
+    column_by_name = {name: column for column, (_, name, _) in enumerate(nutrient_matrix.get_nutrient_columns())}
+
+    # user-week of every user-day and every logged recipe
+    user_week_indexes = {}
+    day_weeks = np.array([
+        user_week_indexes.setdefault((user_id, (log_date - period_start).days // 7), len(user_week_indexes))
+        for user_id, log_date in user_days
+    ], dtype=np.intp)
+    recipe_weeks = np.array([
+        user_week_indexes[(user_id, (log_date - period_start).days // 7)] for user_id, log_date, _, _ in log_rows
+    ], dtype=np.intp)
+
+    week_count = len(user_week_indexes)
+    days_logged = np.bincount(day_weeks, minlength=week_count)
+    recipes_logged = np.bincount(recipe_weeks, minlength=week_count)
+
+    # each user's daily targets, one per user-day (they depend on the user's goals)
+    targets_by_user = {
+        user_id: get_daily_targets(goals_by_user.get(user_id, [])) for user_id in {user_id for user_id, _ in user_days}
+    }
+
+    summary_columns = {}
+
+    for nutrient_name, column_prefix in SUMMARY_NUTRIENTS.items():
+        column = column_by_name.get(nutrient_name)
+        quantities = daily_totals[:, column] if column is not None else np.zeros(len(user_days))
+
+        bounds = np.array([targets_by_user[user_id][nutrient_name][0] == "min" for user_id, _ in user_days], dtype=bool)
+        amounts = np.array([targets_by_user[user_id][nutrient_name][1] for user_id, _ in user_days], dtype=float)
+        met = np.where(bounds, quantities >= amounts, quantities <= amounts)
+
+        summary_columns[f"{column_prefix}_average"] = np.bincount(day_weeks, weights=quantities, minlength=week_count) / days_logged
+        summary_columns[f"{column_prefix}_goal_days"] = np.bincount(day_weeks, weights=met, minlength=week_count)
+
+    summary_rows = []
+
+    for (user_id, week), index in user_week_indexes.items():
+        summary_row = {
+            "user_id": user_id,
+            "week_start": period_start + timedelta(weeks=week),
+            "days_logged": int(days_logged[index]),
+            "recipes_logged": int(recipes_logged[index]),
+            "computed_at": computed_at,
+        }
+        for column_prefix in SUMMARY_NUTRIENTS.values():
+            summary_row[f"{column_prefix}_average"] = round(float(summary_columns[f"{column_prefix}_average"][index]), 2)
+            summary_row[f"{column_prefix}_goal_days"] = int(summary_columns[f"{column_prefix}_goal_days"][index])
+        summary_rows.append(summary_row)
+
+    return summary_rows
+
+
+def get_empty_summaries(user_weeks, period_start, computed_at):
+    """Return weekly_nutrition_summaries rows for [(user_id, week)] with nothing logged."""
+
+    return [
+        {
+            "user_id": user_id,
+            "week_start": period_start + timedelta(weeks=week),
+            "days_logged": 0,
+            "recipes_logged": 0,
+            "computed_at": computed_at,
+            **{f"{column_prefix}_average": None for column_prefix in SUMMARY_NUTRIENTS.values()},
+            **{f"{column_prefix}_goal_days": 0 for column_prefix in SUMMARY_NUTRIENTS.values()},
+        }
+        for user_id, week in user_weeks
+    ]
+
+
+def write_summaries(summary_rows):
+    """Bulk upsert summary rows in their own transaction (the session's is holding the cursor)."""
+
+    if not summary_rows:
+        return
+
+    summaries_table = WeeklyNutritionSummary.__table__
+    upsert_statement = insert(summaries_table)
+    upsert_statement = upsert_statement.on_conflict_do_update(
+        index_elements=["user_id", "week_start"],
+        set_={column: upsert_statement.excluded[column] for column in summary_rows[0] if column not in ("user_id", "week_start")}
+    )
+
+    with db.engine.begin() as connection:
+        connection.execute(upsert_statement, summary_rows)
+
+
+def summarize_partition(partition, partitions, period_start, week_count, chunk_size=CHUNK_SIZE):
+    """Summarize every user-week of one partition (runs in a pool process) and return its stats."""
+
+    start_time = time.perf_counter()
+    period_end = period_start + timedelta(weeks=week_count, days=-1)
+    computed_at = datetime.now()
+
+    user_ids = get_partition_user_ids(partition, partitions)
+    goals_by_user = get_partition_goals(partition, partitions)
+    summarized_user_weeks = set()
+    stats = {"partition": partition, "users": len(user_ids), "logged_recipes": 0, "summaries": 0}
+
+    for log_rows in stream_partition_logs(partition, partitions, period_start, period_end, chunk_size):
+        summary_rows = summarize_logs(log_rows, goals_by_user, period_start, computed_at)
+        write_summaries(summary_rows)
+
+        summarized_user_weeks.update((row["user_id"], row["week_start"]) for row in summary_rows)
+        stats["logged_recipes"] += len(log_rows)
+        stats["summaries"] += len(summary_rows)
+
+    db.session.rollback() # end the streaming transaction
+
+    # users who logged nothing in a week get a summary too: that's a gap in logging consistency
+    empty_user_weeks = [
+        (user_id, week) for user_id in user_ids for week in range(week_count)
+        if (user_id, period_start + timedelta(weeks=week)) not in summarized_user_weeks
+    ]
+    empty_rows = get_empty_summaries(empty_user_weeks, period_start, computed_at)
+
+    for batch_start in range(0, len(empty_rows), chunk_size):
+        write_summaries(empty_rows[batch_start:batch_start + chunk_size])
+
+    stats["summaries"] += len(empty_rows)
+    stats["seconds"] = round(time.perf_counter() - start_time, 2)
+
+    return stats
+
+
+def get_partition_key(period_start, week_count, partition, partitions):
+    """Return the checkpoint key for one partition of one run's period."""
+
+    return f"{period_start.isoformat()}|{week_count}|{partition}/{partitions}"
+
+
+def run_batch_analytics(db_uri, period_start, week_count, partitions=16, processes=4,
+                        checkpoint_path="batch_analytics_checkpoint.json", chunk_size=CHUNK_SIZE):
+    """Summarize every partition not checkpointed yet and return a dictionary of totals."""
+
+    checkpoint = Checkpoint(checkpoint_path)
+    totals = {"partitions": 0, "users": 0, "logged_recipes": 0, "summaries": 0}
+    start_time = time.perf_counter()
+
+    pending_partitions = [
+        partition for partition in range(partitions)
+        if not checkpoint.is_done(get_partition_key(period_start, week_count, partition, partitions))
+    ]
+
+    # spawned (not forked) processes, so none inherits the parent's connections
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(db_uri,)
+    ) as executor:
+        futures = [
+            executor.submit(summarize_partition, partition, partitions, period_start, week_count, chunk_size)
+            for partition in pending_partitions
+        ]
+
+        for future in as_completed(futures):
+            stats = future.result()
+            checkpoint.mark_done(get_partition_key(period_start, week_count, stats["partition"], partitions))
+
+            for stat_name in ("users", "logged_recipes", "summaries"):
+                totals[stat_name] += stats[stat_name]
+            totals["partitions"] += 1
+
+            print(f"Summarized partition {stats['partition']}: {stats} "
+                  f"({stats['users'] / max(stats['seconds'], 0.001):,.0f} users/s)")
+
+    totals["seconds"] = round(time.perf_counter() - start_time, 2)
+    totals["users_per_second"] = round(totals["users"] / max(totals["seconds"], 0.001), 1)
+    totals["partitions_skipped"] = partitions - len(pending_partitions)
+
+    return totals
+
+
+def get_population_report(period_start, week_count):
+    """Return population averages over the period's weekly summaries."""
+
+    period_weeks = WeeklyNutritionSummary.week_start.between(period_start, period_start + timedelta(weeks=week_count - 1))
+
+    report_row = db.session.query(
+        func.count(),
+        func.avg(WeeklyNutritionSummary.days_logged),
+        func.avg(WeeklyNutritionSummary.protein_goal_days),
+        func.avg(WeeklyNutritionSummary.fiber_goal_days),
+        func.avg(WeeklyNutritionSummary.calcium_goal_days),
+    ).filter(period_weeks).one()
+
+    user_weeks, *averages = report_row
+
+    return {
+        "user_weeks": user_weeks,
+        **{
+            name: round(float(average), 2) if average is not None else None
+            for name, average in zip(
+                ["avg_days_logged", "avg_protein_goal_days", "avg_fiber_goal_days", "avg_calcium_goal_days"], averages
+            )
+        },
+    }
+
+
+if __name__ == "__main__":
+    from server import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-uri", default="postgresql:///steady")
+    parser.add_argument("--weeks", type=int, default=1, help="weeks to summarize, ending with the last full week")
+    parser.add_argument("--end-date", help="a day in the last week to summarize (YYYY-MM-DD, default: last week)")
+    parser.add_argument("--partitions", type=int, default=16, help="user partitions (units of restart)")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="logged recipes per cursor fetch")
+    parser.add_argument("--checkpoint", default="batch_analytics_checkpoint.json")
+    args = parser.parse_args()
+
+    end_date = datetime.strptime(args.end_date, "%Y-%m-%d").date() if args.end_date else date.today() - timedelta(weeks=1)
+    period_start = end_date - timedelta(days=end_date.weekday(), weeks=args.weeks - 1)
+
+    totals = run_batch_analytics(
+        args.db_uri,
+        period_start,
+        args.weeks,
+        partitions=args.partitions,
+        processes=args.processes,
+        checkpoint_path=args.checkpoint,
+        chunk_size=args.chunk_size
+    )
+    print(f"Batch analytics complete! :) {totals}")
+
+    connect_to_db(app, db_uri=args.db_uri, echo=False)
+    app.app_context().push()
+
+    print(f"Population report from {period_start}: {get_population_report(period_start, args.weeks)}")
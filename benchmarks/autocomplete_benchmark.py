@@ -0,0 +1,61 @@
+"""Benchmark autocomplete lookups against a synthetic catalog (no database needed).
+
+fills recipe_autocomplete's prefix index with synthetic titles (the search benchmark's vocabulary
+plus a random word, so most titles are distinct) and ingredient names, then times uncached lookups for every 2-4 letter prefix of
+the vocabulary. run from the project root:
+
+    python -m benchmarks.autocomplete_benchmark --recipes 100000
+"""
+
+import argparse
+import random
+import statistics
+import string
+import time
+
+import recipe_autocomplete
+from benchmarks.search_benchmark import TITLE_WORDS, DISH_WORDS, INGREDIENT_NAMES
+
+
+def load_synthetic_suggestions(recipe_count, seed=42):
+    """Load recipe_count synthetic titles and the ingredient names into the index."""
+
+    random_source = random.Random(seed)
+    weighted_texts = [
+        (f"{random_source.choice(TITLE_WORDS).title()} {random_source.choice(INGREDIENT_NAMES).title()} "
+         f"{random_source.choice(DISH_WORDS).title()}"
+         f" {''.join(random_source.choices(string.ascii_lowercase, k=6)).title()} Style", 1)
+        for recipe_id in range(recipe_count)
+    ] + [(name, random_source.randint(1, recipe_count)) for name in INGREDIENT_NAMES]
+
+    start_time = time.perf_counter()
+
+    with recipe_autocomplete._lock:
+        recipe_autocomplete._add_suggestions(weighted_texts)
+        recipe_autocomplete._loaded = True
+        recipe_autocomplete._last_refresh = float("inf") # never refresh from the database
+
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=100_000)
+    args = parser.parse_args()
+
+    build_seconds = load_synthetic_suggestions(args.recipes)
+    print(f"Built index of {args.recipes} titles in {build_seconds:.2f} s: {recipe_autocomplete.get_stats()}")
+
+    words = {word.lower() for text in TITLE_WORDS + DISH_WORDS + INGREDIENT_NAMES for word in text.split()}
+    prefixes = sorted({word[:length] for word in words for length in range(2, 5) if len(word) >= length})
+    timings = []
+
+    for prefix in prefixes:
+        recipe_autocomplete._cached_suggestions.clear()
+        start_time = time.perf_counter()
+        recipe_autocomplete.get_suggestions(prefix)
+        timings.append((time.perf_counter() - start_time) * 1000)
+
+    timings.sort()
+    print(f"{len(prefixes)} uncached prefixes: median {statistics.median(timings):.2f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms, max {timings[-1]:.2f} ms")
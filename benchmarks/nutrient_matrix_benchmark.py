@@ -0,0 +1,62 @@
+"""Benchmark batched nutrient totals from the per-serving nutrient matrix (no database needed).
+
+fills nutrient_matrix with synthetic recipes, then times one grouped total over a week of
+logged meals for many users at once, the shape of a nightly report. run from the project root:
+
+    python -m benchmarks.nutrient_matrix_benchmark --recipes 100000 --users 10000
+"""
+
+import argparse
+import random
+import time
+
+import nutrient_matrix
+
+
+def load_synthetic_matrix(recipe_count, nutrient_count=60, nutrients_per_recipe=30, seed=42):
+    """Load recipe_count synthetic recipes with random per-serving nutrients into the matrix."""
+
+    random_source = random.Random(seed)
+    per_serving_rows = [
+        (recipe_id, nutrient_id, random_source.uniform(0, 100))
+        for recipe_id in range(1, recipe_count + 1)
+        for nutrient_id in random_source.sample(range(1, nutrient_count + 1), nutrients_per_recipe)
+    ]
+
+    with nutrient_matrix._lock:
+        nutrient_matrix._store_rows(list(range(1, recipe_count + 1)), per_serving_rows)
+        nutrient_matrix._loaded = True
+        nutrient_matrix._last_version_check = float("inf") # no database: never check the catalog version
+
+
+def get_synthetic_week_logs(user_count, recipe_count, meals_per_day=4, seed=7):
+    """Return [((user_id, day), recipe_id, servings)] for a week of meals per user."""
+
+    random_source = random.Random(seed)
+
+    return [
+        ((user_id, day), random_source.randint(1, recipe_count), random_source.choice([0.5, 1.0, 1.5, 2.0]))
+        for user_id in range(user_count)
+        for day in range(7)
+        for _ in range(meals_per_day)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    load_synthetic_matrix(args.recipes)
+    print(f"Loaded matrix in {time.perf_counter() - start_time:.2f} s: {nutrient_matrix.get_stats()}")
+
+    week_logs = get_synthetic_week_logs(args.users, args.recipes)
+
+    start_time = time.perf_counter()
+    group_keys, totals = nutrient_matrix.get_grouped_nutrient_totals(week_logs)
+    elapsed = time.perf_counter() - start_time
+
+    print(f"Totaled {len(week_logs)} logged recipes into {len(group_keys)} user-days x {totals.shape[1]} nutrients "
+          f"in {elapsed * 1000:.0f} ms ({len(week_logs) / elapsed:,.0f} logged recipes/s)")
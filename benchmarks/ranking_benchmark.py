@@ -0,0 +1,162 @@
+"""Benchmark personalized search ranking in SQL (crud.get_recipes_by_search) on a synthetic catalog.
+
+seeds the search benchmark's synthetic catalog into its own database, gives every recipe
+ingredient tokens, a texture and a nutrition profile, and a user with likes, every nutrition
+goal and swallow difficulty, so every ranking signal is on. then times the first page and a
+later (cursor) page of each search term, optionally with the first page's EXPLAIN ANALYZE.
+run from the project root:
+
+    createdb steady_benchmark
+    python -m benchmarks.ranking_benchmark --recipes 100000 --repeats 20 --explain
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import event, func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from model import db, connect_to_db, Recipe, RecipeNutritionProfile
+from benchmarks.search_benchmark import SEARCH_TERMS, seed_catalog
+import crud
+
+
+BENCHMARK_EMAIL = "ranking-benchmark@example.com"
+
+
+def seed_ranking_signals(seed=42):
+    """Give recipes without them ingredient tokens, a texture and a random nutrition profile."""
+
+    random_source = random.Random(seed)
+
+    db.session.execute(text("""
+        UPDATE recipes SET
+            ingredient_tokens = (SELECT array_agg(lower(name)) FROM ingredients WHERE ingredients.recipe_id = recipes.recipe_id),
+            texture = (ARRAY['soft', 'regular', 'hard'])[1 + recipe_id % 3]
+        WHERE ingredient_tokens IS NULL
+    """))
+
+    unprofiled_recipe_ids = [
+        recipe_id for recipe_id, in db.session.query(Recipe.recipe_id).outerjoin(RecipeNutritionProfile).filter(
+            RecipeNutritionProfile.recipe_id.is_(None)
+        ).order_by(Recipe.recipe_id)
+    ]
+    profile_rows = [
+        {
+            "recipe_id": recipe_id,
+            "calories": random_source.uniform(50, 900),
+            "protein": random_source.uniform(0, 60),
+            "fiber": random_source.uniform(0, 15),
+            "sugar": random_source.uniform(0, 40),
+            "sodium": random_source.uniform(0, 1500),
+        }
+        for recipe_id in unprofiled_recipe_ids
+    ]
+
+    if profile_rows:
+        db.session.execute(insert(RecipeNutritionProfile.__table__), profile_rows)
+
+    db.session.execute(text("ANALYZE recipes"))
+    db.session.execute(text("ANALYZE recipe_nutrition_profiles"))
+    db.session.commit()
+
+
+def get_benchmark_user():
+    """Return the benchmark user, creating it with likes, every nutrition goal and swallow difficulty."""
+
+    user = crud.get_user_by_email(BENCHMARK_EMAIL)
+
+    if user:
+        return user
+
+    user = crud.create_user("Ranking", "Benchmark", BENCHMARK_EMAIL, "benchmark", 150, swallow_difficulty=True)
+    db.session.add(user)
+    db.session.flush()
+
+    for like in ["spinach", "salmon", "lentils", "greek yogurt", "blueberries"]:
+        db.session.add(crud.create_like_dislike(user.user_id, like, "like"))
+
+    for goal in ["High Protein", "High Fiber"]:
+        db.session.add(crud.create_nutrition_goal(user.user_id, goal))
+
+    db.session.commit()
+
+    return user
+
+
+def time_page(user_id, search_term, repeats, after=None, limit=50):
+    """Return (median ms, results) of a page of ranked results, after one warm-up run."""
+
+    results = crud.get_recipes_by_search(user_id, search_term, limit=limit, after=after)
+    timings = []
+
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        crud.get_recipes_by_search(user_id, search_term, limit=limit, after=after)
+        timings.append((time.perf_counter() - start_time) * 1000)
+
+    return statistics.median(timings), results
+
+
+def count_matches(search_term):
+    """Return how many recipes match a search term (the rows the ranking scores, before user filters)."""
+
+    return db.session.query(func.count(Recipe.recipe_id)).filter(
+        Recipe.search_vector.op("@@")(crud.get_search_tsquery(search_term))
+    ).scalar()
+
+
+def explain_first_page(user_id, search_term):
+    """Return the plan root, planning and execution time lines of EXPLAIN ANALYZE for a first page."""
+
+    captured_statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "ts_rank_cd" in statement:
+            captured_statements.append(cursor.mogrify(statement, parameters).decode())
+
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        crud.get_recipes_by_search(user_id, search_term, limit=50)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+
+    plan_rows = db.session.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {captured_statements[-1]}")).scalars().all()
+
+    return [plan_rows[0]] + plan_rows[-2:]
+
+
+if __name__ == "__main__":
+    from server import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-uri", default="postgresql:///steady_benchmark", help="database to seed (not the app database)")
+    parser.add_argument("--recipes", type=int, default=100_000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--terms", nargs="*", default=SEARCH_TERMS)
+    parser.add_argument("--explain", action="store_true", help="print EXPLAIN ANALYZE of each first page")
+    args = parser.parse_args()
+
+    connect_to_db(app, db_uri=args.db_uri, echo=False)
+    app.app_context().push()
+    db.create_all()
+
+    seed_catalog(args.recipes)
+    seed_ranking_signals()
+    user_id = get_benchmark_user().user_id
+
+    print(f"{'term':<16}{'matches':>10}{'page 1 ms':>12}{'page 5 ms':>12}")
+    for search_term in args.terms:
+        first_ms, _ = time_page(user_id, search_term, args.repeats)
+        after = None
+        for _ in range(4): # follow the cursor to page 5
+            page = crud.get_recipes_by_search(user_id, search_term, limit=50, after=after)
+            after = (page[-1].score, page[-1].recipe_id) if page else after
+        later_ms, _ = time_page(user_id, search_term, args.repeats, after=after)
+        print(f"{search_term:<16}{count_matches(search_term):>10}{first_ms:>12.1f}{later_ms:>12.1f}")
+
+        if args.explain:
+            for plan_line in explain_first_page(user_id, search_term):
+                print(f"    {plan_line}")
@@ -0,0 +1,140 @@
+"""Benchmark recipe search: the old ILIKE '%term%' join against the full-text search index.
+
+seeds a synthetic catalog (titles and ingredient names from a small vocabulary) into its own
+database, then times both queries for a set of search terms. run from the project root:
+
+    createdb steady_benchmark
+    python -m benchmarks.search_benchmark --recipes 100000 --repeats 20
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from model import db, connect_to_db, Recipe, Ingredient
+import crud
+
+
+TITLE_WORDS = [
+    "creamy", "roasted", "spicy", "slow cooker", "baked", "grilled", "easy", "healthy", "one pot",
+    "lemon", "garlic", "honey", "smoky", "crispy", "fresh", "summer", "winter", "classic",
+]
+DISH_WORDS = [
+    "soup", "stew", "salad", "pasta", "curry", "casserole", "risotto", "smoothie", "oatmeal",
+    "pie", "tacos", "chili", "bowl", "frittata", "muffins", "porridge", "puree", "mash",
+]
+INGREDIENT_NAMES = [
+    "chicken breast", "chickpeas", "salmon", "tofu", "lentils", "black beans", "ground turkey",
+    "spinach", "kale", "carrots", "sweet potato", "butternut squash", "broccoli", "cauliflower",
+    "zucchini", "mushrooms", "tomatoes", "onion", "garlic", "ginger", "celery", "bell pepper",
+    "olive oil", "butter", "heavy cream", "milk", "greek yogurt", "cheddar cheese", "parmesan",
+    "eggs", "rice", "quinoa", "oats", "pasta", "flour", "bread crumbs", "peanut butter", "almonds",
+    "walnuts", "banana", "blueberries", "apple", "lemon juice", "honey", "maple syrup", "cinnamon",
+    "cumin", "paprika", "thyme", "basil", "cilantro", "vegetable broth", "chicken broth", "coconut milk",
+]
+SEARCH_TERMS = ["chicken", "chick", "sweet potato", "soup", "creamy pasta", "blueberries", "tofu curry"]
+
+
+def seed_catalog(recipe_count, batch_size=5000, seed=42):
+    """Bulk insert synthetic recipes and ingredients until the catalog has recipe_count recipes."""
+
+    existing_count = db.session.query(func.count(Recipe.recipe_id)).scalar()
+    random_source = random.Random(seed)
+    date_added = datetime.now()
+
+    for batch_start in range(existing_count, recipe_count, batch_size):
+        recipe_rows = []
+        for spoonacular_id in range(batch_start, min(batch_start + batch_size, recipe_count)):
+            main_ingredient = random_source.choice(INGREDIENT_NAMES)
+            recipe_rows.append({
+                "spoonacular_id": spoonacular_id,
+                "title": f"{random_source.choice(TITLE_WORDS).title()} {main_ingredient.title()} {random_source.choice(DISH_WORDS).title()}",
+                "source": "benchmark",
+                "url": "N/A",
+                "servings": 4,
+                "instructions": "No instructions provided",
+                "diets": [],
+                "date_added": date_added,
+            })
+
+        recipe_ids = db.session.execute(
+            insert(Recipe.__table__).returning(Recipe.__table__.c.recipe_id), recipe_rows
+        ).scalars().all()
+
+        ingredient_rows = [
+            {"recipe_id": recipe_id, "name": name, "quantity": 1.0, "unit": "cup"}
+            for recipe_id in recipe_ids
+            for name in random_source.sample(INGREDIENT_NAMES, random_source.randint(5, 12))
+        ]
+        db.session.execute(insert(Ingredient.__table__), ingredient_rows)
+
+        crud.refresh_recipe_search_vectors(recipe_ids)
+        db.session.commit()
+
+        print(f"Seeded {batch_start + len(recipe_ids)} / {recipe_count} recipes")
+
+    db.session.execute(text("ANALYZE recipes"))
+    db.session.execute(text("ANALYZE ingredients"))
+    db.session.commit()
+
+
+def search_with_ilike(search_term, limit=50):
+    """The search query before the full-text index: leading-wildcard ILIKE over a recipes x ingredients join."""
+
+    return db.session.query(Recipe).outerjoin(Ingredient, Recipe.recipe_id == Ingredient.recipe_id).filter(
+        ((Recipe.title.ilike(f"%{search_term}%")) | (Ingredient.name.ilike(f"%{search_term}%")))
+    ).distinct().order_by(Recipe.title).limit(limit).all()
+
+
+def search_with_index(search_term, limit=50):
+    """The current search query: the search_vector GIN index, ranked by relevance."""
+
+    search_query = crud.get_search_tsquery(search_term)
+
+    return db.session.query(Recipe).filter(Recipe.search_vector.op("@@")(search_query)).order_by(
+        func.ts_rank_cd(Recipe.search_vector, search_query).desc(),
+        Recipe.recipe_id
+    ).limit(limit).all()
+
+
+def time_search(search_function, search_term, repeats):
+    """Return (median ms, result count) of repeated searches, after one warm-up run."""
+
+    result_count = len(search_function(search_term))
+    timings = []
+
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        search_function(search_term)
+        timings.append((time.perf_counter() - start_time) * 1000)
+        db.session.expunge_all()
+
+    return statistics.median(timings), result_count
+
+
+if __name__ == "__main__":
+    from server import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-uri", default="postgresql:///steady_benchmark", help="database to seed (not the app database)")
+    parser.add_argument("--recipes", type=int, default=100_000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--terms", nargs="*", default=SEARCH_TERMS)
+    args = parser.parse_args()
+
+    connect_to_db(app, db_uri=args.db_uri, echo=False)
+    app.app_context().push()
+    db.create_all()
+
+    seed_catalog(args.recipes)
+
+    print(f"{'term':<16}{'ilike ms':>12}{'index ms':>12}{'speedup':>10}{'ilike n':>10}{'index n':>10}")
+    for search_term in args.terms:
+        ilike_ms, ilike_count = time_search(search_with_ilike, search_term, args.repeats)
+        index_ms, index_count = time_search(search_with_index, search_term, args.repeats)
+        print(f"{search_term:<16}{ilike_ms:>12.1f}{index_ms:>12.1f}{ilike_ms / index_ms:>9.1f}x{ilike_count:>10}{index_count:>10}")
@@ -0,0 +1,49 @@
+"""Checkpoint files for resumable batch jobs: the set of finished work keys, saved as JSON."""
+
+import json
+import os
+import threading
+
+
+class Checkpoint:
+    """A set of finished work keys, saved to a JSON file after every update,
+    so an interrupted job resumes where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+
+        if os.path.exists(path):
+            with open(path) as checkpoint_file:
+                self._done = set(json.load(checkpoint_file).get("done", []))
+
+    def is_done(self, key):
+        """Return True if key was already finished."""
+
+        with self._lock:
+            return key in self._done
+
+    def mark_done(self, key):
+        """Record key as finished and save the checkpoint file."""
+
+        with self._lock:
+            self._done.add(key)
+            self._save()
+
+    def count(self):
+        """Return how many keys are finished."""
+
+        with self._lock:
+            return len(self._done)
+
+    def _save(self):
+        """Write the checkpoint atomically, so a crash mid-write never corrupts it. Caller holds _lock."""
+
+        temp_path = f"{self.path}.tmp"
+
+        with open(temp_path, "w") as checkpoint_file:
+            json.dump({"done": sorted(self._done)}, checkpoint_file)
+
+        os.replace(temp_path, self.path)
@@ -1,9 +1,14 @@
 """CRUD operations"""
 
-from model import db, User, DietaryRestriction, Medication, Allergy, NutritionGoal, LikeDislike, Reminder, Recipe, Ingredient, Nutrient, RecipeNutrient, MealLog, MealLogRecipe, MealPlan, MealPlanRecipe, connect_to_db
-from sqlalchemy import or_, and_
-from datetime import datetime
+from model import db, User, DietaryRestriction, Medication, Allergy, NutritionGoal, LikeDislike, Reminder, Recipe, Ingredient, Nutrient, RecipeNutrient, MealLog, MealLogRecipe, MealPlan, MealPlanRecipe, RecipeSearch, SearchWord, RecipeNutritionProfile, DailyNutrientTotal, CatalogVersion, connect_to_db
+from sqlalchemy import or_, and_, func, select, update, delete, union, cast, case, literal, text, Integer
+from sqlalchemy.dialects.postgresql import insert
+import re
+from datetime import datetime, timedelta
 from passlib.hash import argon2
+import nutrient_cache
+import recipe_ranking
+import recipe_vocabulary
 
 
 # ------- User CRUD functions -------
@@ -96,7 +101,7 @@ def delete_user(user_id):
 def create_diet_restriction(user_id, restriction):
     """Create and return a new dietary restriction for a user."""
 
-    diet_restriction = DietaryRestriction(user_id=user_id, restriction=restriction.lower())
+    diet_restriction = DietaryRestriction(user_id=user_id, restriction=recipe_vocabulary.normalize_diet(restriction))
 
     return diet_restriction
 
@@ -275,6 +280,48 @@ def update_reminder(reminder_id, reminder_type=None, reminder_time=None, frequen
 
 # ------- Recipe CRUD functions -------
 
+SEARCH_CONFIG = "english" # text search configuration for recipe search vectors and queries
+SEARCH_WORD_SEPARATOR = "[^a-z]+" # search words are runs of letters in lowercased titles and ingredient names
+MIN_SEARCH_WORD_LENGTH = 3
+FUZZY_SIMILARITY_THRESHOLD = 0.4 # trigram similarity a misspelled word needs to be corrected (0-1)
+SEARCH_CANDIDATE_POOL_SIZE = 1000 # most matching recipes a search scores (the newest, see get_recipes_by_search)
+
+# nutrition goal -> (nutrition profile column, "max" or "min", per-serving limit)
+NUTRITION_GOALS = {
+    "low sugar": ("sugar", "max", 10), # g
+    "high protein": ("protein", "min", 20), # g
+    "high fiber": ("fiber", "min", 5), # g
+    "low sodium": ("sodium", "max", 300), # mg
+}
+
+# list fields of a recipe search result; instructions are only sent with a single recipe
+RECIPE_SUMMARY_COLUMNS = (
+    Recipe.recipe_id,
+    Recipe.title,
+    Recipe.source,
+    Recipe.url,
+    Recipe.servings,
+    RecipeNutritionProfile.calories,
+    RecipeNutritionProfile.protein,
+    RecipeNutritionProfile.fiber,
+    RecipeNutritionProfile.sugar,
+    RecipeNutritionProfile.sodium,
+    Recipe.texture,
+)
+
+# nutrition profile column -> Spoonacular nutrient name
+NUTRITION_PROFILE_NUTRIENTS = {
+    "calories": "Calories",
+    "protein": "Protein",
+    "fat": "Fat",
+    "carbohydrates": "Carbohydrates",
+    "sugar": "Sugar",
+    "fiber": "Fiber",
+    "sodium": "Sodium",
+    "calcium": "Calcium",
+    "iron": "Iron",
+}
+
 # caching from recipes Spoonacular API
 def create_recipe(spoonacular_id, title, source, url, servings, instructions, texture, diets):
     """Create and return a new recipe."""
@@ -287,7 +334,7 @@ def create_recipe(spoonacular_id, title, source, url, servings, instructions, te
         servings=servings,
         instructions=instructions,
         texture=texture,
-        diets=diets,
+        diets=recipe_vocabulary.get_recipe_diets(diets),
         date_added=datetime.now()
     )
 
@@ -306,8 +353,50 @@ def get_recipe_by_spoonacular_id(spoonacular_id):
     return db.session.query(Recipe).filter(Recipe.spoonacular_id==spoonacular_id).first()
 
 
-def get_recipes_by_search(user_id, search_term, likes=None, limit=50):
-    """Filters recipes based on search term and user's personal info/settings."""
+def get_recipes_by_ids(recipe_ids):
+    """Return recipes by primary key, in the order of recipe_ids."""
+
+    if not recipe_ids:
+        return []
+
+    recipes_by_id = {
+        recipe.recipe_id: recipe for recipe in db.session.query(Recipe).filter(Recipe.recipe_id.in_(recipe_ids))
+    }
+
+    return [recipes_by_id[recipe_id] for recipe_id in recipe_ids if recipe_id in recipes_by_id]
+
+
+def get_recipe_summaries_query(*extra_columns):
+    """Return a query for recipe summaries: the list fields of a recipe plus its headline
+    per-serving nutrients (None if it has no nutrition profile), without instructions.
+    """
+
+    return db.session.query(*RECIPE_SUMMARY_COLUMNS, *extra_columns).outerjoin(
+        RecipeNutritionProfile, RecipeNutritionProfile.recipe_id == Recipe.recipe_id)
+
+
+def get_recipe_summaries_by_ids(recipe_ids):
+    """Return recipe summaries by primary key, in the order of recipe_ids."""
+
+    if not recipe_ids:
+        return []
+
+    summaries_by_id = {
+        summary.recipe_id: summary for summary in get_recipe_summaries_query().filter(Recipe.recipe_id.in_(recipe_ids))
+    }
+
+    return [summaries_by_id[recipe_id] for recipe_id in recipe_ids if recipe_id in summaries_by_id]
+
+
+def get_recipes_by_search(user_id, search_term, likes=None, limit=50, after=None):
+    """Filters recipes based on search term and user's personal info/settings.
+    returns recipe summaries (see get_recipe_summaries_query) with their text search rank, how
+    many of the user's liked ingredients they have (liked_ingredients) and their personalized
+    score (see recipe_ranking), best scores first. only the newest SEARCH_CANDIDATE_POOL_SIZE
+    eligible matches are scored.
+
+    after is the (score, recipe_id) of the last result of the previous page, for keyset paging.
+    """
 
     # get user
     user = db.session.query(User).get(user_id)
@@ -323,93 +412,227 @@ def get_recipes_by_search(user_id, search_term, likes=None, limit=50):
     user_likes = {like.name for like in user.likes_dislikes if like.preference == "like"} # user likes -- for extra filtering
     user_dislikes = {dislike.name for dislike in user.likes_dislikes if dislike.preference == "dislike"} # user dislikes 
 
-    # initial query --> where search term is included in a recipe's title OR ingredients
-    initial_query = db.session.query(Recipe).outerjoin(Ingredient, Recipe.recipe_id == Ingredient.recipe_id).filter(
-        ((Recipe.title.ilike(f"%{search_term}%")) | (Ingredient.name.ilike(f"%{search_term}%")))
-    ).distinct()
+    # initial query --> search term matches a recipe's title or ingredients (full-text index), best matches first
+    search_query = get_search_tsquery(search_term)
 
-    current_filtered_recipes = initial_query
+    if search_query is None:
+        return []
 
-    # exclude user allergens
-    for allergen in user_allergens:
-        current_filtered_recipes = current_filtered_recipes.filter(~Recipe.ingredients.any(Ingredient.name.ilike(f"%{allergen}%")))
-    
-    # exclude user dislikes 
-    # for dislike in user_dislikes:
-    #     current_filtered_recipes = current_filtered_recipes.filter(~Recipe.ingredients.any(Ingredient.name.ilike(f"{dislike}")))
-
-    # # include likes if True
-    # if likes and user_likes:
-    #         # list comprehension to hold all individual likes for OR condition
-    #         user_like_conditions = [
-    #             Recipe.ingredients.any(Ingredient.name.ilike(f"%{liked_ingredient}%")) 
-    #             for liked_ingredient in user_likes                   
-    #         ]
-
-    #         current_filtered_recipes = current_filtered_recipes.filter(
-    #             or_(*user_like_conditions)
-    #         )
-
-    # #nutritional goal filters
-    # for goal in user_nutrition_goals:
-    #     if goal == "low sugar":
-    #         # exclude recipes where sugar quantity > 10g per serving
-    #         current_filtered_recipes = current_filtered_recipes.filter(
-    #             ~Recipe.recipe_nutrients.any(
-    #                 and_(
-    #                     RecipeNutrient.nutrient_id == Nutrient.nutrient_id,
-    #                     Nutrient.name.ilike("%sugar%"),
-    #                     RecipeNutrient.quantity > 10
-    #                 )
-    #             )
-    #         )
-
-    #     elif goal == "high protein":
-    #         # include recipes where protein quantity >= 20g per serving 
-    #         current_filtered_recipes = current_filtered_recipes.filter(
-    #             Recipe.recipe_nutrients.any(
-    #                 and_(
-    #                     RecipeNutrient.nutrient_id == Nutrient.nutrient_id,
-    #                     Nutrient.name.ilike("%protein%"),
-    #                     RecipeNutrient.quantity >= 20
-    #                 )
-    #             )
-    #         )
-        
-    #     elif goal == "high fiber":
-    #         # include recipes where fiber quantity>=< 5g per serving 
-    #         current_filtered_recipes = current_filtered_recipes.filter(
-    #             Recipe.recipe_nutrients.any(
-    #                 and_(
-    #                     RecipeNutrient.nutrient_id == Nutrient.nutrient_id,
-    #                     Nutrient.name.ilike("%fiber%"),
-    #                     RecipeNutrient.quantity >= 5 
-    #                 )
-    #             )
-    #         )
-        
-    #     elif goal == "low sodium":
-    #         # exclude recipes where sodium quantity > 300mg
-    #         current_filtered_recipes = current_filtered_recipes.filter(
-    #             ~Recipe.recipe_nutrients.any(
-    #                 and_(
-    #                     RecipeNutrient.nutrient_id == Nutrient.nutrient_id,
-    #                     Nutrient.name.ilike("%sodium%"),
-    #                     RecipeNutrient.quantity <= 300
-    #                 )
-    #             )
-    #         )
+    # include likes if True, any liked ingredient (one indexed overlap check)
+    like_tokens = sorted({recipe_vocabulary.normalize_phrase(like) for like in user_likes} - {""})
+
+    current_filtered_recipes = db.session.query(Recipe.recipe_id).outerjoin(
+        RecipeNutritionProfile, RecipeNutritionProfile.recipe_id == Recipe.recipe_id
+    ).filter(Recipe.search_vector.op("@@")(search_query))
+
+    # exclude user allergens and dislikes, classified at ingest (see recipe_vocabulary)
+    # recipes not classified yet have a NULL mask/tokens and are left out while the user has any
+    excluded_allergen_mask, excluded_tokens = recipe_vocabulary.get_exclusion_filters(user_allergens, user_dislikes)
+
+    if excluded_allergen_mask:
+        current_filtered_recipes = current_filtered_recipes.filter(Recipe.allergen_mask.op("&")(excluded_allergen_mask) == 0)
+
+    if excluded_tokens:
+        current_filtered_recipes = current_filtered_recipes.filter(~Recipe.ingredient_tokens.overlap(excluded_tokens))
+
+    if likes and like_tokens:
+        current_filtered_recipes = current_filtered_recipes.filter(Recipe.ingredient_tokens.overlap(like_tokens))
+
+    # nutritional goal filters, per-serving range predicates on the nutrition profile (indexed)
+    goal_filters = [get_nutrition_goal_filter(goal) for goal in user_nutrition_goals if goal.lower() in NUTRITION_GOALS]
+
+    if goal_filters: # recipes without a nutrition profile fail them, the same as an inner join
+        current_filtered_recipes = current_filtered_recipes.filter(*goal_filters)
     
-    # diet restirction filters
-    # for restriction in user_diet_restrictions:
+    # diet restriction filters, every restriction in one indexed containment check (diets @> [...])
+    required_diets = sorted({recipe_vocabulary.normalize_diet(restriction) for restriction in user_diet_restrictions})
+
+    if required_diets:
+        current_filtered_recipes = current_filtered_recipes.filter(Recipe.diets.contains(required_diets))
+
+    # score only a bounded pool of the newest eligible matches: ranking every match of a common
+    # word (tens of thousands at 100k recipes) reads every search vector, while the newest matches
+    # come straight off the primary key (see benchmarks/ranking_benchmark.py)
+    candidate_recipe_ids = current_filtered_recipes.order_by(
+        Recipe.recipe_id.desc()
+    ).limit(SEARCH_CANDIDATE_POOL_SIZE).subquery()
+
+    search_rank = recipe_ranking.get_text_rank(search_query)
+    liked_ingredients = get_liked_ingredient_count(user_likes)
+    search_score = recipe_ranking.get_score_expression(
+        search_rank,
+        liked_ingredients,
+        like_count=len(like_tokens),
+        nutrition_goals=[NUTRITION_GOALS[goal.lower()] for goal in sorted(user_nutrition_goals) if goal.lower() in NUTRITION_GOALS],
+        swallow_difficulty=bool(user.swallow_difficulty)
+    )
+
+    ranked_recipes = get_recipe_summaries_query(
+        search_rank.label("rank"),
+        liked_ingredients.label("liked_ingredients"),
+        search_score.label("score")
+    ).filter(Recipe.recipe_id.in_(select(candidate_recipe_ids.c.recipe_id)))
+
+    # keyset paging: continue after the previous page's last (score, recipe_id)
+    if after:
+        after_score, after_recipe_id = after
+        ranked_recipes = ranked_recipes.filter(or_(
+            search_score < after_score,
+            and_(search_score == after_score, Recipe.recipe_id > after_recipe_id)
+        ))
+
+    ranked_recipes = ranked_recipes.order_by(search_score.desc(), Recipe.recipe_id)
+
+    return ranked_recipes.limit(limit).all()
+
+
+def get_nutrition_goal_filter(goal):
+    """Return the per-serving nutrition profile filter for a nutrition goal (see NUTRITION_GOALS)."""
+
+    column_name, bound, limit = NUTRITION_GOALS[goal.lower()]
+    column = getattr(RecipeNutritionProfile, column_name)
+
+    return column <= limit if bound == "max" else column >= limit
+
+
+def get_liked_ingredient_count(user_likes):
+    """Return a SQL expression counting how many of a user's liked ingredients a recipe has."""
+
+    like_tokens = sorted({recipe_vocabulary.normalize_phrase(like) for like in user_likes} - {""})
+
+    if not like_tokens:
+        return literal(0)
+
+    return sum(cast(Recipe.ingredient_tokens.contains([like_token]), Integer) for like_token in like_tokens)
+
+
+def get_search_tsquery(search_term):
+    """Return a prefix tsquery matching every word of a search term ("chick pea" -> chick:* & pea:*),
+    or None if the term has no words.
+    """
 
-    #     current_filtered_recipes = current_filtered_recipes.filter(
-    #         Recipe.diets.contains([restriction])
-    #     )
+    words = re.findall(r"\w+", search_term.lower())
 
-    current_filtered_recipes = current_filtered_recipes.order_by(Recipe.title)
+    if not words:
+        return None
 
-    return current_filtered_recipes.limit(limit).all()
+    return func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{word}:*" for word in words))
+
+
+def refresh_recipe_search_vectors(recipe_ids=None):
+    """Recompute search_vector for recipe_ids (every recipe if None), in the caller's transaction.
+
+    call it after a recipe's title or ingredients change; bulk ingest does it for every recipe it writes.
+    """
+
+    if recipe_ids is not None and not recipe_ids:
+        return
+
+    ingredient_names = select(func.string_agg(Ingredient.name, " ")).where(
+        Ingredient.recipe_id == Recipe.recipe_id).scalar_subquery()
+
+    refresh_statement = update(Recipe).values(
+        search_vector=func.setweight(func.to_tsvector(SEARCH_CONFIG, Recipe.title), "A").op("||")(
+            func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(ingredient_names, "")), "B"))
+    )
+
+    if recipe_ids is not None:
+        refresh_statement = refresh_statement.where(Recipe.recipe_id.in_(recipe_ids))
+
+    db.session.execute(refresh_statement)
+
+
+def refresh_recipe_nutrition_profiles(recipe_ids=None):
+    """Recompute the per-serving nutrition profiles of recipe_ids (every recipe if None) from their
+    recipe nutrients, in the caller's transaction.
+    """
+
+    if recipe_ids is not None and not recipe_ids:
+        return
+
+    # one row per recipe: each tracked nutrient's total quantity divided by the recipe's servings
+    profile_columns = {
+        column: func.max(RecipeNutrient.quantity).filter(Nutrient.name == nutrient_name) / func.nullif(Recipe.servings, 0)
+        for column, nutrient_name in NUTRITION_PROFILE_NUTRIENTS.items()
+    }
+
+    profile_rows = select(Recipe.recipe_id, *profile_columns.values()).outerjoin(
+        RecipeNutrient, RecipeNutrient.recipe_id == Recipe.recipe_id
+    ).outerjoin(
+        Nutrient, Nutrient.nutrient_id == RecipeNutrient.nutrient_id
+    ).group_by(Recipe.recipe_id, Recipe.servings)
+
+    if recipe_ids is not None:
+        profile_rows = profile_rows.where(Recipe.recipe_id.in_(recipe_ids))
+
+    upsert = insert(RecipeNutritionProfile).from_select(["recipe_id", *profile_columns], profile_rows)
+
+    db.session.execute(upsert.on_conflict_do_update(
+        index_elements=["recipe_id"],
+        set_={column: upsert.excluded[column] for column in profile_columns}
+    ))
+
+
+def refresh_search_words(recipe_ids=None):
+    """Add the words of recipe_ids' titles and ingredient names (every recipe if None) to search_words,
+    in the caller's transaction.
+    """
+
+    if recipe_ids is not None and not recipe_ids:
+        return
+
+    title_words = select(func.regexp_split_to_table(func.lower(Recipe.title), SEARCH_WORD_SEPARATOR).label("word"))
+    ingredient_words = select(func.regexp_split_to_table(func.lower(Ingredient.name), SEARCH_WORD_SEPARATOR).label("word"))
+
+    if recipe_ids is not None:
+        title_words = title_words.where(Recipe.recipe_id.in_(recipe_ids))
+        ingredient_words = ingredient_words.where(Ingredient.recipe_id.in_(recipe_ids))
+
+    words = union(title_words, ingredient_words).subquery()
+
+    # inserted in word order, so concurrent ingests lock shared words in the same order (no deadlocks)
+    db.session.execute(
+        insert(SearchWord).from_select(
+            ["word"],
+            select(words.c.word).where(func.length(words.c.word) >= MIN_SEARCH_WORD_LENGTH).order_by(words.c.word)
+        ).on_conflict_do_nothing()
+    )
+
+
+def get_closest_search_word(word, threshold=FUZZY_SIMILARITY_THRESHOLD):
+    """Return the search word most similar to word (trigram similarity >= threshold), or None."""
+
+    similarity = func.similarity(SearchWord.word, word)
+
+    # % uses the trigram index (pg_trgm's own threshold, 0.3 by default), then threshold narrows it
+    closest_word = db.session.query(SearchWord.word).filter(
+        SearchWord.word.op("%")(word),
+        similarity >= threshold
+    ).order_by(similarity.desc(), SearchWord.word).first()
+
+    return closest_word.word if closest_word else None
+
+
+def suggest_search_term(search_term, threshold=FUZZY_SIMILARITY_THRESHOLD):
+    """Return a "did you mean" search term, with each unknown word replaced by the closest known one
+    ("chiken brocoli" -> "chicken broccoli"), or None if there is nothing to correct.
+    """
+
+    words = re.findall(r"\w+", search_term.lower())
+    known_words = {
+        word for (word,) in db.session.query(SearchWord.word).filter(SearchWord.word.in_(words))
+    }
+
+    suggested_words = [
+        word if word in known_words or len(word) < MIN_SEARCH_WORD_LENGTH
+        else get_closest_search_word(word, threshold) or word
+        for word in words
+    ]
+
+    if suggested_words == words:
+        return None
+
+    return " ".join(suggested_words)
 
 
 # ------- Ingredient CRUD functions -------
@@ -450,16 +673,19 @@ def get_nutrient_by_name(name):
 
 
 def get_or_create_nutrient(name, unit):
-    """Get or create nutreint, then return nutrient."""
+    """Get or create nutrient, then return nutrient."""
 
-    nutrient = get_nutrient_by_name(name)
+    nutrient_id = nutrient_cache.get_nutrient_ids([(name, unit)])[name]
 
-    if not nutrient:
-        nutrient = create_nutrient(name, unit)
-        db.session.add(nutrient)
-        db.session.commit()
-    
-    return nutrient
+    return db.session.get(Nutrient, nutrient_id)
+
+
+def get_or_create_nutrient_ids(name_unit_pairs):
+    """Get or create nutrients in bulk, then return a dictionary of nutrient name -> nutrient_id.
+    answered from the per-worker nutrient cache, so known nutrients cost no query.
+    """
+
+    return nutrient_cache.get_nutrient_ids(name_unit_pairs)
 
 
 # ------- RecipeNutrient CRUD functions -------
@@ -479,7 +705,91 @@ def create_recipe_nutrient(recipe_id, nutrient_id, quantity):
 def get_nutrients_by_recipe_id(recipe_id):
     """Return all nutrients and their quantities."""
 
-    return db.session.query(RecipeNutrient).filter(Recipe.recipe_id==recipe_id).all()
+    return db.session.query(RecipeNutrient).filter(RecipeNutrient.recipe_id==recipe_id).all()
+
+
+# ------- RecipeSearch CRUD functions -------
+
+RECIPE_SEARCH_TTL = timedelta(days=7) # how long Spoonacular results for a search stay fresh
+NEGATIVE_RECIPE_SEARCH_TTL = timedelta(hours=12) # how long a search with no results stays fresh
+
+
+def normalize_search_key(search_term, user_allergens=None, user_diet_restrictions=None, user_likes=None, user_dislikes=None):
+    """Return a key for a search term and its filters.
+    case, extra whitespace and filter order don't change the key.
+    """
+
+    def normalize_values(values):
+        return ",".join(sorted({value.strip().lower() for value in values or [] if value and value.strip()}))
+
+    normalized_term = " ".join(search_term.lower().split())
+
+    return "|".join([
+        normalized_term,
+        f"allergens={normalize_values(user_allergens)}",
+        f"diets={normalize_values(user_diet_restrictions)}",
+        f"likes={normalize_values(user_likes)}",
+        f"dislikes={normalize_values(user_dislikes)}",
+    ])
+
+
+def get_recipe_search_by_key(search_key):
+    """Return a recipe search by its normalized key."""
+
+    return db.session.query(RecipeSearch).get(search_key)
+
+
+def update_recipe_search(search_key, search_term, recipe_ids):
+    """Create or update and return a recipe search with its result recipe_ids, marking it as just fetched."""
+
+    recipe_search = get_recipe_search_by_key(search_key)
+
+    if not recipe_search:
+        recipe_search = RecipeSearch(search_key=search_key)
+
+    recipe_search.search_term = search_term
+    recipe_search.result_count = len(recipe_ids)
+    recipe_search.recipe_ids = list(recipe_ids)
+    recipe_search.last_fetched = datetime.now()
+
+    return recipe_search
+
+
+def is_recipe_search_fresh(recipe_search):
+    """Return True if a recipe search was fetched from Spoonacular recently enough to reuse.
+    searches with results stay fresh for RECIPE_SEARCH_TTL, empty ones for NEGATIVE_RECIPE_SEARCH_TTL.
+    """
+
+    if not recipe_search:
+        return False
+
+    if recipe_search.result_count:
+        ttl = RECIPE_SEARCH_TTL
+    else:
+        ttl = NEGATIVE_RECIPE_SEARCH_TTL
+
+    return datetime.now() - recipe_search.last_fetched < ttl
+
+
+CATALOG_VERSION_NAME = "recipes"
+
+
+def get_catalog_version():
+    """Return the recipe catalog's version (0 before the first re-derive)."""
+
+    return db.session.query(CatalogVersion.version).filter(CatalogVersion.name == CATALOG_VERSION_NAME).scalar() or 0
+
+
+def bump_catalog_version():
+    """Increment the recipe catalog's version, after recipes were changed in place. Not committed."""
+
+    versions_table = CatalogVersion.__table__
+    upsert_statement = insert(versions_table).values(name=CATALOG_VERSION_NAME, version=1, updated_at=datetime.now())
+
+    db.session.execute(upsert_statement.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"version": versions_table.c.version + 1, "updated_at": upsert_statement.excluded.updated_at}
+    ))
 
 
 # ------- MealLog CRUD functions -------
@@ -500,7 +810,7 @@ def create_meal_log(user_id, log_date, meal_type):
 def get_meal_log_by_user_id_and_date(user_id, log_date):
     """Return all meal logs for a user on a specific date."""
 
-    return db.session.query(MealLog).filter(User.user_id==user_id, MealLog.log_date==log_date).all()
+    return db.session.query(MealLog).filter(MealLog.user_id==user_id, MealLog.log_date==log_date).all()
 
 
 def get_meal_log_by_id(meal_log_id):
@@ -509,6 +819,180 @@ def get_meal_log_by_id(meal_log_id):
     return db.session.query(MealLog).get(meal_log_id)
 
 
+def get_nutrient_intake_query(*group_columns):
+    """Return a query of (*group_columns, nutrient_id, quantity eaten) over meal logs and their
+    recipes' nutrients, to be filtered and grouped by group_columns + nutrient_id.
+
+    each logged recipe contributes (recipe quantity / recipe servings) * servings eaten; a recipe
+    without servings contributes 0.
+    """
+
+    quantity_eaten = RecipeNutrient.quantity / Recipe.servings * MealLogRecipe.serving_size
+
+    return db.session.query(
+        *group_columns,
+        RecipeNutrient.nutrient_id,
+        func.coalesce(func.sum(quantity_eaten).filter(Recipe.servings > 0), 0.0).label("quantity")
+    ).select_from(MealLog).join(
+        MealLogRecipe, MealLogRecipe.meal_log_id == MealLog.meal_log_id
+    ).join(
+        Recipe, Recipe.recipe_id == MealLogRecipe.recipe_id
+    ).join(
+        RecipeNutrient, RecipeNutrient.recipe_id == Recipe.recipe_id
+    )
+
+
+def get_daily_nutrient_totals(user_id, log_date):
+    """Return [(nutrient_id, quantity eaten)] for everything a user logged on a date, from the daily rollup."""
+
+    return db.session.query(DailyNutrientTotal.nutrient_id, DailyNutrientTotal.quantity).filter(
+        DailyNutrientTotal.user_id == user_id,
+        DailyNutrientTotal.log_date == log_date
+    ).all()
+
+
+def get_nutrient_totals_by_day(user_id, start_date, end_date):
+    """Return [(log_date, nutrient_id, quantity eaten)] for every day a user logged meals between
+    start_date and end_date (inclusive), from the daily rollup.
+    """
+
+    return db.session.query(
+        DailyNutrientTotal.log_date, DailyNutrientTotal.nutrient_id, DailyNutrientTotal.quantity
+    ).filter(
+        DailyNutrientTotal.user_id == user_id,
+        DailyNutrientTotal.log_date.between(start_date, end_date)
+    ).order_by(DailyNutrientTotal.log_date).all()
+
+
+# ------- DailyNutrientTotal CRUD functions -------
+
+DAILY_NUTRIENT_TOTAL_TOLERANCE = 1e-6 # rollup and logs differing by less than this aren't drift (float sums)
+
+
+def apply_daily_nutrient_delta(user_id, log_date, recipe_id, serving_size_change):
+    """Add a change in servings eaten of a recipe (negative for less) to a user's daily nutrient
+    totals, in one upsert. Not committed: call it in the same transaction as the meal log change.
+    """
+
+    daily_totals_table = DailyNutrientTotal.__table__
+
+    quantity_change = case(
+        (Recipe.servings > 0, RecipeNutrient.quantity / Recipe.servings * serving_size_change),
+        else_=0.0
+    )
+    nutrient_changes = select(
+        literal(user_id), literal(log_date), RecipeNutrient.nutrient_id, quantity_change
+    ).join_from(RecipeNutrient, Recipe, Recipe.recipe_id == RecipeNutrient.recipe_id).where(
+        RecipeNutrient.recipe_id == recipe_id
+    )
+
+    upsert_statement = insert(daily_totals_table).from_select(
+        ["user_id", "log_date", "nutrient_id", "quantity"], nutrient_changes
+    )
+    upsert_statement = upsert_statement.on_conflict_do_update(
+        index_elements=["user_id", "log_date", "nutrient_id"],
+        set_={"quantity": daily_totals_table.c.quantity + upsert_statement.excluded.quantity}
+    )
+
+    db.session.execute(upsert_statement)
+
+
+def clear_daily_nutrient_totals_if_unlogged(user_id, log_date):
+    """Delete a user's daily nutrient totals for a date with no logged recipes left (they'd be
+    ~0 anyway, but the day shouldn't count as logged). Not committed.
+    """
+
+    logged_recipes = select(MealLogRecipe.recipe_id).join(MealLog).where(
+        MealLog.user_id == user_id,
+        MealLog.log_date == log_date
+    )
+
+    db.session.execute(
+        delete(DailyNutrientTotal).where(
+            DailyNutrientTotal.user_id == user_id,
+            DailyNutrientTotal.log_date == log_date,
+            ~logged_recipes.exists()
+        )
+    )
+
+
+def get_logged_nutrient_totals_query(user_id=None):
+    """Return the query of (user_id, log_date, nutrient_id, quantity) the rollup is built from,
+    computed from the meal logs (for one user, or everyone).
+    """
+
+    source_query = get_nutrient_intake_query(MealLog.user_id, MealLog.log_date)
+
+    if user_id is not None:
+        source_query = source_query.filter(MealLog.user_id == user_id)
+
+    return source_query.group_by(MealLog.user_id, MealLog.log_date, RecipeNutrient.nutrient_id)
+
+
+def rebuild_daily_nutrient_totals(user_id=None):
+    """Recompute the daily nutrient totals (for one user, or everyone) from the meal logs. Not committed.
+
+    locks the rollup against writes until the caller commits: a meal log change committed between
+    the DELETE and the INSERT would otherwise add a row the INSERT then duplicates.
+    """
+
+    db.session.execute(text(f"LOCK TABLE {DailyNutrientTotal.__tablename__} IN EXCLUSIVE MODE"))
+
+    delete_statement = delete(DailyNutrientTotal)
+
+    if user_id is not None:
+        delete_statement = delete_statement.where(DailyNutrientTotal.user_id == user_id)
+
+    db.session.execute(delete_statement)
+    db.session.execute(
+        insert(DailyNutrientTotal.__table__).from_select(
+            ["user_id", "log_date", "nutrient_id", "quantity"],
+            get_logged_nutrient_totals_query(user_id).statement
+        )
+    )
+
+
+def get_daily_nutrient_total_drift(user_id=None):
+    """Return [(user_id, log_date, nutrient_id, rollup quantity, logged quantity)] where the daily
+    rollup disagrees with the meal logs (for one user, or everyone); a missing side is None.
+    """
+
+    logged_totals = get_logged_nutrient_totals_query(user_id).subquery()
+    daily_totals = select(DailyNutrientTotal)
+
+    if user_id is not None:
+        daily_totals = daily_totals.where(DailyNutrientTotal.user_id == user_id)
+
+    daily_totals = daily_totals.subquery()
+
+    drift_user_id = func.coalesce(daily_totals.c.user_id, logged_totals.c.user_id).label("user_id")
+    drift_log_date = func.coalesce(daily_totals.c.log_date, logged_totals.c.log_date).label("log_date")
+    drift_nutrient_id = func.coalesce(daily_totals.c.nutrient_id, logged_totals.c.nutrient_id).label("nutrient_id")
+
+    return db.session.execute(
+        select(
+            drift_user_id,
+            drift_log_date,
+            drift_nutrient_id,
+            daily_totals.c.quantity.label("rollup_quantity"),
+            logged_totals.c.quantity.label("logged_quantity")
+        ).select_from(
+            daily_totals.join(
+                logged_totals,
+                and_(
+                    daily_totals.c.user_id == logged_totals.c.user_id,
+                    daily_totals.c.log_date == logged_totals.c.log_date,
+                    daily_totals.c.nutrient_id == logged_totals.c.nutrient_id
+                ),
+                full=True
+            )
+        ).where(
+            func.abs(func.coalesce(daily_totals.c.quantity, 0.0) - func.coalesce(logged_totals.c.quantity, 0.0))
+            > DAILY_NUTRIENT_TOTAL_TOLERANCE
+        ).order_by(drift_user_id, drift_log_date, drift_nutrient_id)
+    ).all()
+
+
 # ------- MealLogRecipe CRUD functions -------
 
 def add_recipe_to_meal_log(meal_log_id, recipe_id, serving_size):
@@ -548,7 +1032,7 @@ def get_meal_plan_by_user_id_and_date(user_id, meal_plan_date):
     """Return a meal plan for a user on a specific date."""
 
     return db.session.query(MealPlan).filter(
-        User.user_id==user_id, MealPlan.meal_plan_date==meal_plan_date).first()
+        MealPlan.user_id==user_id, MealPlan.meal_plan_date==meal_plan_date).first()
 
 
 # ------- MealPlanRecipe CRUD functions -------
@@ -572,6 +1056,19 @@ def get_recipes_in_meal_plan(meal_plan_id):
     return db.session.query(MealPlanRecipe).filter(MealPlanRecipe.meal_plan_id==meal_plan_id).all()
 
 
+def get_planned_recipes_for_period(user_id, start_date, end_date):
+    """Return [(meal_plan_date, recipe_id, meal_type, serving_size)] for every recipe a user
+    planned between start_date and end_date (inclusive), in one query.
+    """
+
+    return db.session.query(
+        MealPlan.meal_plan_date, MealPlanRecipe.recipe_id, MealPlanRecipe.meal_type, MealPlanRecipe.serving_size
+    ).join(MealPlanRecipe, MealPlanRecipe.meal_plan_id == MealPlan.meal_plan_id).filter(
+        MealPlan.user_id == user_id,
+        MealPlan.meal_plan_date.between(start_date, end_date)
+    ).order_by(MealPlan.meal_plan_date, MealPlanRecipe.meal_type, MealPlanRecipe.recipe_id).all()
+
+
 
 
 if __name__ == "__main__":
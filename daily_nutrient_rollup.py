@@ -0,0 +1,61 @@
+"""Check (and rebuild) the daily_nutrient_totals rollup against the meal logs it summarizes.
+
+the meal log endpoints keep the rollup current by applying each change's delta, and
+rederive_catalog.py rebuilds it after changing recipe nutrients; run this to report any drift
+(e.g. nutrients changed some other way, or a bug) and recompute the rollup from the logs:
+
+    python3 daily_nutrient_rollup.py              # report drift, then rebuild
+    python3 daily_nutrient_rollup.py --verify-only
+    python3 daily_nutrient_rollup.py --user-id 3
+"""
+
+import argparse
+import time
+
+from model import db, connect_to_db
+import crud
+import nutrient_cache
+
+
+MAX_DRIFT_ROWS_SHOWN = 20
+
+
+def report_drift(user_id=None):
+    """Print where the rollup disagrees with the meal logs and return how many rows drifted."""
+
+    drift_rows = crud.get_daily_nutrient_total_drift(user_id)
+
+    for drift_row in drift_rows[:MAX_DRIFT_ROWS_SHOWN]:
+        nutrient_name, _ = nutrient_cache.get_nutrient_by_id(drift_row.nutrient_id)
+        print(f"  user {drift_row.user_id} {drift_row.log_date} {nutrient_name}: "
+              f"rollup {drift_row.rollup_quantity} != logged {drift_row.logged_quantity}")
+
+    if len(drift_rows) > MAX_DRIFT_ROWS_SHOWN:
+        print(f"  ... and {len(drift_rows) - MAX_DRIFT_ROWS_SHOWN} more")
+
+    drifted_days = len({(drift_row.user_id, drift_row.log_date) for drift_row in drift_rows})
+    print(f"{len(drift_rows)} daily nutrient totals drifted, on {drifted_days} user-days")
+
+    return len(drift_rows)
+
+
+if __name__ == "__main__":
+    from server import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, help="only this user (default: everyone)")
+    parser.add_argument("--verify-only", action="store_true", help="report drift without rebuilding")
+    args = parser.parse_args()
+
+    connect_to_db(app, echo=False)
+    app.app_context().push()
+
+    drift_count = report_drift(args.user_id)
+
+    if args.verify_only:
+        raise SystemExit(1 if drift_count else 0) # so a scheduled check can alert on drift
+    else:
+        start_time = time.perf_counter()
+        crud.rebuild_daily_nutrient_totals(args.user_id)
+        db.session.commit()
+        print(f"Daily nutrient totals rebuilt in {time.perf_counter() - start_time:.2f} s! :)")
@@ -0,0 +1,291 @@
+"""Process-wide inverted index of which recipes contain which ingredients.
+
+maps every ingredient token (recipe_vocabulary.get_name_tokens, "red bell pepper" -> "bell pepper",
+"pepper", ...) and every canonical allergen ("allergen:dairy") to a sorted numpy array of
+recipe_ids, so include/exclude questions over any set of recipes are array intersections and
+differences instead of ingredient scans.
+
+each worker builds it once from the ingredients table, indexes the recipes it ingests right
+after their commit, and every REFRESH_INTERVAL seconds reads ingredients other workers (and
+warm_catalog.py) inserted: those above the highest ingredient_id it has seen, plus a trailing
+REFRESH_OVERLAP below it, since concurrent ingests can commit out of id order. a recipe the
+index still hasn't seen is read from the ingredients table when it is filtered, so filtering
+never treats an unindexed recipe as free of an allergen. recipes re-derived in place
+(rederive_catalog.py) bump the catalog version, and the next refresh rebuilds the index.
+
+    python3 ingredient_index.py  # build and print stats
+"""
+
+import sys
+import threading
+import time
+
+import numpy as np
+
+from model import db, Ingredient
+import crud
+import recipe_vocabulary
+
+
+REFRESH_INTERVAL = 30 # seconds between checks for recipes other workers ingested
+REFRESH_OVERLAP = 5_000 # ingredient ids below the watermark re-read on refresh (ingests committed out of order)
+BUILD_BATCH_SIZE = 10_000 # ingredient rows streamed per round trip
+
+_lock = threading.Lock()
+_postings = {} # token -> sorted, unique np.int32 array of recipe_ids
+_indexed_recipe_ids = np.empty(0, dtype=np.int32) # sorted: every recipe whose ingredients are indexed
+_max_ingredient_id = 0 # watermark: the highest ingredient_id read (lower ones may still commit, see REFRESH_OVERLAP)
+_loaded = False
+_catalog_version = 0 # crud.get_catalog_version() when the index was built
+_last_refresh = 0.0
+_stats = {"build_seconds": 0.0, "refreshes": 0, "last_refresh_seconds": 0.0}
+
+
+def get_allergen_key(allergen):
+    """Return the index key of a canonical allergen."""
+
+    return f"allergen:{allergen}"
+
+
+def _get_ingredient_keys(name, keys_by_name):
+    """Return the index keys of an ingredient name (memoized, names repeat a lot)."""
+
+    keys = keys_by_name.get(name)
+
+    if keys is None:
+        keys = recipe_vocabulary.get_name_tokens(name) | {
+            get_allergen_key(allergen) for allergen in recipe_vocabulary.get_ingredient_allergens(name)
+        }
+        keys_by_name[name] = keys
+
+    return keys
+
+
+def _read_postings(ingredient_filter):
+    """Return ({key: [recipe_ids]}, [recipe_ids read], highest ingredient_id read) for the ingredients matching a filter."""
+
+    new_postings = {}
+    recipe_ids = set()
+    keys_by_name = {}
+    max_ingredient_id = 0
+
+    ingredient_rows = db.session.query(Ingredient.ingredient_id, Ingredient.recipe_id, Ingredient.name).filter(
+        ingredient_filter
+    ).order_by(Ingredient.ingredient_id).yield_per(BUILD_BATCH_SIZE)
+
+    for ingredient_id, recipe_id, name in ingredient_rows:
+        for key in _get_ingredient_keys(name, keys_by_name):
+            new_postings.setdefault(key, []).append(recipe_id)
+        recipe_ids.add(recipe_id)
+        max_ingredient_id = ingredient_id
+
+    return new_postings, list(recipe_ids), max_ingredient_id
+
+
+def _merge_recipe_ids(existing_recipe_ids, recipe_ids):
+    """Return a sorted, unique array of existing_recipe_ids (sorted, unique) and recipe_ids."""
+
+    new_recipe_ids = np.unique(np.array(recipe_ids, dtype=np.int32))
+
+    if existing_recipe_ids is None:
+        return new_recipe_ids
+
+    if not len(new_recipe_ids):
+        return existing_recipe_ids
+
+    if not len(existing_recipe_ids) or new_recipe_ids[0] > existing_recipe_ids[-1]:
+        # the usual case, new recipes have higher ids: append
+        return np.concatenate((existing_recipe_ids, new_recipe_ids))
+
+    return np.union1d(existing_recipe_ids, new_recipe_ids)
+
+
+def _merge_postings(new_postings, recipe_ids):
+    """Merge new recipe_ids into the index. Caller holds _lock.
+
+    arrays are replaced, never changed in place, so readers holding one are unaffected.
+    merging recipe_ids already indexed changes nothing, so ingredients can be read twice.
+    """
+
+    global _indexed_recipe_ids
+
+    for key, key_recipe_ids in new_postings.items():
+        _postings[key] = _merge_recipe_ids(_postings.get(key), key_recipe_ids)
+
+    _indexed_recipe_ids = _merge_recipe_ids(_indexed_recipe_ids, recipe_ids)
+
+
+def build_index():
+    """Build (or rebuild) the index from every ingredient."""
+
+    global _indexed_recipe_ids, _max_ingredient_id, _loaded, _catalog_version, _last_refresh
+
+    start_time = time.perf_counter()
+    catalog_version = crud.get_catalog_version()
+    new_postings, recipe_ids, max_ingredient_id = _read_postings(Ingredient.ingredient_id > 0)
+
+    with _lock:
+        _postings.clear()
+        _indexed_recipe_ids = np.empty(0, dtype=np.int32)
+        _merge_postings(new_postings, recipe_ids)
+        _max_ingredient_id = max_ingredient_id
+        _loaded = True
+        _catalog_version = catalog_version
+        _last_refresh = time.monotonic()
+        _stats["build_seconds"] = round(time.perf_counter() - start_time, 3)
+
+
+def refresh_index():
+    """Add ingredients inserted since the last build or refresh (by any worker) to the index,
+    re-reading the REFRESH_OVERLAP ids below the watermark for ingests that committed late.
+    does nothing before the index is built, the build will read them.
+    """
+
+    global _max_ingredient_id, _last_refresh
+
+    if not _loaded:
+        return
+
+    start_time = time.perf_counter()
+    new_postings, recipe_ids, max_ingredient_id = _read_postings(
+        Ingredient.ingredient_id > _max_ingredient_id - REFRESH_OVERLAP
+    )
+
+    with _lock:
+        _merge_postings(new_postings, recipe_ids)
+        _max_ingredient_id = max(_max_ingredient_id, max_ingredient_id)
+        _last_refresh = time.monotonic()
+        _stats["refreshes"] += 1
+        _stats["last_refresh_seconds"] = round(time.perf_counter() - start_time, 4)
+
+
+def index_recipes(recipe_ids):
+    """Add some recipes' ingredients to the index, e.g. right after they were ingested.
+    does nothing before the index is built, the build will read them.
+    """
+
+    if not _loaded or not len(recipe_ids):
+        return
+
+    new_postings, indexed_recipe_ids, _ = _read_postings(Ingredient.recipe_id.in_(sorted(set(recipe_ids))))
+
+    with _lock:
+        # the watermark stays: these rows aren't every ingredient up to their ids
+        _merge_postings(new_postings, indexed_recipe_ids)
+
+
+def _ensure_current():
+    """Build the index the first time this worker needs it, and refresh it when it's due
+    (rebuild it, if the catalog was re-derived since it was built).
+    """
+
+    if not _loaded:
+        build_index()
+    elif time.monotonic() - _last_refresh > REFRESH_INTERVAL:
+        if crud.get_catalog_version() != _catalog_version:
+            build_index()
+        else:
+            refresh_index()
+
+
+def get_recipe_ids(key):
+    """Return the sorted recipe_ids containing an ingredient token or allergen key."""
+
+    _ensure_current()
+
+    return _postings.get(key, np.empty(0, dtype=np.int32))
+
+
+def get_recipe_ids_with_any(keys):
+    """Return the sorted recipe_ids containing at least one of keys."""
+
+    _ensure_current()
+
+    postings = [_postings[key] for key in keys if key in _postings]
+
+    if not postings:
+        return np.empty(0, dtype=np.int32)
+
+    return np.unique(np.concatenate(postings))
+
+
+def filter_recipe_ids(recipe_ids, include_keys=(), include_any_keys=(), exclude_keys=()):
+    """Return the recipe_ids (in their order) containing every include key, at least one
+    include-any key (if any are given) and no exclude key.
+
+    recipes the index hasn't seen yet are read from the ingredients table first; one without
+    any ingredients is left out whenever there is a key to check, never assumed to pass.
+    """
+
+    if not recipe_ids:
+        return []
+
+    recipe_id_array = np.array(recipe_ids, dtype=np.int32)
+
+    if not (include_keys or include_any_keys or exclude_keys):
+        return recipe_id_array.tolist()
+
+    _ensure_current()
+
+    unindexed_recipe_ids = recipe_id_array[~np.isin(recipe_id_array, _indexed_recipe_ids)]
+
+    if len(unindexed_recipe_ids):
+        index_recipes(unindexed_recipe_ids.tolist())
+
+    keep = np.isin(recipe_id_array, _indexed_recipe_ids)
+
+    for key in include_keys:
+        keep &= np.isin(recipe_id_array, get_recipe_ids(key))
+
+    if include_any_keys:
+        keep &= np.isin(recipe_id_array, get_recipe_ids_with_any(include_any_keys))
+
+    if exclude_keys:
+        keep &= ~np.isin(recipe_id_array, get_recipe_ids_with_any(exclude_keys))
+
+    return recipe_id_array[keep].tolist()
+
+
+def get_exclusion_keys(user_allergens=(), user_dislikes=()):
+    """Return the index keys a user's recipes must not contain (see recipe_vocabulary.get_exclusion_filters)."""
+
+    allergen_mask, excluded_tokens = recipe_vocabulary.get_exclusion_filters(user_allergens, user_dislikes)
+
+    allergen_keys = [
+        get_allergen_key(allergen) for allergen, bit in recipe_vocabulary.ALLERGEN_BITS.items()
+        if allergen_mask & (1 << bit)
+    ]
+
+    return allergen_keys + list(excluded_tokens)
+
+
+def get_stats():
+    """Return a dictionary of index size, memory and build/refresh times."""
+
+    with _lock:
+        postings = list(_postings.items())
+        stats = dict(_stats)
+        stats["max_ingredient_id"] = _max_ingredient_id
+        stats["recipes"] = len(_indexed_recipe_ids)
+
+    stats["keys"] = len(postings)
+    stats["postings"] = sum(len(recipe_ids) for _, recipe_ids in postings)
+    stats["postings_bytes"] = sum(recipe_ids.nbytes for _, recipe_ids in postings)
+    # arrays' object headers plus key strings and dict slots, roughly
+    stats["overhead_bytes"] = sum(
+        sys.getsizeof(key) + sys.getsizeof(recipe_ids) - recipe_ids.nbytes for key, recipe_ids in postings
+    ) + sys.getsizeof(_postings)
+
+    return stats
+
+
+if __name__ == "__main__":
+    from server import app
+    from model import connect_to_db
+
+    connect_to_db(app, echo=False)
+    app.app_context().push()
+
+    build_index()
+
+    print(f"Ingredient index built! :) {get_stats()}")
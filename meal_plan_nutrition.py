@@ -0,0 +1,154 @@
+"""Projected nutrition of a user's weekly meal plan, compared with daily targets.
+
+a week's planned recipes are read in one query and totaled per day from the per-serving
+nutrient matrix (see nutrient_matrix). each worker caches a projection by a fingerprint of the
+plan rows, the user's goals and the catalog version (bumped when recipes' nutrients are
+re-derived), so it is recomputed only after the plan, the goals or the nutrients change; the
+fingerprint is the same in every worker and doubles as the API's ETag.
+"""
+
+import hashlib
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+import crud
+import nutrient_matrix
+
+
+# general daily targets: nutrient -> (bound, amount, unit), the same defaults as the dashboard chart
+DAILY_NUTRIENT_TARGETS = {
+    "Protein": ("min", 70, "g"),
+    "Fiber": ("min", 30, "g"),
+    "Calcium": ("min", 1000, "mg"),
+    "Iron": ("min", 15, "mg"),
+    "Sodium": ("max", 2300, "mg"),
+}
+
+# nutrition goal -> daily target it sets, replacing the general one for that nutrient
+GOAL_DAILY_TARGETS = {
+    "high protein": ("Protein", "min", 90, "g"),
+    "high fiber": ("Fiber", "min", 35, "g"),
+    "low sugar": ("Sugar", "max", 25, "g"),
+    "low sodium": ("Sodium", "max", 1500, "mg"),
+}
+
+MAX_CACHED_PROJECTIONS = 5000
+
+_lock = threading.Lock()
+_cached_projections = {} # (user_id, week_start) -> (fingerprint, projection)
+
+
+def get_daily_targets(nutrition_goals):
+    """Return {nutrient name: (bound, amount, unit)} for a user's nutrition goals."""
+
+    daily_targets = dict(DAILY_NUTRIENT_TARGETS)
+
+    for goal in nutrition_goals:
+        if goal in GOAL_DAILY_TARGETS:
+            nutrient_name, bound, amount, unit = GOAL_DAILY_TARGETS[goal]
+            daily_targets[nutrient_name] = (bound, amount, unit)
+
+    return daily_targets
+
+
+def get_plan_fingerprint(planned_recipes, nutrition_goals, catalog_version):
+    """Return a short hash of a week's planned recipe rows, the goals they are compared with
+    and the catalog version (crud.get_catalog_version) of their recipes' nutrients.
+    """
+
+    fingerprint_source = repr((sorted(tuple(row) for row in planned_recipes), sorted(nutrition_goals), catalog_version))
+
+    return hashlib.sha1(fingerprint_source.encode()).hexdigest()
+
+
+def project_week_nutrition(week_start, planned_recipes, nutrition_goals):
+    """Return the projection dictionary for a week's planned recipe rows (see get_projected_week_nutrition)."""
+
+    week_dates = [week_start + timedelta(days=day) for day in range(7)]
+
+    planned_dates, daily_totals = nutrient_matrix.get_grouped_nutrient_totals(
+        (meal_plan_date, recipe_id, serving_size) for meal_plan_date, recipe_id, _, serving_size in planned_recipes
+    )
+    nutrient_columns = nutrient_matrix.get_nutrient_columns()
+    column_count = len(nutrient_columns)
+
+    # one row per day of the week, 0 on days with nothing planned
+    week_totals = np.zeros((7, column_count))
+    for planned_date, day_totals in zip(planned_dates, daily_totals):
+        week_totals[(planned_date - week_start).days, :len(day_totals)] = day_totals
+
+    column_by_name = {name: column for column, (_, name, _) in enumerate(nutrient_columns)}
+    planned_date_set = set(planned_dates)
+    days_planned = [day for day in range(7) if week_dates[day] in planned_date_set]
+    targets = []
+
+    for nutrient_name, (bound, amount, unit) in get_daily_targets(nutrition_goals).items():
+        column = column_by_name.get(nutrient_name)
+        daily_quantities = week_totals[:, column] if column is not None else np.zeros(7)
+        met = daily_quantities >= amount if bound == "min" else daily_quantities <= amount
+
+        targets.append({
+            "nutrient": nutrient_name,
+            "unit": unit,
+            "bound": bound,
+            "daily_target": amount,
+            "days_met": int(met[days_planned].sum()),
+            "daily": {
+                week_dates[day].isoformat(): {"quantity": round(float(daily_quantities[day]), 2), "met": bool(met[day])}
+                for day in days_planned
+            },
+        })
+
+    return {
+        "week_start": week_start.isoformat(),
+        "week_end": week_dates[-1].isoformat(),
+        "days_planned": len(days_planned),
+        "days": {
+            week_date.isoformat(): nutrient_matrix.to_nutrient_dict(day_totals, nutrient_columns)
+            for week_date, day_totals in zip(week_dates, week_totals)
+        },
+        "week": nutrient_matrix.to_nutrient_dict(week_totals.sum(axis=0), nutrient_columns),
+        "targets": targets,
+    }
+
+
+def get_projected_week_nutrition(user, week_start):
+    """Return (projection, fingerprint) of a user's planned nutrition for the week from week_start.
+
+    projection is a dictionary:
+
+    Example: {
+        'week_start': '2024-05-06', 'week_end': '2024-05-12', 'days_planned': 3,
+        'days': {'2024-05-06': {'Protein': {'quantity': 81.5, 'unit': 'g'}, ...}, ...}, # every day
+        'week': {'Protein': {'quantity': 240.2, 'unit': 'g'}, ...},
+        'targets': [
+            {'nutrient': 'Protein', 'unit': 'g', 'bound': 'min', 'daily_target': 90, 'days_met': 2,
+             'daily': {'2024-05-06': {'quantity': 81.5, 'met': False}, ...}}, # days with plans
+            ...
+        ]
+    }
+    """
+
+    planned_recipes = crud.get_planned_recipes_for_period(user.user_id, week_start, week_start + timedelta(days=6))
+    nutrition_goals = [ng.goal.lower() for ng in user.nutrition_goals]
+    catalog_version = crud.get_catalog_version()
+    fingerprint = get_plan_fingerprint(planned_recipes, nutrition_goals, catalog_version)
+    cache_key = (user.user_id, week_start)
+
+    cached_projection = _cached_projections.get(cache_key)
+
+    if cached_projection and cached_projection[0] == fingerprint:
+        return cached_projection[1], fingerprint
+
+    # the projection must come from the nutrients the fingerprint names, not wait for the matrix's next check
+    nutrient_matrix.reload_if_catalog_changed(catalog_version)
+    projection = project_week_nutrition(week_start, planned_recipes, nutrition_goals)
+
+    with _lock:
+        if len(_cached_projections) >= MAX_CACHED_PROJECTIONS:
+            _cached_projections.clear()
+        _cached_projections[cache_key] = (fingerprint, projection)
+
+    return projection, fingerprint
@@ -1,11 +1,15 @@
 """Models for Parkinson's App."""
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import event, DDL
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, ARRAY
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# trigram indexes (fuzzy search) need pg_trgm, create it along with the tables
+event.listen(db.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 
 class User(db.Model):
     """A user."""
@@ -144,13 +148,24 @@ class Recipe(db.Model):
     servings = db.Column(db.Float, nullable=False)
     instructions = db.Column(db.Text, nullable=False)
     texture = db.Column(db.String)
-    diets = db.Column(JSONB) 
+    diets = db.Column(JSONB) # sorted canonical diet tags, see recipe_vocabulary.get_recipe_diets
     date_added = db.Column(db.DateTime, nullable=False)
+    search_vector = db.Column(TSVECTOR) # title (weight A) + ingredient names (weight B), see crud.refresh_recipe_search_vectors
+    allergen_mask = db.Column(db.BigInteger) # bit per recipe_vocabulary.ALLERGEN_BITS allergen; NULL until classified
+    ingredient_tokens = db.Column(ARRAY(db.String)) # recipe_vocabulary tokens of every ingredient name
+    vocabulary_version = db.Column(db.Integer) # recipe_vocabulary.VOCABULARY_VERSION it was classified with
 
     meal_plan_recipes = db.relationship("MealPlanRecipe", back_populates="recipe")
     meal_log_recipes = db.relationship("MealLogRecipe", back_populates="recipe")
     ingredients = db.relationship("Ingredient", back_populates="recipe")
     recipe_nutrients = db.relationship("RecipeNutrient", back_populates="recipe")
+    nutrition_profile = db.relationship("RecipeNutritionProfile", back_populates="recipe", uselist=False)
+
+    __table_args__ = (
+        db.Index("ix_recipes_search_vector", "search_vector", postgresql_using="gin"),
+        db.Index("ix_recipes_ingredient_tokens", "ingredient_tokens", postgresql_using="gin"),
+        db.Index("ix_recipes_diets", "diets", postgresql_using="gin", postgresql_ops={"diets": "jsonb_path_ops"}),
+    )
 
     def __repr__(self):
         return f"<Recipe recipe_id={self.recipe_id} title={self.title}>"
@@ -162,7 +177,7 @@ class Ingredient(db.Model):
     __tablename__ = "ingredients"
 
     ingredient_id = db.Column(db.Integer, autoincrement=True, primary_key=True, nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.recipe_id"), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.recipe_id"), nullable=False, index=True)
     name = db.Column(db.String, nullable=False)
     quantity = db.Column(db.Float, nullable=False)
     unit = db.Column(db.String, nullable=False)
@@ -179,7 +194,7 @@ class Nutrient(db.Model):
     __tablename__ = "nutrients"
 
     nutrient_id = db.Column(db.Integer, autoincrement=True, primary_key=True, nullable=False)
-    name = db.Column(db.String, nullable=False)
+    name = db.Column(db.String, nullable=False, unique=True)
     unit = db.Column(db.String, nullable=False)
 
     recipe_nutrients = db.relationship("RecipeNutrient", back_populates="nutrient")
@@ -204,6 +219,88 @@ class RecipeNutrient(db.Model):
         return f"<RecipeNutrient recipe_id={self.recipe_id} nutrient_id={self.nutrient_id}>"
 
 
+class RecipeNutritionProfile(db.Model):
+    """Per-serving amounts of the nutrients nutrition goals filter on, one row per recipe.
+    maintained at ingest from recipe_nutrients (see crud.refresh_recipe_nutrition_profiles).
+    """
+
+    __tablename__ = "recipe_nutrition_profiles"
+
+    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.recipe_id"), primary_key=True, nullable=False)
+    calories = db.Column(db.Float) # kcal; NULL if Spoonacular didn't report the nutrient
+    protein = db.Column(db.Float, index=True) # g
+    fat = db.Column(db.Float) # g
+    carbohydrates = db.Column(db.Float) # g
+    sugar = db.Column(db.Float, index=True) # g
+    fiber = db.Column(db.Float, index=True) # g
+    sodium = db.Column(db.Float, index=True) # mg
+    calcium = db.Column(db.Float) # mg
+    iron = db.Column(db.Float) # mg
+
+    recipe = db.relationship("Recipe", back_populates="nutrition_profile")
+
+    def __repr__(self):
+        return f"<RecipeNutritionProfile recipe_id={self.recipe_id}>"
+
+
+class RecipePayload(db.Model):
+    """A Spoonacular result's raw JSON, gzip-compressed, kept to re-derive the catalog without refetching."""
+
+    __tablename__ = "recipe_payloads"
+
+    spoonacular_id = db.Column(db.Integer, primary_key=True, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False) # gzip-compressed JSON
+    fetched_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<RecipePayload spoonacular_id={self.spoonacular_id}>"
+
+
+class RecipeSearch(db.Model):
+    """A recipe search sent to Spoonacular, keyed by normalized query and filters."""
+
+    __tablename__ = "recipe_searches"
+
+    search_key = db.Column(db.String, primary_key=True, nullable=False) # ex. "chicken soup|allergens=dairy|diets=|likes=|dislikes="
+    search_term = db.Column(db.String, nullable=False)
+    result_count = db.Column(db.Integer, nullable=False)
+    recipe_ids = db.Column(JSONB) # recipe_ids of the results, in Spoonacular's order
+    last_fetched = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<RecipeSearch search_key={self.search_key} result_count={self.result_count}>"
+
+
+class SearchWord(db.Model):
+    """A word from a cached recipe title or ingredient name, for typo-tolerant search."""
+
+    __tablename__ = "search_words"
+
+    word = db.Column(db.String, primary_key=True, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_search_words_word_trgm", "word", postgresql_using="gin", postgresql_ops={"word": "gin_trgm_ops"}),
+    )
+
+    def __repr__(self):
+        return f"<SearchWord word={self.word}>"
+
+
+class CatalogVersion(db.Model):
+    """A counter bumped whenever recipes are re-derived in place (rederive_catalog.py), so each
+    worker's caches built from recipe rows (see nutrient_matrix) know to reload.
+    """
+
+    __tablename__ = "catalog_versions"
+
+    name = db.Column(db.String, primary_key=True, nullable=False) # ex. "recipes"
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<CatalogVersion name={self.name} version={self.version}>"
+
+
 class MealLog(db.Model):
     """An instance a user eats a meal."""
 
@@ -218,6 +315,10 @@ class MealLog(db.Model):
     user = db.relationship("User", back_populates="meal_logs")
     meal_log_recipes = db.relationship("MealLogRecipe", back_populates="meal_log")
 
+    __table_args__ = (
+        db.Index("ix_meal_logs_user_id_log_date", "user_id", "log_date"),
+    )
+
     def __repr__(self):
         return f"<MealLog meal_log_id={self.meal_log_id} meal_type={self.meal_type}>"
     
@@ -238,6 +339,50 @@ class MealLogRecipe(db.Model):
         return f"<MealLogRecipe meal_log_id={self.meal_log_id} recipe_id={self.recipe_id}>"
     
 
+class DailyNutrientTotal(db.Model):
+    """How much of a nutrient a user ate on a day, summed over their logged meals.
+
+    a rollup of meal_logs x meal_log_recipes x recipe_nutrients, kept current by the meal log
+    endpoints applying each change's delta (see crud.apply_daily_nutrient_delta) and rebuilt
+    or checked against the logs with daily_nutrient_rollup.py.
+    """
+
+    __tablename__ = "daily_nutrient_totals"
+
+    # primary key order serves a user's date ranges
+    user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), primary_key=True, nullable=False)
+    log_date = db.Column(db.Date, primary_key=True, nullable=False)
+    nutrient_id = db.Column(db.Integer, db.ForeignKey("nutrients.nutrient_id"), primary_key=True, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f"<DailyNutrientTotal user_id={self.user_id} log_date={self.log_date} nutrient_id={self.nutrient_id}>"
+
+
+class WeeklyNutritionSummary(db.Model):
+    """A user's logging and nutrient goal adherence over one week (Monday to Sunday).
+
+    written in bulk by batch_analytics.py for population reports; averages are per logged day.
+    """
+
+    __tablename__ = "weekly_nutrition_summaries"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), primary_key=True, nullable=False)
+    week_start = db.Column(db.Date, primary_key=True, nullable=False)
+    days_logged = db.Column(db.Integer, nullable=False)
+    recipes_logged = db.Column(db.Integer, nullable=False)
+    protein_average = db.Column(db.Float) # NULL when nothing was logged that week
+    fiber_average = db.Column(db.Float)
+    calcium_average = db.Column(db.Float)
+    protein_goal_days = db.Column(db.Integer, nullable=False) # logged days meeting the daily target
+    fiber_goal_days = db.Column(db.Integer, nullable=False)
+    calcium_goal_days = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<WeeklyNutritionSummary user_id={self.user_id} week_start={self.week_start}>"
+
+
 class MealPlan(db.Model):
     """A user's meal plan."""
 
@@ -251,6 +396,10 @@ class MealPlan(db.Model):
     user = db.relationship("User", back_populates="meal_plans")
     meal_plan_recipes = db.relationship("MealPlanRecipe", back_populates="meal_plan")
 
+    __table_args__ = (
+        db.Index("ix_meal_plans_user_id_meal_plan_date", "user_id", "meal_plan_date"),
+    )
+
     def __repr__(self):
         return f"<MealPlan meal_plan_id={self.meal_plan_id} meal_plan_date={self.meal_plan_date}>"
     
@@ -0,0 +1,99 @@
+"""Process-wide cache of the nutrients table.
+
+nutrients is a tiny, nearly static dimension, so each worker loads it once and keeps
+name <-> nutrient_id <-> unit in memory. ingest and nutritional analysis read from here
+instead of querying nutrients by name or lazy-loading RecipeNutrient.nutrient.
+"""
+
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from model import db, Nutrient
+
+
+_lock = threading.Lock()
+_nutrients_by_name = {} # name -> (nutrient_id, unit)
+_nutrients_by_id = {} # nutrient_id -> (name, unit)
+_loaded = False
+
+
+def _cache_nutrient_rows(nutrient_rows):
+    """Add (nutrient_id, name, unit) rows to the cache. Caller holds _lock."""
+
+    for nutrient_id, name, unit in nutrient_rows:
+        _nutrients_by_name[name] = (nutrient_id, unit)
+        _nutrients_by_id[nutrient_id] = (name, unit)
+
+
+def load_nutrients():
+    """Load (or reload) every nutrient into the cache."""
+
+    global _loaded
+
+    nutrient_rows = db.session.query(Nutrient.nutrient_id, Nutrient.name, Nutrient.unit).all()
+
+    with _lock:
+        _nutrients_by_name.clear()
+        _nutrients_by_id.clear()
+        _cache_nutrient_rows(nutrient_rows)
+        _loaded = True
+
+
+def _ensure_loaded():
+    """Load the cache the first time this worker needs it."""
+
+    if not _loaded:
+        load_nutrients()
+
+
+def get_nutrient_ids(name_unit_pairs):
+    """Return a dictionary of nutrient name -> nutrient_id, creating nutrients that don't exist yet.
+
+    new nutrients are upserted (ON CONFLICT on the unique name) and committed on their own
+    connection, so concurrent workers can't create duplicates and a cached id never points
+    at a row that was rolled back with the caller's transaction.
+    """
+
+    _ensure_loaded()
+
+    units_by_name = {}
+    for name, unit in name_unit_pairs:
+        units_by_name.setdefault(name, unit)
+
+    missing_nutrient_rows = [
+        {"name": name, "unit": unit} for name, unit in units_by_name.items() if name not in _nutrients_by_name
+    ]
+
+    if missing_nutrient_rows:
+        nutrients_table = Nutrient.__table__
+
+        with db.engine.begin() as connection:
+            connection.execute(
+                insert(nutrients_table).on_conflict_do_nothing(index_elements=["name"]),
+                missing_nutrient_rows
+            )
+            # includes nutrients another worker inserted first
+            nutrient_rows = connection.execute(
+                select(nutrients_table.c.nutrient_id, nutrients_table.c.name, nutrients_table.c.unit).where(
+                    nutrients_table.c.name.in_([row["name"] for row in missing_nutrient_rows]))
+            ).all()
+
+        with _lock:
+            _cache_nutrient_rows(nutrient_rows)
+
+    return {name: _nutrients_by_name[name][0] for name in units_by_name}
+
+
+def get_nutrient_by_id(nutrient_id):
+    """Return (name, unit) for a nutrient_id.
+    an unknown id means another worker added a nutrient, so the cache is reloaded once.
+    """
+
+    _ensure_loaded()
+
+    if nutrient_id not in _nutrients_by_id:
+        load_nutrients()
+
+    return _nutrients_by_id.get(nutrient_id, (None, None))
@@ -0,0 +1,258 @@
+"""Process-wide dense matrix of per-serving nutrient amounts, one row per recipe.
+
+each worker keeps recipe_nutrients as a float matrix (recipe row x nutrient column, quantity /
+recipe servings), so the nutrients of any set of (recipe_id, servings) pairs -- a day's logs, a
+week's plan, every user's week for a report -- are one gather and one weighted sum in numpy
+instead of a RecipeNutrient object and a division per row.
+
+rows are added as recipes are ingested (this worker's ingests right away, other workers' the
+first time one of their recipes is asked for). rederive_catalog.py changes recipes' nutrients
+in place and then bumps the catalog version (crud.bump_catalog_version); each worker checks it
+every VERSION_CHECK_INTERVAL seconds and reloads the whole matrix when it changed.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from model import db, Recipe, RecipeNutrient
+import crud
+import nutrient_cache
+
+
+MATRIX_DTYPE = np.float32 # ~4 bytes per recipe x nutrient; plenty of precision for nutrition labels
+VERSION_CHECK_INTERVAL = 60 # seconds between checks of the catalog version
+
+_lock = threading.Lock()
+_matrix = np.zeros((0, 0), dtype=MATRIX_DTYPE) # rows and columns grow in blocks, see _reserve
+_rows = {} # recipe_id -> matrix row
+_columns = {} # nutrient_id -> matrix column
+_loaded = False
+_catalog_version = 0 # crud.get_catalog_version() when the matrix was loaded
+_last_version_check = 0.0
+_version = 0 # bumped whenever rows already in the matrix change (a reload, or a refresh with new values)
+_stats = {"build_seconds": 0.0, "refreshes": 0, "reloads": 0}
+
+
+def _read_per_serving_rows(recipe_ids=None):
+    """Return [(recipe_id, nutrient_id, quantity per serving)] for some recipes (or all), with
+    every recipe that has a servings count, even if it has no nutrients.
+    """
+
+    per_serving_quantity = RecipeNutrient.quantity / Recipe.servings
+
+    nutrient_query = db.session.query(
+        Recipe.recipe_id, RecipeNutrient.nutrient_id, per_serving_quantity
+    ).outerjoin(RecipeNutrient, RecipeNutrient.recipe_id == Recipe.recipe_id).filter(Recipe.servings > 0)
+
+    if recipe_ids is not None:
+        nutrient_query = nutrient_query.filter(Recipe.recipe_id.in_(recipe_ids))
+
+    return nutrient_query.all()
+
+
+def _reserve(row_count, column_count):
+    """Grow the matrix (doubling) to hold at least row_count x column_count. Caller holds _lock."""
+
+    global _matrix
+
+    current_rows, current_columns = _matrix.shape
+
+    if row_count <= current_rows and column_count <= current_columns:
+        return
+
+    new_matrix = np.zeros(
+        (max(row_count, 2 * current_rows, 1024), max(column_count, current_columns + 16)),
+        dtype=MATRIX_DTYPE
+    )
+    new_matrix[:current_rows, :current_columns] = _matrix
+    _matrix = new_matrix
+
+
+def _store_rows(recipe_ids, per_serving_rows):
+    """Write (or overwrite) recipes' rows from per-serving rows. Caller holds _lock."""
+
+    global _version
+
+    existing_positions = [_rows[recipe_id] for recipe_id in recipe_ids if recipe_id in _rows]
+    previous_rows = _matrix[existing_positions].copy()
+    previous_column_count = _matrix.shape[1]
+
+    for recipe_id in recipe_ids:
+        _rows.setdefault(recipe_id, len(_rows))
+
+    for _, nutrient_id, _ in per_serving_rows:
+        if nutrient_id is not None:
+            _columns.setdefault(nutrient_id, len(_columns))
+
+    _reserve(len(_rows), len(_columns))
+    _matrix[[_rows[recipe_id] for recipe_id in recipe_ids]] = 0.0
+
+    nutrient_rows = [row for row in per_serving_rows if row[1] is not None]
+
+    if nutrient_rows:
+        _matrix[
+            np.array([_rows[recipe_id] for recipe_id, _, _ in nutrient_rows], dtype=np.intp),
+            np.array([_columns[nutrient_id] for _, nutrient_id, _ in nutrient_rows], dtype=np.intp)
+        ] = np.array([quantity for _, _, quantity in nutrient_rows], dtype=MATRIX_DTYPE)
+
+    # the version means rows changed: rewriting a row with the same values doesn't bump it
+    if existing_positions:
+        rewritten_rows = _matrix[existing_positions]
+
+        if not np.array_equal(rewritten_rows[:, :previous_column_count], previous_rows) or \
+                rewritten_rows[:, previous_column_count:].any():
+            _version += 1
+
+
+def load_nutrient_matrix():
+    """Load (or reload) every recipe's per-serving nutrients into the matrix."""
+
+    global _matrix, _loaded, _catalog_version, _last_version_check, _version
+
+    start_time = time.perf_counter()
+    # read before the rows, so a re-derive committing meanwhile is seen as a newer version
+    catalog_version = crud.get_catalog_version()
+    per_serving_rows = _read_per_serving_rows()
+
+    with _lock:
+        _matrix = np.zeros((0, 0), dtype=MATRIX_DTYPE)
+        _rows.clear()
+        _columns.clear()
+        _store_rows(sorted({recipe_id for recipe_id, _, _ in per_serving_rows}), per_serving_rows)
+        _loaded = True
+        _catalog_version = catalog_version
+        _last_version_check = time.monotonic()
+        _version += 1
+        _stats["build_seconds"] = round(time.perf_counter() - start_time, 3)
+
+
+def reload_if_catalog_changed(catalog_version=None):
+    """Reload the matrix if the catalog version (crud.get_catalog_version, read if not given)
+    changed since it was loaded (recipes were re-derived by another process).
+    does nothing before the matrix is loaded.
+    """
+
+    global _last_version_check
+
+    if not _loaded:
+        return
+
+    _last_version_check = time.monotonic()
+
+    if catalog_version is None:
+        catalog_version = crud.get_catalog_version()
+
+    if catalog_version != _catalog_version:
+        load_nutrient_matrix()
+        _stats["reloads"] += 1
+
+
+def refresh_recipes(recipe_ids):
+    """(Re)load some recipes' rows, e.g. right after they were ingested.
+    does nothing before the matrix is loaded, the load will read them.
+    """
+
+    if not _loaded or not recipe_ids:
+        return
+
+    recipe_ids = sorted(set(recipe_ids))
+    per_serving_rows = _read_per_serving_rows(recipe_ids)
+
+    with _lock:
+        # a recipe without servings (no rows read) keeps an all-zero row, like in the analysis
+        _store_rows(recipe_ids, per_serving_rows)
+        _stats["refreshes"] += 1
+
+
+def _ensure_rows(recipe_ids):
+    """Load the matrix the first time this worker needs it, reload it when the catalog was
+    re-derived, and load rows it doesn't have yet (recipes another worker ingested).
+    """
+
+    if not _loaded:
+        load_nutrient_matrix()
+    elif time.monotonic() - _last_version_check > VERSION_CHECK_INTERVAL:
+        reload_if_catalog_changed()
+
+    missing_recipe_ids = [recipe_id for recipe_id in set(recipe_ids) if recipe_id not in _rows]
+
+    if missing_recipe_ids:
+        refresh_recipes(missing_recipe_ids)
+
+
+def get_grouped_nutrient_totals(group_recipe_servings):
+    """Return (group keys, totals) for [(group key, recipe_id, servings)]: totals[i] is the
+    nutrients (one column per get_nutrient_columns entry) of group i's recipes at their servings.
+
+    group keys can be anything hashable -- a date, (user_id, date)... -- and are returned in
+    first-seen order. the grouping is a sparse (group x recipe) servings matrix times the dense
+    per-serving matrix, done as one gather of rows, a weighting and a bincount per nutrient.
+    """
+
+    group_indexes = {}
+    group_positions = []
+    recipe_ids = []
+    servings = []
+
+    for group_key, recipe_id, serving_size in group_recipe_servings:
+        group_positions.append(group_indexes.setdefault(group_key, len(group_indexes)))
+        recipe_ids.append(recipe_id)
+        servings.append(serving_size)
+
+    _ensure_rows(recipe_ids)
+
+    with _lock:
+        # a reload between _ensure_rows and here may have dropped a recipe without servings:
+        # it counts as an all-zero row, as it would after the reload
+        column_count = len(_columns)
+        row_positions = np.array([_rows.get(recipe_id, -1) for recipe_id in recipe_ids], dtype=np.intp)
+        per_serving = _matrix[row_positions, :column_count].astype(float)
+        per_serving[row_positions < 0] = 0.0
+
+    # sum each group's weighted rows, one bincount per nutrient column
+    group_positions = np.array(group_positions, dtype=np.intp)
+    weighted = per_serving * np.array(servings, dtype=float)[:, None]
+
+    totals = np.zeros((len(group_indexes), column_count))
+    for column in range(column_count):
+        totals[:, column] = np.bincount(group_positions, weights=weighted[:, column], minlength=len(group_indexes))
+
+    return list(group_indexes), totals
+
+
+def get_nutrient_columns():
+    """Return [(nutrient_id, name, unit)] in matrix column order."""
+
+    with _lock:
+        nutrient_ids = sorted(_columns, key=_columns.get)
+
+    return [(nutrient_id, *nutrient_cache.get_nutrient_by_id(nutrient_id)) for nutrient_id in nutrient_ids]
+
+
+def to_nutrient_dict(nutrient_totals, nutrient_columns=None):
+    """Return a row of totals as {nutrient name: {"quantity", "unit"}} (the shape of
+    nutritional_analysis.calculate_daily_nutrient_intake), leaving out nutrients at 0.
+    pass nutrient_columns (get_nutrient_columns) when converting many rows.
+    """
+
+    return {
+        name: {"quantity": float(quantity), "unit": unit}
+        for (_, name, unit), quantity in zip(nutrient_columns or get_nutrient_columns(), nutrient_totals)
+        if quantity
+    }
+
+
+def get_stats():
+    """Return a dictionary of matrix size, memory, build time and catalog version."""
+
+    with _lock:
+        stats = dict(_stats)
+        stats["recipes"] = len(_rows)
+        stats["nutrients"] = len(_columns)
+        stats["matrix_bytes"] = _matrix.nbytes
+        stats["catalog_version"] = _catalog_version
+        stats["version"] = _version
+
+    return stats
@@ -2,8 +2,11 @@
 
 from datetime import date, timedelta
 
+import numpy as np
+
 from model import connect_to_db
 import crud
+import nutrient_cache
 
 
 def calculate_daily_nutrient_intake(user_id, intake_date):
@@ -13,71 +16,76 @@ def calculate_daily_nutrient_intake(user_id, intake_date):
 
     daily_nutrient_intake = {} # will store daily nutrient intake info
 
-    # get all meal logs for the user on given date - MealLog objects 
-    meal_logs_for_day = crud.get_meal_log_by_user_id_and_date(user_id, intake_date)
+    # the day's rows of the daily nutrient rollup: every logged recipe's share of each nutrient,
+    # (nutrient quantity / recipe servings) * servings eaten, summed as meals are logged
+    for nutrient_id, quantity_eaten in crud.get_daily_nutrient_totals(user_id, intake_date):
+        # name and unit from the per-worker nutrient cache, not a query per nutrient
+        nutrient_name, nutrient_unit = nutrient_cache.get_nutrient_by_id(nutrient_id)
 
-    if not meal_logs_for_day: # if no meals logged for this day
-        return daily_nutrient_intake
-    
-    for meallog in meal_logs_for_day:
-        # get all MealLogRecipe entries associated with meal log's id
-        meal_log_recipe_entries = crud.get_recipes_in_meal_log(meallog.meal_log_id)
-
-        for logged_recipe_entry in meal_log_recipe_entries: # MealLogRecipe objects
-            recipe_id = logged_recipe_entry.recipe_id 
-            serving_size_eaten = logged_recipe_entry.serving_size
-
-            # recipe_id from MealLogRecipe object to get full Recipe object
-            full_recipe = crud.get_recipe_by_id(recipe_id)
-
-            # total servings in recipe
-            total_servings_in_recipe = full_recipe.servings
-        
-            # get all nutrients in recipe - RecipeNutrient objects 
-            nutrients_in_recipe = crud.get_nutrients_by_recipe_id(recipe_id)
-            
-            for recipe_nutrient in nutrients_in_recipe: # RecipeNutrient objects
-                nutrient_name = recipe_nutrient.nutrient.name
-                nutrient_unit = recipe_nutrient.nutrient.unit
-                nutrient_quantity = recipe_nutrient.quantity # total quantity of a nutrient for original recipe's servings
-
-                # calculate actual quantity of nutrient consumed by the user 
-                # based on logged serving size and recipe's original servings
-                # (total nutrient quantity in original recipe / number of servings in original recipe ) * (actual servings eaten)
-
-                if total_servings_in_recipe > 0: # avoid dividing by zero
-
-                    actual_quantity_eaten = (nutrient_quantity / total_servings_in_recipe) * (serving_size_eaten)
-                else:
-                    actual_quantity_eaten = 0.0  # default to zero if original servings zero or not provided 
-
-                if nutrient_name not in daily_nutrient_intake: 
-                    # add nutrient quanity for the day with its quantity and unit to daily_nutrient_intake dictionary
-                    daily_nutrient_intake[nutrient_name] = {"quantity": 0.0, "unit": nutrient_unit}
-                    daily_nutrient_intake[nutrient_name]["quantity"] += actual_quantity_eaten
+        daily_nutrient_intake[nutrient_name] = {"quantity": quantity_eaten, "unit": nutrient_unit}
 
     return daily_nutrient_intake
 
 
-# def get_nutrition_analysis_over_period(user_id, start_date, end_date):
-#     """Calculates the average daily nutrient intake for a user over a given time period.
-#     returns a dictionary of average daily nutrient intake (with keys as  
-#     """
+def get_nutrition_analysis_over_period(user_id, start_date, end_date):
+    """Calculates daily nutrient intake for a user over a time period (start and end inclusive),
+    from the period's rows of the daily nutrient rollup (one index range scan) instead of one
+    analysis per day.
 
-     
-#     nutrient_intake_over_period = {}  # will store average daily nutrient intake over a time period
-#     days_with_logs = 0  # to count number of days with logs to divide by to get average daily nutrient intake 
+    returns a dictionary:
 
+    Example: {
+        'dates': ['2024-05-01', '2024-05-02', ...], # every day in the period
+        'days_with_logs': 5,
+        'nutrients': {
+            'Protein': {'unit': 'g', 'daily': [62.5, None, ...], 'average': 58.1, 'min': 31.0, 'max': 80.2},
+            ...
+        }
+    }
+    daily has None for days without logs; average, min and max are over days with logs
+    (a nutrient missing from a logged day counts as 0 that day).
+    """
 
-#     current_date = start_date # date time period starts 
-#     while current_date <= end_date: 
-#         daily_summary = calculate_daily_nutrient_intake(user_id, current_date)
-
-#         if daily_summary: # only count days with recipe logs
-#             days_with_logs += 1
+    day_count = (end_date - start_date).days + 1
+    dates = [start_date + timedelta(days=day) for day in range(day_count)]
+
+    nutrient_totals = crud.get_nutrient_totals_by_day(user_id, start_date, end_date)
+
+    # day x nutrient matrix of quantities eaten
+    nutrient_ids = sorted({nutrient_id for _, nutrient_id, _ in nutrient_totals})
+    nutrient_columns = {nutrient_id: column for column, nutrient_id in enumerate(nutrient_ids)}
+    daily_quantities = np.zeros((day_count, len(nutrient_ids)))
+    logged_days = np.zeros(day_count, dtype=bool)
+
+    for log_date, nutrient_id, quantity_eaten in nutrient_totals:
+        day = (log_date - start_date).days
+        daily_quantities[day, nutrient_columns[nutrient_id]] = quantity_eaten
+        logged_days[day] = True
+
+    logged_quantities = daily_quantities[logged_days]
+    nutrient_intake_over_period = {}
+
+    for nutrient_id, column in nutrient_columns.items():
+        nutrient_name, nutrient_unit = nutrient_cache.get_nutrient_by_id(nutrient_id)
+        column_quantities = logged_quantities[:, column]
+
+        nutrient_intake_over_period[nutrient_name] = {
+            "unit": nutrient_unit,
+            "daily": [
+                round(float(quantity), 2) if logged else None
+                for quantity, logged in zip(daily_quantities[:, column], logged_days)
+            ],
+            "average": round(float(column_quantities.mean()), 2),
+            "min": round(float(column_quantities.min()), 2),
+            "max": round(float(column_quantities.max()), 2),
+        }
+
+    return {
+        "dates": [day.isoformat() for day in dates],
+        "days_with_logs": int(logged_days.sum()),
+        "nutrients": nutrient_intake_over_period,
+    }
 
-#             for nutrient_name, 
-            
 
 def generate_simple_grocery_list_for_week(user_id, week_start_date, week_end_date):
     """generates a gorcery list for a user's meal plan within a given week
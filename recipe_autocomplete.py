@@ -0,0 +1,257 @@
+"""Process-wide prefix index for search-box autocomplete.
+
+recipe titles and ingredient names are kept as one sorted list of (key, suggestion) entries,
+one entry per word a suggestion can be found from ("Creamy Chicken Soup" is found from
+"creamy ...", "chicken ..." and "soup"), so the suggestions for a prefix are a bisect into
+the list and a short scan. popular suggestions (ingredients used by many recipes, titles
+shared by several) come first, and answers for a prefix are cached until the index changes.
+
+each worker builds it once from the catalog and adds the recipes it ingests right after their
+commit. every REFRESH_INTERVAL seconds it adds recipes other workers ingested: those above the
+highest recipe_id it has seen, plus any it hasn't indexed in a trailing REFRESH_OVERLAP below
+it, since concurrent ingests can commit out of id order. recipes re-derived in place
+(rederive_catalog.py) bump the catalog version, and the next refresh reloads the index.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import time
+
+from sqlalchemy import func
+
+from model import db, Recipe, Ingredient
+import crud
+
+
+REFRESH_INTERVAL = 300 # seconds between checks for newly ingested recipes
+REFRESH_OVERLAP = 1000 # recipe ids below the watermark checked on refresh (ingests committed out of order)
+MIN_PREFIX_LENGTH = 2 # shorter prefixes match too much to be useful
+MAX_SUGGESTION_LENGTH = 80 # longer ingredient names are notes, not names
+MAX_SCANNED_ENTRIES = 5000 # bounds a lookup's time; a prefix matching more is ranked from its first matches
+MAX_CACHED_PREFIXES = 5000
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock() # one load/refresh at a time, so no recipe's weights are added twice
+_suggestions = {} # normalized text -> [display text, weight]
+_entries = [] # sorted (key, normalized text); replaced, never changed in place
+_cached_suggestions = {} # (prefix, limit) -> [display text]
+_indexed_recipe_ids = set() # recipes whose title and ingredients are in the index
+_max_recipe_id = 0 # watermark: the highest recipe_id indexed
+_loaded = False
+_catalog_version = 0 # crud.get_catalog_version() when the index was loaded
+_last_refresh = 0.0
+_stats = {"build_seconds": 0.0, "refreshes": 0}
+
+
+def normalize_text(text):
+    """Return text as lowercase words separated by single spaces ("Mac & Cheese!" -> "mac cheese")."""
+
+    return " ".join(re.findall(r"[a-z]+", text.lower()))
+
+
+def get_entry_keys(normalized_text):
+    """Return the keys a suggestion is found from: its text from each word on."""
+
+    words = normalized_text.split(" ")
+
+    return [" ".join(words[start:]) for start in range(len(words))]
+
+
+def _add_suggestions(weighted_texts):
+    """Add (display text, weight) pairs to the index and swap in the new entry list. Caller holds _lock."""
+
+    global _entries
+
+    new_entries = []
+
+    for display_text, weight in weighted_texts:
+        display_text = " ".join(display_text.split())
+        normalized_text = normalize_text(display_text)
+
+        if not normalized_text or len(display_text) > MAX_SUGGESTION_LENGTH:
+            continue
+
+        suggestion = _suggestions.get(normalized_text)
+
+        if suggestion:
+            suggestion[1] += weight
+        else:
+            _suggestions[normalized_text] = [display_text, weight]
+            new_entries.extend((key, normalized_text) for key in get_entry_keys(normalized_text))
+
+    new_entries.sort()
+    _entries = list(heapq.merge(_entries, new_entries)) if _entries else new_entries
+    _cached_suggestions.clear()
+
+
+def _read_suggestions(recipe_ids=None):
+    """Return [(display text, weight)] for some recipes' titles and ingredient names (or every recipe's)."""
+
+    title_query = db.session.query(Recipe.title, func.count(Recipe.recipe_id)).group_by(Recipe.title)
+    ingredient_query = db.session.query(
+        Ingredient.name, func.count(func.distinct(Ingredient.recipe_id))
+    ).group_by(Ingredient.name)
+
+    if recipe_ids is not None:
+        title_query = title_query.filter(Recipe.recipe_id.in_(recipe_ids))
+        ingredient_query = ingredient_query.filter(Ingredient.recipe_id.in_(recipe_ids))
+
+    return title_query.all() + ingredient_query.all()
+
+
+def _add_recipes(recipe_ids):
+    """Add recipes not indexed yet to the index. Caller holds _refresh_lock."""
+
+    global _max_recipe_id
+
+    new_recipe_ids = sorted(set(recipe_ids) - _indexed_recipe_ids)
+
+    if not new_recipe_ids:
+        return
+
+    weighted_texts = _read_suggestions(new_recipe_ids)
+
+    with _lock:
+        _add_suggestions(weighted_texts)
+        _indexed_recipe_ids.update(new_recipe_ids)
+        _max_recipe_id = max(_max_recipe_id, new_recipe_ids[-1])
+
+
+def load_suggestions():
+    """Load (or reload) every recipe title and ingredient name into the index."""
+
+    global _entries, _max_recipe_id, _loaded, _catalog_version, _last_refresh
+
+    with _refresh_lock:
+        start_time = time.perf_counter()
+        catalog_version = crud.get_catalog_version()
+        # ids first: a recipe committed in between is read now and again by a refresh, which only
+        # makes its suggestions a little more popular; the other way round it would be missed
+        recipe_ids = db.session.query(Recipe.recipe_id).all()
+        weighted_texts = _read_suggestions()
+
+        with _lock:
+            _suggestions.clear()
+            _entries = []
+            _add_suggestions(weighted_texts)
+            _indexed_recipe_ids.clear()
+            _indexed_recipe_ids.update(recipe_id for recipe_id, in recipe_ids)
+            _max_recipe_id = max(_indexed_recipe_ids, default=0)
+            _loaded = True
+            _catalog_version = catalog_version
+            _last_refresh = time.monotonic()
+            _stats["build_seconds"] = round(time.perf_counter() - start_time, 3)
+
+
+def refresh_suggestions():
+    """Add recipes ingested (by any worker) since the last load or refresh to the index,
+    including ones committed late below the watermark.
+    """
+
+    global _last_refresh
+
+    with _refresh_lock:
+        recipe_ids = db.session.query(Recipe.recipe_id).filter(
+            Recipe.recipe_id > _max_recipe_id - REFRESH_OVERLAP
+        ).all()
+        _add_recipes([recipe_id for recipe_id, in recipe_ids])
+
+        with _lock:
+            _last_refresh = time.monotonic()
+            _stats["refreshes"] += 1
+
+
+def index_recipes(recipe_ids):
+    """Add some recipes to the index, e.g. right after they were ingested.
+    does nothing before the index is loaded, the load will read them.
+    """
+
+    if not _loaded or not recipe_ids:
+        return
+
+    with _refresh_lock:
+        _add_recipes(recipe_ids)
+
+
+def _ensure_current():
+    """Load the index the first time this worker needs it, and refresh it when it's due
+    (reload it, if the catalog was re-derived since it was loaded).
+    """
+
+    if not _loaded:
+        load_suggestions()
+    elif time.monotonic() - _last_refresh > REFRESH_INTERVAL:
+        if crud.get_catalog_version() != _catalog_version:
+            load_suggestions()
+        else:
+            refresh_suggestions()
+
+
+def get_suggestions(prefix, limit=10):
+    """Return up to limit titles and ingredient names with a word starting with prefix.
+
+    suggestions that start with the prefix come first, then by popularity, then shorter first.
+    a very short prefix matching more than MAX_SCANNED_ENTRIES entries is ranked from the
+    alphabetically first of them; the next letter typed narrows it.
+    """
+
+    normalized_prefix = normalize_text(prefix)
+
+    # keep a trailing space: "chicken " shouldn't suggest "chickpea"
+    if normalized_prefix and prefix[-1:].isspace():
+        normalized_prefix += " "
+
+    if len(normalized_prefix) < MIN_PREFIX_LENGTH:
+        return []
+
+    _ensure_current()
+
+    cache_key = (normalized_prefix, limit)
+    cached_suggestions = _cached_suggestions.get(cache_key)
+
+    if cached_suggestions is not None:
+        return cached_suggestions
+
+    entries = _entries
+    start = bisect.bisect_left(entries, (normalized_prefix,))
+    end = min(bisect.bisect_left(entries, (normalized_prefix + "\uffff",), lo=start), start + MAX_SCANNED_ENTRIES)
+
+    matched_texts = {normalized_text for _, normalized_text in entries[start:end]}
+
+    best_texts = heapq.nsmallest(
+        limit,
+        matched_texts,
+        key=lambda normalized_text: (
+            not normalized_text.startswith(normalized_prefix),
+            -_suggestions[normalized_text][1],
+            len(normalized_text),
+            normalized_text
+        )
+    )
+    suggestions = [_suggestions[normalized_text][0] for normalized_text in best_texts]
+
+    with _lock:
+        if entries is not _entries: # the index changed meanwhile, don't cache a stale answer
+            return suggestions
+
+        if len(_cached_suggestions) >= MAX_CACHED_PREFIXES:
+            _cached_suggestions.clear()
+        _cached_suggestions[cache_key] = suggestions
+
+    return suggestions
+
+
+def get_stats():
+    """Return a dictionary of index size and build time."""
+
+    with _lock:
+        stats = dict(_stats)
+        stats["suggestions"] = len(_suggestions)
+        stats["entries"] = len(_entries)
+        stats["cached_prefixes"] = len(_cached_suggestions)
+        stats["max_recipe_id"] = _max_recipe_id
+        stats["recipes"] = len(_indexed_recipe_ids)
+
+    return stats
@@ -0,0 +1,291 @@
+"""Bulk ingest of Spoonacular search results into the local recipe catalog."""
+
+import gzip
+import json
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import insert
+
+from model import db, Recipe, Ingredient, RecipeNutrient, RecipePayload
+import crud
+import recipe_vocabulary
+
+
+recipes_table = Recipe.__table__
+ingredients_table = Ingredient.__table__
+recipe_nutrients_table = RecipeNutrient.__table__
+recipe_payloads_table = RecipePayload.__table__
+
+# recipes columns derived from a Spoonacular result (everything but ids and date_added)
+DERIVED_RECIPE_COLUMNS = [
+    "title", "source", "url", "servings", "instructions", "diets", "texture",
+    "allergen_mask", "ingredient_tokens", "vocabulary_version",
+]
+
+
+def get_recipe_row(spoonacular_recipe, date_added):
+    """Return a recipes table row for a Spoonacular result, classified against the recipe vocabulary."""
+
+    ingredient_names = [ingredient.get("name", "") for ingredient in spoonacular_recipe.get("extendedIngredients", [])]
+    allergen_mask, ingredient_tokens = recipe_vocabulary.classify_ingredients(ingredient_names)
+
+    return {
+        "spoonacular_id": spoonacular_recipe["id"],
+        "title": spoonacular_recipe.get("title", "No title"),
+        "source": spoonacular_recipe.get("sourceName", "N/A"),
+        "url": spoonacular_recipe.get("sourceUrl", "N/A"),
+        "servings": spoonacular_recipe.get("servings", 1),
+        "instructions": spoonacular_recipe.get("instructions", "No instructions provided"),
+        "diets": recipe_vocabulary.get_recipe_diets(spoonacular_recipe.get("diets", [])),
+        "texture": recipe_vocabulary.classify_texture(spoonacular_recipe.get("title", ""), ingredient_names),
+        "allergen_mask": allergen_mask,
+        "ingredient_tokens": ingredient_tokens,
+        "vocabulary_version": recipe_vocabulary.VOCABULARY_VERSION,
+        "date_added": date_added,
+    }
+
+
+def get_ingredient_rows(spoonacular_recipe, recipe_id):
+    """Return ingredients table rows for a Spoonacular result."""
+
+    return [
+        {
+            "recipe_id": recipe_id,
+            "name": ingredient.get("name", "N/A"),
+            "quantity": ingredient.get("amount", 0.0),
+            "unit": ingredient.get("unit", "unit"),
+        }
+        for ingredient in spoonacular_recipe.get("extendedIngredients", [])
+    ]
+
+
+def get_recipe_nutrients(spoonacular_recipe):
+    """Return a Spoonacular result's nutrients (from setting 'addRecipeNutrition' param to True)."""
+
+    return spoonacular_recipe.get("nutrition", {}).get("nutrients", [])
+
+
+def encode_payload(spoonacular_recipe):
+    """Return a Spoonacular result as gzip-compressed JSON bytes."""
+
+    return gzip.compress(json.dumps(spoonacular_recipe, separators=(",", ":")).encode())
+
+
+def decode_payload(payload):
+    """Return a Spoonacular result from gzip-compressed JSON bytes."""
+
+    return json.loads(gzip.decompress(payload))
+
+
+def archive_spoonacular_payloads(spoonacular_recipes):
+    """Upsert every result's raw JSON into recipe_payloads, in the caller's transaction."""
+
+    fetched_at = datetime.now()
+    payload_rows = [
+        {
+            "spoonacular_id": spoonacular_recipe["id"],
+            "payload": encode_payload(spoonacular_recipe),
+            "fetched_at": fetched_at,
+        }
+        for spoonacular_recipe in spoonacular_recipes
+    ]
+
+    if payload_rows:
+        upsert = insert(recipe_payloads_table)
+        db.session.execute(
+            upsert.on_conflict_do_update(
+                index_elements=["spoonacular_id"],
+                set_={"payload": upsert.excluded.payload, "fetched_at": upsert.excluded.fetched_at}
+            ),
+            payload_rows
+        )
+
+
+def insert_recipe_details(spoonacular_recipes, recipe_ids_by_spoonacular_id, stats):
+    """Bulk insert the ingredients and recipe nutrients of results whose recipes were just written,
+    and refresh their search vectors and nutrition profiles.
+    """
+
+    ingredient_rows = []
+    for spoonacular_recipe in spoonacular_recipes:
+        recipe_id = recipe_ids_by_spoonacular_id[spoonacular_recipe["id"]]
+        ingredient_rows.extend(get_ingredient_rows(spoonacular_recipe, recipe_id))
+
+    nutrient_ids = crud.get_or_create_nutrient_ids(
+        (nutrient["name"], nutrient["unit"])
+        for spoonacular_recipe in spoonacular_recipes
+        for nutrient in get_recipe_nutrients(spoonacular_recipe)
+    )
+
+    recipe_nutrient_rows = []
+    for spoonacular_recipe in spoonacular_recipes:
+        recipe_id = recipe_ids_by_spoonacular_id[spoonacular_recipe["id"]]
+        seen_nutrient_ids = set()
+
+        for nutrient in get_recipe_nutrients(spoonacular_recipe):
+            nutrient_id = nutrient_ids[nutrient["name"]]
+
+            if nutrient_id in seen_nutrient_ids:
+                stats["recipe_nutrients_skipped"] += 1
+                continue
+            seen_nutrient_ids.add(nutrient_id)
+
+            recipe_nutrient_rows.append({
+                "recipe_id": recipe_id,
+                "nutrient_id": nutrient_id,
+                "quantity": nutrient["amount"], # total amount per recipe, not per serving
+            })
+
+    if ingredient_rows:
+        db.session.execute(insert(ingredients_table), ingredient_rows)
+        stats["ingredients_inserted"] += len(ingredient_rows)
+
+    if recipe_nutrient_rows:
+        inserted_recipe_nutrients = db.session.execute(
+            insert(recipe_nutrients_table).on_conflict_do_nothing().returning(recipe_nutrients_table.c.recipe_id),
+            recipe_nutrient_rows
+        ).all()
+        stats["recipe_nutrients_inserted"] += len(inserted_recipe_nutrients)
+        stats["recipe_nutrients_skipped"] += len(recipe_nutrient_rows) - len(inserted_recipe_nutrients)
+
+    # titles and ingredient names are in place, index them for search
+    recipe_ids = [recipe_ids_by_spoonacular_id[spoonacular_recipe["id"]] for spoonacular_recipe in spoonacular_recipes]
+    crud.refresh_recipe_search_vectors(recipe_ids)
+    crud.refresh_search_words(recipe_ids)
+
+    # recipe nutrients are in place, project them per serving for nutrition goal filters
+    crud.refresh_recipe_nutrition_profiles(recipe_ids)
+
+
+def get_unique_results(spoonacular_recipes):
+    """Return results with an id, dropping duplicates and keeping Spoonacular's order."""
+
+    results_by_spoonacular_id = {}
+    for spoonacular_recipe in spoonacular_recipes:
+        if "id" in spoonacular_recipe:
+            results_by_spoonacular_id.setdefault(spoonacular_recipe["id"], spoonacular_recipe)
+
+    return list(results_by_spoonacular_id.values())
+
+
+def new_ingest_stats():
+    """Return a dictionary of zeroed ingest counters."""
+
+    return {
+        "recipes_inserted": 0,
+        "recipes_skipped": 0, # already cached, or inserted by someone else mid-ingest
+        "ingredients_inserted": 0,
+        "recipe_nutrients_inserted": 0,
+        "recipe_nutrients_skipped": 0,
+    }
+
+
+def ingest_spoonacular_recipes(spoonacular_recipes, commit=True):
+    """Cache Spoonacular results in bulk, in one transaction.
+
+    existing spoonacular_ids are resolved with one lookup, nutrients are resolved in bulk,
+    and new recipes, ingredients and recipe nutrients go in with bulk inserts. every result's
+    raw JSON is archived so the catalog can be re-derived later without refetching.
+    with commit=False the caller commits, so it can add its own rows to the same transaction.
+
+    returns (Recipe objects in result order, recipe_ids inserted by this ingest, ingest stats dictionary)
+    """
+
+    stats = new_ingest_stats()
+    unique_results = get_unique_results(spoonacular_recipes)
+    spoonacular_ids = [spoonacular_recipe["id"] for spoonacular_recipe in unique_results]
+    inserted_recipe_ids = []
+
+    if not spoonacular_ids:
+        return [], inserted_recipe_ids, stats
+
+    archive_spoonacular_payloads(unique_results)
+
+    # one set lookup for every recipe already in the database
+    existing_spoonacular_ids = {
+        spoonacular_id for (spoonacular_id,) in db.session.query(Recipe.spoonacular_id).filter(
+            Recipe.spoonacular_id.in_(spoonacular_ids))
+    }
+
+    new_results = [
+        spoonacular_recipe for spoonacular_recipe in unique_results
+        if spoonacular_recipe["id"] not in existing_spoonacular_ids
+    ]
+    stats["recipes_skipped"] = len(existing_spoonacular_ids)
+
+    if new_results:
+        date_added = datetime.now()
+
+        # ON CONFLICT DO NOTHING so a concurrent ingest of the same recipe is skipped, not an IntegrityError
+        inserted_recipes = db.session.execute(
+            insert(recipes_table).on_conflict_do_nothing(index_elements=["spoonacular_id"]).returning(
+                recipes_table.c.spoonacular_id, recipes_table.c.recipe_id),
+            [get_recipe_row(spoonacular_recipe, date_added) for spoonacular_recipe in new_results]
+        ).all()
+        recipe_ids_by_spoonacular_id = dict(inserted_recipes)
+        inserted_recipe_ids = list(recipe_ids_by_spoonacular_id.values())
+
+        stats["recipes_inserted"] = len(recipe_ids_by_spoonacular_id)
+        stats["recipes_skipped"] += len(new_results) - len(recipe_ids_by_spoonacular_id)
+
+        inserted_results = [
+            spoonacular_recipe for spoonacular_recipe in new_results
+            if spoonacular_recipe["id"] in recipe_ids_by_spoonacular_id
+        ]
+        insert_recipe_details(inserted_results, recipe_ids_by_spoonacular_id, stats)
+
+    if commit:
+        db.session.commit()
+
+    # load the cached recipes, in Spoonacular's order
+    recipes_by_spoonacular_id = {
+        recipe.spoonacular_id: recipe for recipe in db.session.query(Recipe).filter(
+            Recipe.spoonacular_id.in_(spoonacular_ids))
+    }
+
+    cached_recipes = [
+        recipes_by_spoonacular_id[spoonacular_id] for spoonacular_id in spoonacular_ids
+        if spoonacular_id in recipes_by_spoonacular_id
+    ]
+
+    return cached_recipes, inserted_recipe_ids, stats
+
+
+def rebuild_spoonacular_recipes(spoonacular_recipes):
+    """Re-derive recipes, ingredients and recipe nutrients from (archived) results, in one transaction.
+
+    recipes are upserted by spoonacular_id, keeping their recipe_id and date_added, so meal plans
+    and logs still point at them. their ingredients and recipe nutrients are replaced.
+
+    returns a stats dictionary.
+    """
+
+    stats = new_ingest_stats()
+    stats["recipes_rebuilt"] = 0
+    unique_results = get_unique_results(spoonacular_recipes)
+
+    if not unique_results:
+        return stats
+
+    date_added = datetime.now()
+    upsert = insert(recipes_table)
+
+    rebuilt_recipes = db.session.execute(
+        upsert.on_conflict_do_update(
+            index_elements=["spoonacular_id"],
+            set_={column: upsert.excluded[column] for column in DERIVED_RECIPE_COLUMNS}
+        ).returning(recipes_table.c.spoonacular_id, recipes_table.c.recipe_id),
+        [get_recipe_row(spoonacular_recipe, date_added) for spoonacular_recipe in unique_results]
+    ).all()
+    recipe_ids_by_spoonacular_id = dict(rebuilt_recipes)
+    recipe_ids = list(recipe_ids_by_spoonacular_id.values())
+    stats["recipes_rebuilt"] = len(recipe_ids)
+
+    db.session.execute(ingredients_table.delete().where(ingredients_table.c.recipe_id.in_(recipe_ids)))
+    db.session.execute(recipe_nutrients_table.delete().where(recipe_nutrients_table.c.recipe_id.in_(recipe_ids)))
+
+    insert_recipe_details(unique_results, recipe_ids_by_spoonacular_id, stats)
+
+    db.session.commit()
+
+    return stats
@@ -0,0 +1,88 @@
+"""Personalized ranking of recipe search results, scored in the search query itself.
+
+a recipe's score is a weighted sum of signals, each scaled to 0-1 on an absolute scale: text
+relevance, the share of the user's liked ingredients it has, its fit to the user's nutrition
+goals and its texture. a score depends only on the recipe and the user, never on which other
+recipes matched, so search pages are keyset-paged on (score, recipe_id) in the database (see
+crud.get_recipes_by_search) and stay in place when recipes are ingested between pages. to keep
+a search within a few milliseconds, only a bounded pool of the newest matches is scored.
+"""
+
+from sqlalchemy import Float, case, cast, func
+
+from model import Recipe, RecipeNutritionProfile
+
+
+# how much each signal adds to a recipe's score (each signal is scaled to 0-1 first)
+RANKING_WEIGHTS = {
+    "text": 1.0, # text relevance
+    "likes": 0.6, # share of the user's liked ingredients in the recipe
+    "goals": 0.4, # fit to the user's nutrition goals
+    "texture": 0.8, # softness, only for users with swallow difficulty
+}
+
+# ts_rank_cd normalization 32 scales a rank to rank / (rank + 1): 0-1 without looking at other matches
+TEXT_RANK_NORMALIZATION = 32
+
+# texture -> suitability for users with swallow difficulty (unknown texture counts as regular)
+TEXTURE_SCORES = {"soft": 1.0, "regular": 0.5, "hard": 0.0}
+
+
+def get_text_rank(search_query):
+    """Return a SQL expression of a recipe's text relevance (0-1) to a tsquery."""
+
+    return cast(func.ts_rank_cd(Recipe.search_vector, search_query, TEXT_RANK_NORMALIZATION), Float)
+
+
+def clip_unit(expression):
+    """Return a SQL expression clipped to 0-1."""
+
+    return func.least(func.greatest(expression, 0.0), 1.0)
+
+
+def get_goal_fit(nutrition_goals):
+    """Return a SQL expression of a recipe's average fit (0-1) to (column name, bound, limit) nutrition goals.
+
+    a "min" goal fits fully at twice its limit, a "max" goal fits fully at zero and not at all
+    at its limit; an unknown nutrient (or no nutrition profile) fits halfway.
+    """
+
+    goal_fits = []
+
+    for column_name, bound, limit in nutrition_goals:
+        values = cast(getattr(RecipeNutritionProfile, column_name), Float)
+
+        if bound == "min":
+            fit = clip_unit(values / float(2 * limit))
+        else:
+            fit = clip_unit(1.0 - values / float(limit))
+
+        goal_fits.append(func.coalesce(fit, 0.5))
+
+    return sum(goal_fits) / float(len(goal_fits))
+
+
+def get_score_expression(text_rank, liked_ingredients, like_count=0, nutrition_goals=(), swallow_difficulty=False):
+    """Return a SQL expression of a recipe's personalized score.
+
+    text_rank is get_text_rank's expression, liked_ingredients a count of the user's liked
+    ingredients in the recipe, like_count how many liked ingredients the user has and
+    nutrition_goals (column name, bound, limit) entries of crud.NUTRITION_GOALS.
+    """
+
+    score = RANKING_WEIGHTS["text"] * text_rank
+
+    if like_count:
+        score += RANKING_WEIGHTS["likes"] * func.least(cast(liked_ingredients, Float) / float(like_count), 1.0)
+
+    if nutrition_goals:
+        score += RANKING_WEIGHTS["goals"] * get_goal_fit(nutrition_goals)
+
+    if swallow_difficulty:
+        texture_score = case(
+            *((Recipe.texture == texture, texture_score) for texture, texture_score in TEXTURE_SCORES.items()),
+            else_=TEXTURE_SCORES["regular"]
+        )
+        score += RANKING_WEIGHTS["texture"] * texture_score
+
+    return cast(score, Float)
@@ -0,0 +1,202 @@
+"""Recipe search: answer from the local catalog first, fall back to Spoonacular."""
+
+import base64
+import json
+
+import crud
+import ingredient_index
+import recipe_vocabulary
+from apis.api_spoonacular import get_and_cache_spoonacular_recipes
+from background_ingest import enqueue_spoonacular_fetch
+
+
+MIN_LOCAL_RESULTS = 10 # fewer local matches than this sends the search to Spoonacular
+
+
+def get_user_search_filters(user):
+    """Return a dictionary of a user's filters used for both local and Spoonacular searches."""
+
+    return {
+        "user_allergens": [a.allergen for a in user.allergies],
+        "user_diet_restrictions": [dr.restriction for dr in user.diet_restrictions],
+        "user_dislikes": [ld.name.lower() for ld in user.likes_dislikes if ld.preference == "dislike"],
+    }
+
+
+def needs_spoonacular_fetch(local_recipes, recipe_search):
+    """Return True if a search should go to Spoonacular.
+
+    a search goes upstream when it was never fetched and the local catalog has too few matches,
+    or when the results fetched for it have gone stale.
+    """
+
+    if recipe_search is None:
+        return len(local_recipes) < MIN_LOCAL_RESULTS
+
+    return not crud.is_recipe_search_fresh(recipe_search)
+
+
+def search_recipes(user, search_term, likes=False, limit=50, background=True, fuzzy=True):
+    """Return (recipes, job_id, suggested_term, next_cursor) for a search term: recipe summaries
+    from the local catalog (see crud.get_recipe_summaries_query) ranked for the user (see
+    recipe_ranking), the job_id of a Spoonacular fetch if the search needs one (None otherwise),
+    the corrected "did you mean" term the results are for if the search term was misspelled
+    (None otherwise), and the cursor of the next page of local results (None if there are no more).
+
+    with background=True the fetch is queued and only local results are returned right away;
+    with background=False it runs inline and its recipes are added to the results.
+    with fuzzy=True a search with no local matches is retried with its misspelled words corrected
+    against the catalog's words, before anything goes to Spoonacular.
+    """
+
+    search_filters = get_user_search_filters(user)
+
+    local_recipes = crud.get_recipes_by_search(
+        user_id=user.user_id,
+        search_term=search_term,
+        likes=likes,
+        limit=limit
+    ) or []
+
+    suggested_term = crud.suggest_search_term(search_term) if fuzzy and not local_recipes else None
+
+    if suggested_term:
+        suggested_recipes = crud.get_recipes_by_search(
+            user_id=user.user_id,
+            search_term=suggested_term,
+            likes=likes,
+            limit=limit
+        ) or []
+
+        if suggested_recipes:
+            # the typo resolved locally, search (and fetch, if needed) the corrected term from here on
+            local_recipes = suggested_recipes
+            search_term = suggested_term
+        else:
+            suggested_term = None
+
+    next_cursor = get_next_cursor(search_term, local_recipes, limit)
+
+    search_key = crud.normalize_search_key(search_term, **search_filters)
+    recipe_search = crud.get_recipe_search_by_key(search_key)
+
+    if not needs_spoonacular_fetch(local_recipes, recipe_search):
+        if recipe_search and recipe_search.recipe_ids and len(local_recipes) < limit:
+            # add what Spoonacular found for this exact search last time, by primary key
+            cached_recipes = crud.get_recipe_summaries_by_ids(
+                filter_recipe_ids_for_user(user, recipe_search.recipe_ids, likes)
+            )
+            return merge_recipes(local_recipes, cached_recipes)[:limit], None, suggested_term, next_cursor
+
+        return local_recipes, None, suggested_term, next_cursor
+
+    if background:
+        job_id = enqueue_spoonacular_fetch(
+            search_key,
+            recipe_query=search_term,
+            limit=limit,
+            **search_filters
+        )
+        return local_recipes, job_id, suggested_term, next_cursor
+
+    fetched_recipes = get_and_cache_spoonacular_recipes(
+        recipe_query=search_term,
+        limit=limit,
+        **search_filters
+    )
+    fetched_summaries = crud.get_recipe_summaries_by_ids(
+        filter_recipe_ids_for_user(user, [recipe.recipe_id for recipe in fetched_recipes], likes)
+    )
+
+    return merge_recipes(local_recipes, fetched_summaries)[:limit], None, suggested_term, next_cursor
+
+
+def search_recipes_page(user, cursor, likes=False, limit=50):
+    """Return (recipes, next_cursor) for the page of local results after a search cursor.
+    raises ValueError if the cursor is invalid.
+    """
+
+    search_term, after = decode_search_cursor(cursor)
+
+    recipes = crud.get_recipes_by_search(
+        user_id=user.user_id,
+        search_term=search_term,
+        likes=likes,
+        limit=limit,
+        after=after
+    ) or []
+
+    return recipes, get_next_cursor(search_term, recipes, limit)
+
+
+def filter_recipe_ids_for_user(user, recipe_ids, likes=False):
+    """Return the recipe_ids (in order) without the user's allergens and dislikes, and with at
+    least one liked ingredient if likes is True, checked against the in-memory ingredient index.
+
+    Spoonacular applies its own, coarser intolerance and exclusion filters, so recipes it returns
+    go through the same ingredient vocabulary as local search results.
+    """
+
+    search_filters = get_user_search_filters(user)
+    like_tokens = get_like_tokens(user) if likes else ()
+
+    return ingredient_index.filter_recipe_ids(
+        recipe_ids,
+        include_any_keys=like_tokens,
+        exclude_keys=ingredient_index.get_exclusion_keys(
+            search_filters["user_allergens"], search_filters["user_dislikes"]
+        )
+    )
+
+
+def get_like_tokens(user):
+    """Return the normalized ingredient tokens of a user's likes (the tokens crud counts liked_ingredients with)."""
+
+    return {
+        recipe_vocabulary.normalize_phrase(ld.name) for ld in user.likes_dislikes if ld.preference == "like"
+    } - {""}
+
+
+def get_next_cursor(search_term, recipes, limit):
+    """Return the cursor of the page after a full page of ranked search results, or None."""
+
+    if len(recipes) < limit:
+        return None
+
+    return encode_search_cursor(search_term, recipes[-1].score, recipes[-1].recipe_id)
+
+
+def encode_search_cursor(search_term, score, recipe_id):
+    """Return an opaque, URL-safe cursor for the search results after (score, recipe_id)."""
+
+    cursor_json = json.dumps([search_term, score, recipe_id], separators=(",", ":"))
+
+    return base64.urlsafe_b64encode(cursor_json.encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    """Return (search_term, (score, recipe_id)) from a search cursor. raises ValueError if it's invalid."""
+
+    try:
+        search_term, score, recipe_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError) as error: # bad base64/JSON (binascii.Error is a ValueError), wrong shape
+        raise ValueError(f"Invalid search cursor: {cursor!r}") from error
+
+    if not isinstance(search_term, str) or not isinstance(score, (int, float)) or not isinstance(recipe_id, int):
+        raise ValueError(f"Invalid search cursor: {cursor!r}")
+
+    return search_term, (score, recipe_id)
+
+
+def merge_recipes(recipes, more_recipes):
+    """Return recipes followed by any of more_recipes not already in it."""
+
+    merged_recipes = list(recipes)
+    seen_recipe_ids = {recipe.recipe_id for recipe in merged_recipes}
+
+    for recipe in more_recipes:
+        if recipe.recipe_id not in seen_recipe_ids:
+            merged_recipes.append(recipe)
+            seen_recipe_ids.add(recipe.recipe_id)
+
+    return merged_recipes
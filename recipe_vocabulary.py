@@ -0,0 +1,243 @@
+"""Canonical allergen and ingredient-token vocabulary used to classify recipes at ingest.
+
+every recipe stores an allergen bitmask, the set of tokens in its ingredient names, its
+canonical diet tags and a texture, so a search can exclude any number of allergens and
+dislikes, and require any number of diets, with one predicate each, and rank soft recipes
+first for users with swallow difficulty. bump VOCABULARY_VERSION after changing anything
+here, then run reclassify_recipes.py.
+"""
+
+import re
+
+
+VOCABULARY_VERSION = 3
+
+# canonical allergens (Spoonacular's intolerance names) -> ingredient tokens that contain them
+ALLERGEN_TOKENS = {
+    "dairy": {
+        "milk", "cheese", "butter", "cream", "yogurt", "whey", "casein", "ghee", "buttermilk",
+        "cheddar", "parmesan", "mozzarella", "ricotta", "feta", "brie", "gouda", "custard",
+        "half and half", "sour cream", "cream cheese", "ice cream",
+    },
+    "egg": {"egg", "egg white", "egg yolk", "mayonnaise", "meringue"},
+    "gluten": {
+        "wheat", "flour", "bread", "breadcrumb", "bread crumb", "pasta", "spaghetti", "noodle",
+        "couscous", "semolina", "barley", "rye", "malt", "seitan", "spelt", "cracker", "bulgur",
+    },
+    "wheat": {
+        "wheat", "flour", "bread", "breadcrumb", "bread crumb", "pasta", "spaghetti", "noodle",
+        "couscous", "semolina", "seitan", "spelt", "cracker", "bulgur",
+    },
+    "peanut": {"peanut", "peanut butter", "peanut oil"},
+    "tree nut": {
+        "nut", "almond", "walnut", "pecan", "cashew", "pistachio", "hazelnut", "macadamia",
+        "brazil nut", "pine nut", "praline", "marzipan",
+    },
+    "shellfish": {"shrimp", "prawn", "crab", "lobster", "scallop", "clam", "mussel", "oyster", "crawfish"},
+    "seafood": {
+        "fish", "salmon", "tuna", "cod", "tilapia", "anchovy", "sardine", "halibut", "trout",
+        "mackerel", "haddock", "fish sauce",
+    },
+    "sesame": {"sesame", "tahini", "sesame oil", "sesame seed"},
+    "soy": {"soy", "soy sauce", "soybean", "tofu", "tempeh", "edamame", "miso", "tamari"},
+}
+
+# ingredient names containing these phrases don't count for the allergen ("almond flour" isn't gluten)
+ALLERGEN_EXCEPTIONS = {
+    "dairy": {
+        "peanut butter", "almond butter", "cashew butter", "apple butter", "cocoa butter",
+        "coconut milk", "coconut cream", "almond milk", "oat milk", "soy milk", "rice milk",
+        "cream of tartar", "dairy free",
+    },
+    "gluten": {"almond flour", "coconut flour", "rice flour", "corn flour", "chickpea flour", "gluten free", "rice noodle", "buckwheat"},
+    "wheat": {"almond flour", "coconut flour", "rice flour", "corn flour", "chickpea flour", "gluten free", "rice noodle", "buckwheat"},
+    "egg": {"eggplant", "egg free"},
+}
+
+# what users type for an allergy -> canonical allergen
+ALLERGEN_ALIASES = {
+    "milk": "dairy",
+    "lactose": "dairy",
+    "nut": "tree nut",
+    "tree nut": "tree nut",
+    "fish": "seafood",
+    "shell fish": "shellfish",
+    "soya": "soy",
+}
+
+# Spoonacular diet tags and what users type for a diet restriction -> canonical diet
+DIET_ALIASES = {
+    "lacto ovo vegetarian": "vegetarian",
+    "lacto-ovo vegetarian": "vegetarian",
+    "paleolithic": "paleo",
+    "whole 30": "whole30",
+    "keto": "ketogenic",
+    "pescetarian": "pescatarian",
+    "gluten-free": "gluten free",
+    "dairy-free": "dairy free",
+    "low fodmap": "fodmap friendly",
+}
+
+# a recipe tagged with a diet also fits these diets (a vegan recipe is vegetarian too)
+DIET_IMPLIES = {
+    "vegan": {"vegetarian", "dairy free"},
+    "lacto vegetarian": {"vegetarian"},
+    "ovo vegetarian": {"vegetarian", "dairy free"},
+    "vegetarian": {"pescatarian"},
+}
+
+# title tokens of dishes that are soft or smooth as served (easy to swallow)
+SOFT_DISH_TOKENS = {
+    "soup", "puree", "mash", "mashed", "smoothie", "porridge", "oatmeal", "congee", "custard",
+    "pudding", "mousse", "yogurt", "scrambled", "risotto", "stew", "chowder", "bisque", "dal",
+    "hummus", "polenta", "souffle", "shake", "applesauce", "jello", "creamy",
+}
+
+# title or ingredient tokens of hard, crunchy, dry or chewy food (hard to swallow)
+HARD_TEXTURE_TOKENS = {
+    "nut", "almond", "walnut", "peanut", "cashew", "pecan", "seed", "granola", "cracker", "chip",
+    "crisp", "crispy", "crunchy", "popcorn", "toast", "crouton", "jerky", "steak", "bacon",
+    "raw", "celery", "pretzel", "biscotti", "brittle", "cereal", "taco", "rice cake", "dried fruit",
+}
+
+# bit position of each canonical allergen in Recipe.allergen_mask; append only, never reorder
+ALLERGEN_BITS = {allergen: bit for bit, allergen in enumerate(ALLERGEN_TOKENS)}
+
+
+def singularize(word):
+    """Return a rough singular form of a lowercase word ("tomatoes" -> "tomato", "berries" -> "berry")."""
+
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+
+    return word
+
+
+def get_words(name):
+    """Return the singularized lowercase words of an ingredient name or user preference."""
+
+    return [singularize(word) for word in re.findall(r"[a-z]+", name.lower())]
+
+
+def normalize_phrase(name):
+    """Return an ingredient name or user preference as a token ("Red Onions" -> "red onion")."""
+
+    return " ".join(get_words(name))
+
+
+def get_name_tokens(name):
+    """Return every run of consecutive words in a name ("red bell pepper" -> red, bell, pepper,
+    red bell, bell pepper, red bell pepper), so a preference matches wherever it appears in the name.
+    """
+
+    words = get_words(name)
+
+    return {
+        " ".join(words[start:end])
+        for start in range(len(words))
+        for end in range(start + 1, len(words) + 1)
+    }
+
+
+# vocabulary tokens normalized the same way as ingredient names
+_allergen_tokens = {allergen: {normalize_phrase(token) for token in tokens} for allergen, tokens in ALLERGEN_TOKENS.items()}
+_soft_dish_tokens = {normalize_phrase(token) for token in SOFT_DISH_TOKENS}
+_hard_texture_tokens = {normalize_phrase(token) for token in HARD_TEXTURE_TOKENS}
+_allergen_exceptions = {allergen: {normalize_phrase(phrase) for phrase in phrases} for allergen, phrases in ALLERGEN_EXCEPTIONS.items()}
+
+
+def get_ingredient_allergens(name):
+    """Return the canonical allergens an ingredient name contains."""
+
+    name_tokens = get_name_tokens(name)
+    normalized_name = normalize_phrase(name)
+
+    return {
+        allergen for allergen, tokens in _allergen_tokens.items()
+        if name_tokens & tokens
+        and not any(exception in normalized_name for exception in _allergen_exceptions.get(allergen, ()))
+    }
+
+
+def classify_ingredients(ingredient_names):
+    """Return (allergen bitmask, sorted ingredient tokens) for a recipe's ingredient names."""
+
+    allergen_mask = 0
+    ingredient_tokens = set()
+
+    for name in ingredient_names:
+        ingredient_tokens |= get_name_tokens(name)
+
+        for allergen in get_ingredient_allergens(name):
+            allergen_mask |= 1 << ALLERGEN_BITS[allergen]
+
+    return allergen_mask, sorted(ingredient_tokens)
+
+
+def get_exclusion_filters(user_allergens=(), user_dislikes=()):
+    """Return (allergen bitmask, ingredient tokens) a user's recipes must not contain.
+
+    allergens in the vocabulary go in the bitmask; any other allergy ("strawberry") and every
+    dislike is matched by ingredient token instead.
+    """
+
+    allergen_mask = 0
+    excluded_tokens = set()
+
+    for allergen in user_allergens:
+        normalized_allergen = normalize_phrase(allergen)
+        canonical_allergen = ALLERGEN_ALIASES.get(normalized_allergen, normalized_allergen)
+
+        if canonical_allergen in ALLERGEN_BITS:
+            allergen_mask |= 1 << ALLERGEN_BITS[canonical_allergen]
+        elif normalized_allergen:
+            excluded_tokens.add(normalized_allergen)
+
+    for dislike in user_dislikes:
+        if normalize_phrase(dislike):
+            excluded_tokens.add(normalize_phrase(dislike))
+
+    return allergen_mask, sorted(excluded_tokens)
+
+
+def normalize_diet(diet):
+    """Return the canonical name of a diet tag or restriction ("Lacto Ovo Vegetarian" -> "vegetarian")."""
+
+    normalized_diet = " ".join(diet.lower().split())
+
+    return DIET_ALIASES.get(normalized_diet, normalized_diet)
+
+
+def get_recipe_diets(diets):
+    """Return a recipe's sorted canonical diet tags, including the diets they imply."""
+
+    recipe_diets = set()
+    pending_diets = [normalize_diet(diet) for diet in diets or [] if diet.strip()]
+
+    while pending_diets:
+        diet = pending_diets.pop()
+        if diet not in recipe_diets:
+            recipe_diets.add(diet)
+            pending_diets.extend(DIET_IMPLIES.get(diet, ()))
+
+    return sorted(recipe_diets)
+
+
+def classify_texture(title, ingredient_names):
+    """Return a recipe's texture: "soft" (a soft or smooth dish), "hard" (a crunchy, dry or chewy
+    dish, or one with such ingredients) or "regular".
+    """
+
+    title_tokens = get_name_tokens(title)
+
+    if title_tokens & _soft_dish_tokens:
+        return "soft"
+
+    if title_tokens & _hard_texture_tokens or any(get_name_tokens(name) & _hard_texture_tokens for name in ingredient_names):
+        return "hard"
+
+    return "regular"
@@ -0,0 +1,94 @@
+"""Reclassify cached recipes against the current recipe vocabulary.
+
+run after changing recipe_vocabulary.py (and bumping VOCABULARY_VERSION) so every recipe's
+allergen mask, ingredient tokens, diet tags and texture match it. only recipes classified with another
+version are touched, in recipe_id batches committed one at a time, so an interrupted run
+resumes where it stopped.
+
+    python3 reclassify_recipes.py --batch-size 1000
+"""
+
+import argparse
+import time
+
+from sqlalchemy import or_, update
+
+from model import db, connect_to_db, Recipe, Ingredient
+import recipe_vocabulary
+
+
+def get_stale_recipes(after_recipe_id, batch_size):
+    """Return {recipe_id: (title, diets)} for the next batch of recipes not classified with the
+    current vocabulary version.
+    """
+
+    return {
+        recipe_id: (title, diets) for recipe_id, title, diets in db.session.query(
+            Recipe.recipe_id, Recipe.title, Recipe.diets).filter(
+            Recipe.recipe_id > after_recipe_id,
+            or_(Recipe.vocabulary_version.is_(None), Recipe.vocabulary_version != recipe_vocabulary.VOCABULARY_VERSION)
+        ).order_by(Recipe.recipe_id).limit(batch_size)
+    }
+
+
+def reclassify_recipes(batch_size=1000):
+    """Reclassify every stale recipe and return a dictionary of totals."""
+
+    totals = {"batches": 0, "recipes_reclassified": 0}
+    start_time = time.perf_counter()
+    last_recipe_id = 0
+
+    while True:
+        stale_recipes = get_stale_recipes(last_recipe_id, batch_size)
+
+        if not stale_recipes:
+            break
+
+        recipe_ids = list(stale_recipes)
+
+        ingredient_names_by_recipe_id = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, name in db.session.query(Ingredient.recipe_id, Ingredient.name).filter(
+                Ingredient.recipe_id.in_(recipe_ids)):
+            ingredient_names_by_recipe_id[recipe_id].append(name)
+
+        recipe_rows = []
+        for recipe_id, ingredient_names in ingredient_names_by_recipe_id.items():
+            title, diets = stale_recipes[recipe_id]
+            allergen_mask, ingredient_tokens = recipe_vocabulary.classify_ingredients(ingredient_names)
+            recipe_rows.append({
+                "recipe_id": recipe_id,
+                "allergen_mask": allergen_mask,
+                "ingredient_tokens": ingredient_tokens,
+                "diets": recipe_vocabulary.get_recipe_diets(diets),
+                "texture": recipe_vocabulary.classify_texture(title, ingredient_names),
+                "vocabulary_version": recipe_vocabulary.VOCABULARY_VERSION,
+            })
+
+        # bulk UPDATE by primary key
+        db.session.execute(update(Recipe), recipe_rows)
+        db.session.commit()
+
+        last_recipe_id = recipe_ids[-1]
+        totals["batches"] += 1
+        totals["recipes_reclassified"] += len(recipe_rows)
+
+        print(f"Reclassified batch {totals['batches']} (up to recipe_id {last_recipe_id})")
+
+    totals["seconds"] = round(time.perf_counter() - start_time, 2)
+
+    return totals
+
+
+if __name__ == "__main__":
+    from server import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000, help="recipes per transaction")
+    args = parser.parse_args()
+
+    connect_to_db(app, echo=False)
+    app.app_context().push()
+
+    totals = reclassify_recipes(batch_size=args.batch_size)
+
+    print(f"Recipes reclassified! :) {totals}")
@@ -0,0 +1,126 @@
+"""Rebuild Recipe, Ingredient and RecipeNutrient rows from the raw Spoonacular payload archive.
+
+run after changing what ingest keeps from a result (a new column, more nutrients...) to
+re-derive the whole catalog offline, without spending API quota. payloads are decompressed
+and parsed in a process pool; each batch is written in one transaction. recipes keep their
+recipe_ids, so the daily nutrient totals of meals logged with them are rebuilt at the end,
+and the catalog version is bumped so running workers reload their nutrient matrix.
+
+    python3 rederive_catalog.py --batch-size 500 --processes 4
+
+with --search-index-only it just recomputes every recipe's search vector and search words
+from the current rows (e.g. recipes cached before the search index existed), without
+touching the archive. --nutrition-profiles-only does the same for the per-serving
+nutrition profiles.
+"""
+
+import argparse
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from model import db, connect_to_db, RecipePayload
+import crud
+from recipe_ingest import decode_payload, rebuild_spoonacular_recipes
+
+
+DECODE_BATCHES_PER_PROCESS = 2 # batches decoded ahead of the writer, per process
+
+
+def decode_payloads(payloads):
+    """Return Spoonacular results from a batch of compressed payloads (runs in a worker process)."""
+
+    return [decode_payload(payload) for payload in payloads]
+
+
+def get_payload_batches(batch_size):
+    """Yield batches of compressed payloads, in spoonacular_id order (keyset paging)."""
+
+    last_spoonacular_id = None
+
+    while True:
+        payload_query = db.session.query(RecipePayload.spoonacular_id, RecipePayload.payload)
+
+        if last_spoonacular_id is not None:
+            payload_query = payload_query.filter(RecipePayload.spoonacular_id > last_spoonacular_id)
+
+        payload_rows = payload_query.order_by(RecipePayload.spoonacular_id).limit(batch_size).all()
+
+        if not payload_rows:
+            return
+
+        last_spoonacular_id = payload_rows[-1].spoonacular_id
+
+        yield [payload_row.payload for payload_row in payload_rows]
+
+
+def rederive_catalog(batch_size=500, processes=4):
+    """Rebuild the catalog from every archived payload, then the daily nutrient totals,
+    and return a dictionary of totals.
+    """
+
+    totals = {"batches": 0}
+    start_time = time.perf_counter()
+
+    payload_batches = get_payload_batches(batch_size)
+    pending_batches = deque()
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # decoding runs ahead in the pool while a batch is written, at most
+        # processes * DECODE_BATCHES_PER_PROCESS batches ahead so the archive isn't all in memory
+        for payloads in islice(payload_batches, processes * DECODE_BATCHES_PER_PROCESS):
+            pending_batches.append(executor.submit(decode_payloads, payloads))
+
+        while pending_batches:
+            spoonacular_recipes = pending_batches.popleft().result()
+
+            for payloads in islice(payload_batches, 1):
+                pending_batches.append(executor.submit(decode_payloads, payloads))
+
+            batch_stats = rebuild_spoonacular_recipes(spoonacular_recipes)
+
+            totals["batches"] += 1
+            for stat_name, count in batch_stats.items():
+                totals[stat_name] = totals.get(stat_name, 0) + count
+
+            print(f"Rebuilt batch {totals['batches']}: {batch_stats}")
+
+    # the version bump tells every worker's nutrient matrix to reload
+    crud.bump_catalog_version()
+    db.session.commit()
+
+    # logged meals point at the same recipe_ids, whose nutrients may have changed
+    crud.rebuild_daily_nutrient_totals()
+    db.session.commit()
+
+    totals["seconds"] = round(time.perf_counter() - start_time, 2)
+
+    return totals
+
+
+if __name__ == "__main__":
+    from server import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="payloads per transaction")
+    parser.add_argument("--processes", type=int, default=4, help="processes decoding payloads")
+    parser.add_argument("--search-index-only", action="store_true", help="only recompute recipe search vectors and search words")
+    parser.add_argument("--nutrition-profiles-only", action="store_true", help="only recompute recipe nutrition profiles")
+    args = parser.parse_args()
+
+    connect_to_db(app, echo=False)
+    app.app_context().push()
+
+    if args.search_index_only:
+        crud.refresh_recipe_search_vectors()
+        crud.refresh_search_words()
+        db.session.commit()
+        print("Recipe search index refreshed! :)")
+    elif args.nutrition_profiles_only:
+        crud.refresh_recipe_nutrition_profiles()
+        db.session.commit()
+        print("Recipe nutrition profiles refreshed! :)")
+    else:
+        totals = rederive_catalog(batch_size=args.batch_size, processes=args.processes)
+        print(f"Catalog re-derived! :) {totals}")
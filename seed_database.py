@@ -139,8 +139,6 @@ healthy_recipes = get_and_cache_spoonacular_recipes(
     recipe_query="healthy recipes", limit=10
 )
 
-db.session.add_all(healthy_recipes)
-db.session.commit()
 
 # user1 recipes - Chloe - Vegetarian
 chloe_diet_restrictions = [dr.restriction for dr in user1.diet_restrictions]
@@ -152,8 +150,6 @@ chloe_recipes = get_and_cache_spoonacular_recipes(
     user_diet_restrictions=chloe_diet_restrictions,
     user_allergens=chloe_allergens
 )
-db.session.add_all(chloe_recipes)
-db.session.commit()
 
 # user2 recipes - Court - Gluten Free
 court_diet_restrictions = [dr.restriction for dr in user2.diet_restrictions]
@@ -165,8 +161,6 @@ court_recipes = get_and_cache_spoonacular_recipes(
     user_diet_restrictions=court_diet_restrictions,
     user_allergens=court_allergen
 )
-db.session.add_all(court_recipes)
-db.session.commit()
 
 # user3 recipes - Jade - 
 jade_dislikes = [dislike.name for dislike in user3.likes_dislikes if dislike.preference == "dislike"]
@@ -176,8 +170,6 @@ jade_recipes = get_and_cache_spoonacular_recipes(
     limit=5,
     user_dislikes=jade_dislikes
 )
-db.session.add_all(jade_recipes)
-db.session.commit()
 
 
 # ------- seeding user meal plans with recipes -------
@@ -364,4 +356,8 @@ if court_recipes:
 db.session.add(user3_recipe_ml_1)
 db.session.commit()
 
+# daily nutrient totals for the seeded meal logs
+crud.rebuild_daily_nutrient_totals()
+db.session.commit()
+
 print("Database seeding complete! :)")
\ No newline at end of file
@@ -3,9 +3,17 @@
 from flask import Flask, render_template, request, flash, session, redirect, jsonify 
 from model import connect_to_db, db, MealPlanRecipe, MealLog, MealLogRecipe
 from datetime import date, timedelta, datetime
+import hashlib
+import json
 import crud
-from nutritional_analysis import calculate_daily_nutrient_intake, generate_simple_grocery_list_for_week
-from apis.api_spoonacular import get_and_cache_spoonacular_recipes
+from nutritional_analysis import calculate_daily_nutrient_intake, get_nutrition_analysis_over_period, generate_simple_grocery_list_for_week
+from recipe_search import search_recipes, search_recipes_page, filter_recipe_ids_for_user
+import ingredient_index
+import recipe_autocomplete
+import nutrient_matrix
+from apis.api_spoonacular import get_spoonacular_stats
+from meal_plan_nutrition import get_projected_week_nutrition
+from background_ingest import get_job
 
 
 from jinja2 import StrictUndefined
@@ -210,6 +218,37 @@ def view_meal_plan():
     )
 
 
+# api endpoint for a week's planned nutrition (AJAX)
+@app.route("/api/meal-plan/nutrition", methods=["GET"])
+def api_get_meal_plan_nutrition():
+    """api endpoint for the projected nutrition of the user's meal plan for the week (Monday to
+    Sunday) containing ?date=YYYY-MM-DD (default today): per-day and week totals, compared with
+    daily targets from the user's nutrition goals. See meal_plan_nutrition.get_projected_week_nutrition.
+    Responses carry an ETag of the plan; a request with a matching If-None-Match gets a 304.
+    """
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"message": "Login to view meal plans."}), 401
+
+    try:
+        plan_date = datetime.strptime(request.args["date"], "%Y-%m-%d").date() if request.args.get("date") else date.today()
+    except ValueError:
+        return jsonify({"message": "date must be a date (YYYY-MM-DD)."}), 400
+
+    user = crud.get_user_by_id(user_id)
+    week_start = plan_date - timedelta(days=plan_date.weekday())
+
+    projection, fingerprint = get_projected_week_nutrition(user, week_start)
+
+    response = jsonify(projection)
+    response.set_etag(fingerprint)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True # always revalidate; an unchanged plan costs a 304
+
+    return response.make_conditional(request)
+
+
 @app.route("/meal-plan/edit/<date_string>", methods=["GET", "POST"])
 def meal_plan_add_edit(date_string):
     """Display page to add/edit meals for a specific date.
@@ -280,11 +319,51 @@ def get_recipe_search_page():
     return render_template("recipe_search.html", user=user)
 
 
+def get_recipe_data_for_frontend(recipe_object):
+    """Return a dictionary of a recipe's full data (with instructions and ingredients) to send as JSON to frontend."""
+
+    return {
+        "id": recipe_object.recipe_id,
+        "spoonacular_id": recipe_object.spoonacular_id,
+        "title": recipe_object.title,
+        "source": recipe_object.source,
+        "url": recipe_object.url,
+        "servings": recipe_object.servings,
+        "instructions": recipe_object.instructions,
+        "ingredients": [
+            {"name": ingredient.name, "quantity": ingredient.quantity, "unit": ingredient.unit}
+            for ingredient in recipe_object.ingredients
+        ]
+    }
+
+
+def get_recipe_summary_for_frontend(recipe_summary):
+    """Return a dictionary of a recipe summary (crud.get_recipe_summaries_query row) for search result lists."""
+
+    return {
+        "id": recipe_summary.recipe_id,
+        "title": recipe_summary.title,
+        "source": recipe_summary.source,
+        "url": recipe_summary.url,
+        "servings": recipe_summary.servings,
+        "nutrients": { # per serving, None if unknown
+            "calories": recipe_summary.calories,
+            "protein": recipe_summary.protein,
+            "fiber": recipe_summary.fiber,
+            "sugar": recipe_summary.sugar,
+            "sodium": recipe_summary.sodium
+        }
+    }
+
+
 # api endpoint for recipe search (AJAX)
 @app.route("/api/recipes/search", methods=["GET"])
 def api_search_recipes():
     """api endpoint to search for recipes.
-    Returns JSON list of recipes.
+    Returns JSON with a page of recipe summaries, the id of a background Spoonacular fetch
+    to poll if more recipes are on the way, the corrected search term if the results are
+    for a misspelling's "did you mean", and the cursor of the next page (None if last).
+    Pass the cursor back as ?cursor= to get the next page.
     """
 
     user_id = session.get("user_id")
@@ -295,49 +374,142 @@ def api_search_recipes():
 
     # get search term and filters
     search_term = request.args.get("query", "").strip()  
-    likes_filter = request.args.get("likes") # true or false
-    
+    likes_filter = request.args.get("likes") == "true" # true or false
+    cursor = request.args.get("cursor")
+
+    if cursor:
+        # next page of local results, keyset paged on (personalized score, recipe_id)
+        try:
+            found_recipes, next_cursor = search_recipes_page(user=user, cursor=cursor, likes=likes_filter)
+        except ValueError:
+            return jsonify({"message": "Invalid search cursor."}), 400
+
+        return jsonify({
+            "recipes": [get_recipe_summary_for_frontend(recipe_summary) for recipe_summary in found_recipes],
+            "ingest_job_id": None,
+            "did_you_mean": None,
+            "next_cursor": next_cursor
+        })
 
     if not search_term:
-        return jsonify([]) # return empty list if no search term 
+        return jsonify({"recipes": [], "ingest_job_id": None, "did_you_mean": None, "next_cursor": None}) # return empty list if no search term 
     
-    user_allergens = [a.allergen for a in user.allergies]
-    user_diet_restrictions = [dr.restriction for dr in user.diet_restrictions]
-    user_dislikes = [dislike.name.lower() for dislike in user.likes_dislikes]
-
-    cached_recipes_from_api = get_and_cache_spoonacular_recipes(
-        recipe_query=search_term,
-        user_allergens=user_allergens,
-        user_diet_restrictions=user_diet_restrictions,
-        user_dislikes=user_dislikes,
+    # local catalog answers right away; a Spoonacular fetch, if needed, runs in the background
+    found_recipes, ingest_job_id, suggested_term, next_cursor = search_recipes(
+        user=user,
+        search_term=search_term,
+        likes=likes_filter
     )
 
-    # filtered_recipes_from_db = crud.get_recipes_by_search(
-    #     user_id=user_id,
-    #     search_term=search_term,
-    #     likes=likes_filter
-    # )
-
-    if not cached_recipes_from_api:
+    if not found_recipes and not ingest_job_id:
         return jsonify({"message": "No recipes found matching criteria."})
 
-    # list of dictionaries with recipe data to send as JSON to frontend
-    recipes_data_for_frontend = []
-    
-    for recipe_object in cached_recipes_from_api:
-        recipes_data_for_frontend.append({
-            "id": recipe_object.recipe_id,
-            "spoonacular_id": recipe_object.spoonacular_id,
-            "title": recipe_object.title,
-            "source": recipe_object.source,
-            "url": recipe_object.url,
-            "servings": recipe_object.servings,
-            "instructions": recipe_object.instructions
-        })
+    # list of dictionaries with recipe summaries to send as JSON to frontend
+    recipes_data_for_frontend = [get_recipe_summary_for_frontend(recipe_summary) for recipe_summary in found_recipes]
 
-    
     # return JSON response
-    return jsonify(recipes_data_for_frontend)
+    return jsonify({
+        "recipes": recipes_data_for_frontend,
+        "ingest_job_id": ingest_job_id,
+        "did_you_mean": suggested_term, # results are for this corrected term, if not None
+        "next_cursor": next_cursor
+    })
+
+
+# api endpoint for search box suggestions as the user types (AJAX)
+@app.route("/api/recipes/autocomplete", methods=["GET"])
+def api_autocomplete_recipes():
+    """api endpoint for recipe title and ingredient name suggestions for a partial search term.
+    Answered from an in-memory prefix index (no search or Spoonacular fetch), and cacheable by
+    the browser for as long as the index goes between refreshes.
+    """
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"message": "Login to search for recipes."}), 401
+
+    prefix = request.args.get("query", "")
+    limit = min(request.args.get("limit", 10, type=int), 20)
+
+    response = jsonify({"suggestions": recipe_autocomplete.get_suggestions(prefix, limit=max(limit, 1))})
+    response.cache_control.private = True
+    response.cache_control.max_age = recipe_autocomplete.REFRESH_INTERVAL
+
+    return response
+
+
+# api endpoint for one recipe's full data (AJAX)
+@app.route("/api/recipes/<int:recipe_id>", methods=["GET"])
+def api_get_recipe(recipe_id):
+    """api endpoint for a recipe's details, with instructions and ingredients.
+    Responses carry an ETag; a request with a matching If-None-Match gets a 304 without a body.
+    """
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"message": "Login to view recipes."}), 401
+
+    recipe = crud.get_recipe_by_id(recipe_id)
+
+    if not recipe:
+        return jsonify({"message": "Recipe not found."}), 404
+
+    recipe_data = get_recipe_data_for_frontend(recipe)
+
+    response = jsonify(recipe_data)
+    response.set_etag(hashlib.sha1(json.dumps(recipe_data, sort_keys=True).encode()).hexdigest())
+    response.cache_control.private = True
+    response.cache_control.no_cache = True # always revalidate; unchanged recipes cost a 304
+
+    return response.make_conditional(request)
+
+
+# api endpoint to poll a background Spoonacular fetch (AJAX)
+@app.route("/api/recipes/search/jobs/<job_id>", methods=["GET"])
+def api_get_recipe_search_job(job_id):
+    """api endpoint for a background Spoonacular fetch's status.
+    Returns JSON with the job status and, once done, the recipes it found.
+    """
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"message": "Login to search for recipes."})
+
+    job = get_job(job_id)
+
+    if not job:
+        return jsonify({"status": "unknown", "recipes": []})
+
+    fetched_recipes = []
+
+    if job["status"] == "done":
+        # drop anything the user's allergies or dislikes rule out that Spoonacular's filters let through
+        user = crud.get_user_by_id(user_id)
+        fetched_recipes = crud.get_recipe_summaries_by_ids(filter_recipe_ids_for_user(user, job["recipe_ids"]))
+
+    return jsonify({
+        "status": job["status"],
+        "recipes": [get_recipe_summary_for_frontend(recipe_summary) for recipe_summary in fetched_recipes]
+    })
+
+
+# api endpoint for this worker's cache and Spoonacular counters (AJAX)
+@app.route("/api/stats", methods=["GET"])
+def api_get_stats():
+    """api endpoint for the stats of the worker answering: its Spoonacular client (latency,
+    retries) and search coalescing (search_flights), and its in-memory indexes.
+    """
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"message": "Login to view stats."}), 401
+
+    return jsonify({
+        "spoonacular": get_spoonacular_stats(),
+        "ingredient_index": ingredient_index.get_stats(),
+        "autocomplete": recipe_autocomplete.get_stats(),
+        "nutrient_matrix": nutrient_matrix.get_stats(),
+    })
 
 
 # api for adding recipe to meal plan (AJAX POST) 
@@ -479,6 +651,33 @@ def api_get_logged_meals():
     return jsonify(logged_meals_data)
 
 
+MAX_TREND_DAYS = 366 # longest period the nutrition trends endpoint analyzes at once
+
+
+# api for nutrient intake over a period, for trend charts (AJAX)
+@app.route("/api/nutrition/trends", methods=["GET"])
+def api_get_nutrition_trends():
+    """api endpoint for a user's daily nutrient intake between start and end (YYYY-MM-DD, inclusive).
+    end defaults to today and start to the 6 days before end (one week).
+    Returns JSON from nutritional_analysis.get_nutrition_analysis_over_period.
+    """
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"message": "Login to view nutrition trends."}), 401
+
+    try:
+        end_date = datetime.strptime(request.args["end"], "%Y-%m-%d").date() if request.args.get("end") else date.today()
+        start_date = datetime.strptime(request.args["start"], "%Y-%m-%d").date() if request.args.get("start") else end_date - timedelta(days=6)
+    except ValueError:
+        return jsonify({"message": "start and end must be dates (YYYY-MM-DD)."}), 400
+
+    if not timedelta(0) <= end_date - start_date < timedelta(days=MAX_TREND_DAYS):
+        return jsonify({"message": f"start must be on or before end, at most {MAX_TREND_DAYS} days apart."}), 400
+
+    return jsonify(get_nutrition_analysis_over_period(user_id, start_date, end_date))
+
+
 # api for adding a logged meal (AJAX POST)
 @app.route("/api/meal-log/add", methods=["POST"])
 def api_add_logged_meal():
@@ -501,6 +700,7 @@ def api_add_logged_meal():
         return jsonify({"message": "missing required data."})    
     
     log_date = datetime.strptime(log_date_str, "%Y-%m-%d").date()
+    serving_size = float(serving_size) # the daily nutrient totals change by the difference in servings
 
     meal_log_obj = db.session.query(MealLog).filter(
         MealLog.user_id == user_id,
@@ -514,13 +714,15 @@ def api_add_logged_meal():
         db.session.add(meal_log_obj)
         db.session.commit()
 
+    # locked until commit: a concurrent update waits and computes its delta from this one's serving size
     existing_ml_recipe = db.session.query(MealLogRecipe).filter(
         MealLogRecipe.meal_log_id == meal_log_obj.meal_log_id,
         MealLogRecipe.recipe_id == recipe_id
-    ).first()
+    ).with_for_update().first()
 
     if existing_ml_recipe:
-        # if entry exists, update its serving size 
+        # if entry exists, update its serving size (and the day's nutrient totals by the difference)
+        crud.apply_daily_nutrient_delta(user_id, log_date, recipe_id, serving_size - existing_ml_recipe.serving_size)
         existing_ml_recipe.serving_size = serving_size
         db.session.add(existing_ml_recipe)
         db.session.commit()
@@ -534,6 +736,7 @@ def api_add_logged_meal():
             serving_size
         )
         db.session.add(new_ml_recipe)
+        crud.apply_daily_nutrient_delta(user_id, log_date, recipe_id, serving_size)
         db.session.commit()
 
         return jsonify({"message": "Meal logged successfully!"})
@@ -555,14 +758,22 @@ def api_remove_logged_meal():
     if not all([meal_log_id, recipe_id, meal_type]):
         return jsonify({"message": "Missing required data."})
     
+    # locked until commit: a concurrent remove waits, then finds the row gone and takes nothing out twice
     ml_to_delete = db.session.query(MealLogRecipe).join(MealLog).filter(
         MealLogRecipe.meal_log_id == meal_log_id,
         MealLogRecipe.recipe_id == recipe_id,
-        MealLog.meal_type == meal_type
-    ).first()
+        MealLog.meal_type == meal_type,
+        MealLog.user_id == user_id
+    ).with_for_update(of=MealLogRecipe).first()
 
     if ml_to_delete:
+        log_date = ml_to_delete.meal_log.log_date
+
+        # take the recipe's share out of the day's nutrient totals in the same transaction
+        crud.apply_daily_nutrient_delta(user_id, log_date, ml_to_delete.recipe_id, -ml_to_delete.serving_size)
         db.session.delete(ml_to_delete)
+        db.session.flush()
+        crud.clear_daily_nutrient_totals_if_unlogged(user_id, log_date)
         db.session.commit()
 
         return jsonify({"message": "Logged meal removed."})
@@ -634,6 +845,13 @@ def view_grocery_list():
 
 if __name__ == "__main__":
     connect_to_db(app)
+
+    with app.app_context():
+        ingredient_index.build_index()
+        print(f"Ingredient index: {ingredient_index.get_stats()}")
+        recipe_autocomplete.load_suggestions()
+        print(f"Autocomplete index: {recipe_autocomplete.get_stats()}")
+
     app.run(host="0.0.0.0", debug=True, port=6060)
 
 
@@ -0,0 +1,70 @@
+"""Single-flight call coalescing: concurrent calls with the same key share one execution."""
+
+import threading
+
+
+class _Call:
+    """One in-flight execution and the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time. callers that arrive while a call
+    for their key is running wait for it and get the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {} # key -> _Call in flight
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) unless a call for key is already running,
+        in which case wait for that call instead. returns (result, coalesced).
+        """
+
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+
+            if call is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                self._stats["executions"] += 1
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def get_stats(self):
+        """Return a dictionary of calls, executions and coalesced calls."""
+
+        with self._lock:
+            stats = dict(self._stats)
+
+        stats["in_flight"] = len(self._calls)
+
+        return stats
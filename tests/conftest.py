@@ -0,0 +1,74 @@
+"""Fixtures for tests against a real PostgreSQL database.
+
+tests create and drop every table in the database at TEST_DATABASE_URI (default
+postgresql:///steady_test, never the app's database), and are skipped if it can't be reached:
+
+    createdb steady_test
+    python -m pytest
+"""
+
+import os
+
+import pytest
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from model import db, connect_to_db
+
+
+TEST_DATABASE_URI = os.environ.get("TEST_DATABASE_URI", "postgresql:///steady_test")
+
+
+@pytest.fixture(scope="session")
+def app():
+    """A Flask app connected to the test database, with its tables created."""
+
+    test_app = Flask(__name__)
+    connect_to_db(test_app, db_uri=TEST_DATABASE_URI, echo=False)
+
+    with test_app.app_context():
+        try:
+            db.engine.connect().close()
+        except OperationalError as error:
+            pytest.skip(f"test database {TEST_DATABASE_URI} unavailable: {error}")
+
+        db.drop_all()
+        db.create_all()
+
+        yield test_app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def session(app):
+    """The database session, with every table emptied after the test."""
+
+    yield db.session
+
+    db.session.rollback()
+
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+
+    db.session.commit()
+
+
+@pytest.fixture(scope="session")
+def server_app(app):
+    """The app of server.py, connected to the test database."""
+
+    from server import app as flask_app
+
+    connect_to_db(flask_app, db_uri=TEST_DATABASE_URI, echo=False)
+
+    return flask_app
+
+
+@pytest.fixture
+def client(server_app, session):
+    """A test client for server.py's endpoints, with every table emptied after the test."""
+
+    return server_app.test_client()
+
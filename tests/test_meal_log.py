@@ -0,0 +1,132 @@
+"""Tests for the meal log endpoints, the daily nutrient rollup they keep and the trends endpoint."""
+
+from datetime import date
+
+import pytest
+
+import crud
+
+
+LOG_DATE = date(2024, 5, 6)
+NEXT_DATE = date(2024, 5, 7)
+
+
+@pytest.fixture
+def logged_in_client(client, session):
+    """A test client logged in as a user, with two recipes to log: 20 g protein and 8 g fiber over
+    2 servings, and 5 g protein in 1 serving.
+    """
+
+    user = crud.create_user("Test", "User", "test@example.com", "password", 150)
+    protein = crud.create_nutrient("Protein", "g")
+    fiber = crud.create_nutrient("Fiber", "g")
+    soup = crud.create_recipe(1, "Lentil Soup", "test", "https://example.com/1", 2, "Simmer.", None, [])
+    toast = crud.create_recipe(2, "Bean Toast", "test", "https://example.com/2", 1, "Toast.", None, [])
+    session.add_all([user, protein, fiber, soup, toast])
+    session.flush()
+
+    session.add_all([
+        crud.create_recipe_nutrient(soup.recipe_id, protein.nutrient_id, 20),
+        crud.create_recipe_nutrient(soup.recipe_id, fiber.nutrient_id, 8),
+        crud.create_recipe_nutrient(toast.recipe_id, protein.nutrient_id, 5),
+    ])
+    session.commit()
+
+    with client.session_transaction() as client_session:
+        client_session["user_id"] = user.user_id
+
+    client.user_id = user.user_id
+    client.soup_id = soup.recipe_id
+    client.toast_id = toast.recipe_id
+
+    return client
+
+
+def log_meal(client, recipe_id, serving_size, log_date=LOG_DATE, meal_type="lunch"):
+    """Log servings of a recipe through the endpoint and return its JSON message."""
+
+    response = client.post("/api/meal-log/add", json={
+        "log_date": log_date.isoformat(),
+        "meal_type": meal_type,
+        "recipe_id": recipe_id,
+        "serving_size": serving_size,
+    })
+
+    return response.get_json()["message"]
+
+
+def get_trends(client, start_date=LOG_DATE, end_date=NEXT_DATE):
+    """Return the trends endpoint's JSON for a period."""
+
+    return client.get(f"/api/nutrition/trends?start={start_date.isoformat()}&end={end_date.isoformat()}").get_json()
+
+
+def test_logging_meals_adds_to_the_daily_totals(logged_in_client):
+    assert log_meal(logged_in_client, logged_in_client.soup_id, 1) == "Meal logged successfully!"
+    assert log_meal(logged_in_client, logged_in_client.toast_id, 2) == "Meal logged successfully!"
+
+    trends = get_trends(logged_in_client)
+
+    assert trends["days_with_logs"] == 1
+    assert trends["nutrients"]["Protein"]["daily"] == [20.0, None]
+    assert trends["nutrients"]["Fiber"]["daily"] == [4.0, None]
+    assert crud.get_daily_nutrient_total_drift(logged_in_client.user_id) == []
+
+
+def test_logging_a_meal_again_applies_the_serving_difference(logged_in_client):
+    log_meal(logged_in_client, logged_in_client.soup_id, 1)
+
+    assert log_meal(logged_in_client, logged_in_client.soup_id, 3) == "logged meal serving size updated!"
+
+    trends = get_trends(logged_in_client)
+
+    assert trends["nutrients"]["Protein"]["daily"] == [30.0, None]
+    assert trends["nutrients"]["Fiber"]["daily"] == [12.0, None]
+    assert crud.get_daily_nutrient_total_drift(logged_in_client.user_id) == []
+
+
+def test_removing_the_last_meal_clears_the_day(logged_in_client):
+    log_meal(logged_in_client, logged_in_client.soup_id, 1)
+    logged_meals = logged_in_client.get(f"/api/meal-log/get?date={LOG_DATE.isoformat()}").get_json()
+
+    response = logged_in_client.post("/api/meal-log-remove", json={
+        "meal_log_id": logged_meals[0]["meal_log_id"],
+        "recipe_id": logged_in_client.soup_id,
+        "meal_type": "lunch",
+    })
+
+    assert response.get_json()["message"] == "Logged meal removed."
+    assert get_trends(logged_in_client) == {
+        "dates": [LOG_DATE.isoformat(), NEXT_DATE.isoformat()],
+        "days_with_logs": 0,
+        "nutrients": {},
+    }
+    assert crud.get_daily_nutrient_total_drift(logged_in_client.user_id) == []
+
+
+def test_trends_average_over_logged_days(logged_in_client):
+    log_meal(logged_in_client, logged_in_client.soup_id, 1)
+    log_meal(logged_in_client, logged_in_client.toast_id, 2, log_date=NEXT_DATE)
+
+    protein = get_trends(logged_in_client)["nutrients"]["Protein"]
+
+    assert protein == {"unit": "g", "daily": [10.0, 10.0], "average": 10.0, "min": 10.0, "max": 10.0}
+
+
+def test_trends_reject_a_reversed_period(logged_in_client):
+    response = logged_in_client.get(f"/api/nutrition/trends?start={NEXT_DATE.isoformat()}&end={LOG_DATE.isoformat()}")
+
+    assert response.status_code == 400
+
+
+def test_rebuild_reproduces_the_incremental_totals(logged_in_client, session):
+    log_meal(logged_in_client, logged_in_client.soup_id, 1)
+    log_meal(logged_in_client, logged_in_client.soup_id, 2)
+    log_meal(logged_in_client, logged_in_client.toast_id, 1, log_date=NEXT_DATE)
+    incremental_trends = get_trends(logged_in_client)
+
+    crud.rebuild_daily_nutrient_totals(logged_in_client.user_id)
+    session.commit()
+
+    assert get_trends(logged_in_client) == incremental_trends
+    assert crud.get_daily_nutrient_total_drift(logged_in_client.user_id) == []
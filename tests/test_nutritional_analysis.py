@@ -0,0 +1,85 @@
+"""Tests for a day's nutrient intake (nutritional_analysis.calculate_daily_nutrient_intake)."""
+
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from model import db
+import crud
+import nutrient_cache
+import nutritional_analysis
+
+
+LOG_DATE = date(2024, 5, 6)
+
+
+@pytest.fixture
+def user_with_two_logged_recipes(session):
+    """A user who logged two recipes sharing a nutrient (Protein) on LOG_DATE, through the rollup
+    the meal log endpoints keep: 20 g / 2 servings x 1 serving + 5 g / 1 serving x 2 servings.
+    """
+
+    user = crud.create_user("Test", "User", "test@example.com", "password", 150)
+    protein = crud.create_nutrient("Protein", "g")
+    fiber = crud.create_nutrient("Fiber", "g")
+    soup = crud.create_recipe(1, "Lentil Soup", "test", "https://example.com/1", 2, "Simmer.", None, [])
+    toast = crud.create_recipe(2, "Bean Toast", "test", "https://example.com/2", 1, "Toast.", None, [])
+    session.add_all([user, protein, fiber, soup, toast])
+    session.flush()
+
+    session.add_all([
+        crud.create_recipe_nutrient(soup.recipe_id, protein.nutrient_id, 20),
+        crud.create_recipe_nutrient(soup.recipe_id, fiber.nutrient_id, 8),
+        crud.create_recipe_nutrient(toast.recipe_id, protein.nutrient_id, 5),
+    ])
+    meal_log = crud.create_meal_log(user.user_id, LOG_DATE, "lunch")
+    session.add(meal_log)
+    session.flush()
+
+    for recipe, serving_size in [(soup, 1.0), (toast, 2.0)]:
+        session.add(crud.add_recipe_to_meal_log(meal_log.meal_log_id, recipe.recipe_id, serving_size))
+        crud.apply_daily_nutrient_delta(user.user_id, LOG_DATE, recipe.recipe_id, serving_size)
+
+    session.commit()
+    nutrient_cache.load_nutrients()
+
+    return user
+
+
+def count_statements(function, *args):
+    """Return (function's result, how many SQL statements it executed)."""
+
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record_statement)
+
+    try:
+        result = function(*args)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record_statement)
+
+    return result, len(statements)
+
+
+def test_daily_intake_sums_every_logged_recipe(user_with_two_logged_recipes):
+    daily_intake = nutritional_analysis.calculate_daily_nutrient_intake(user_with_two_logged_recipes.user_id, LOG_DATE)
+
+    assert daily_intake["Protein"] == {"quantity": pytest.approx(20.0), "unit": "g"}
+    assert daily_intake["Fiber"] == {"quantity": pytest.approx(4.0), "unit": "g"}
+
+
+def test_daily_intake_runs_one_query(user_with_two_logged_recipes):
+    daily_intake, statement_count = count_statements(
+        nutritional_analysis.calculate_daily_nutrient_intake, user_with_two_logged_recipes.user_id, LOG_DATE
+    )
+
+    assert set(daily_intake) == {"Protein", "Fiber"}
+    assert statement_count == 1
+
+
+def test_daily_rollup_matches_meal_logs(user_with_two_logged_recipes):
+    assert crud.get_daily_nutrient_total_drift(user_with_two_logged_recipes.user_id) == []
@@ -0,0 +1,195 @@
+"""Warm the local recipe catalog from Spoonacular before users start searching.
+
+fetches pages of results for every query x diet x intolerance combination, several
+combinations at a time, within a Spoonacular quota budget. every page is ingested in one
+transaction and checkpointed, and so is a combination that ran out of results, so an
+interrupted run picks up where it stopped without re-fetching pages known to be empty.
+
+    python3 warm_catalog.py --queries-file queries.txt --diets "vegetarian,gluten free" \\
+        --intolerance-sets "dairy;peanut,tree nut" --pages 5 --quota 150
+"""
+
+import argparse
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from model import db, connect_to_db
+from apis.api_spoonacular import build_spoonacular_search_params, fetch_and_cache_spoonacular_page, get_spoonacular_stats
+from checkpoints import Checkpoint
+import crud
+
+
+MAX_PAGE_SIZE = 100 # most results complexSearch returns per request
+
+
+def estimate_page_points(page_size):
+    """Return the estimated Spoonacular quota points for one complexSearch page
+    (1 per request, 0.01 per result, plus recipe information and nutrition per result).
+    """
+
+    return 1 + page_size * (0.01 + 0.025 + 0.025)
+
+
+class QuotaBudget:
+    """Spoonacular quota points this run may spend, shared by every fetch thread."""
+
+    def __init__(self, points):
+        self.remaining = points
+        self._lock = threading.Lock()
+
+    def reserve(self, points):
+        """Take points from the budget. returns False if there aren't enough left."""
+
+        with self._lock:
+            if points > self.remaining:
+                return False
+
+            self.remaining -= points
+            return True
+
+
+def get_combinations(queries, diets, intolerance_sets):
+    """Return every (query, diet, intolerances) combination to warm."""
+
+    return list(itertools.product(queries, diets, intolerance_sets))
+
+
+def get_page_key(recipe_query, diet, intolerances, offset):
+    """Return the checkpoint key for one page of one combination."""
+
+    return f"{recipe_query}|{diet}|{','.join(intolerances)}|{offset}"
+
+
+def get_end_key(recipe_query, diet, intolerances):
+    """Return the checkpoint key marking a combination as out of results."""
+
+    return get_page_key(recipe_query, diet, intolerances, "end")
+
+
+def warm_combination(app, recipe_query, diet, intolerances, pages, page_size, budget, checkpoint, totals, totals_lock):
+    """Fetch and ingest the pages of one combination in order, stopping at its last result."""
+
+    user_diet_restrictions = [diet] if diet else None
+    user_allergens = list(intolerances) or None
+    search_key = crud.normalize_search_key(recipe_query, user_allergens, user_diet_restrictions)
+    end_key = get_end_key(recipe_query, diet, intolerances)
+
+    if checkpoint.is_done(end_key): # a previous run reached its last result
+        return
+
+    with app.app_context():
+        for page in range(pages):
+            offset = page * page_size
+            page_key = get_page_key(recipe_query, diet, intolerances, offset)
+
+            if checkpoint.is_done(page_key):
+                continue
+
+            if not budget.reserve(estimate_page_points(page_size)):
+                print(f"Quota budget spent, stopping '{page_key}'.")
+                return
+
+            spoonacular_params = build_spoonacular_search_params(
+                recipe_query,
+                user_allergens=user_allergens,
+                user_diet_restrictions=user_diet_restrictions,
+                limit=page_size,
+                offset=offset
+            )
+
+            try:
+                recipe_ids, ingest_stats = fetch_and_cache_spoonacular_page(recipe_query, search_key, spoonacular_params)
+            except requests.RequestException as error:
+                db.session.rollback()
+                print(f"Page '{page_key}' failed, it will be retried on the next run: {error}")
+                return
+
+            checkpoint.mark_done(page_key)
+
+            with totals_lock:
+                totals["pages"] += 1
+                for stat_name, count in ingest_stats.items():
+                    totals[stat_name] = totals.get(stat_name, 0) + count
+
+            print(f"Warmed '{page_key}': {ingest_stats}")
+
+            if ingest_stats["results"] < page_size: # no more results for this combination
+                checkpoint.mark_done(end_key)
+                return
+
+
+def warm_catalog(app, queries, diets, intolerance_sets, pages=3, page_size=MAX_PAGE_SIZE, quota=150.0,
+                 concurrency=4, checkpoint_path="warm_catalog_checkpoint.json"):
+    """Warm the catalog for every combination and return a dictionary of totals."""
+
+    checkpoint = Checkpoint(checkpoint_path)
+    budget = QuotaBudget(quota)
+    totals = {"pages": 0}
+    totals_lock = threading.Lock()
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(
+                warm_combination, app, recipe_query, diet, intolerances, pages, page_size,
+                budget, checkpoint, totals, totals_lock
+            )
+            for recipe_query, diet, intolerances in get_combinations(queries, diets, intolerance_sets)
+        ]
+
+        for future in futures:
+            future.result()
+
+    totals["seconds"] = round(time.perf_counter() - start_time, 2)
+    totals["quota_points_left"] = round(budget.remaining, 2)
+    totals["checkpointed"] = checkpoint.count() # pages, plus combinations out of results
+
+    return totals
+
+
+if __name__ == "__main__":
+    from server import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="*", help="search queries to warm")
+    parser.add_argument("--queries-file", help="file with one search query per line")
+    parser.add_argument("--diets", default="", help="comma-separated diets; each is warmed separately, plus no diet")
+    parser.add_argument("--intolerance-sets", default="", help="semicolon-separated sets of comma-separated intolerances, plus none")
+    parser.add_argument("--pages", type=int, default=3, help="pages per combination")
+    parser.add_argument("--page-size", type=int, default=MAX_PAGE_SIZE)
+    parser.add_argument("--quota", type=float, default=150.0, help="Spoonacular quota points this run may spend")
+    parser.add_argument("--concurrency", type=int, default=4, help="combinations fetched at the same time")
+    parser.add_argument("--checkpoint", default="warm_catalog_checkpoint.json")
+    args = parser.parse_args()
+
+    queries = list(args.queries)
+    if args.queries_file:
+        with open(args.queries_file) as queries_file:
+            queries.extend(line.strip() for line in queries_file if line.strip())
+
+    diets = [""] + [diet.strip() for diet in args.diets.split(",") if diet.strip()]
+    intolerance_sets = [()] + [
+        tuple(sorted(intolerance.strip() for intolerance in intolerance_set.split(",") if intolerance.strip()))
+        for intolerance_set in args.intolerance_sets.split(";") if intolerance_set.strip()
+    ]
+
+    connect_to_db(app, echo=False)
+
+    totals = warm_catalog(
+        app,
+        queries,
+        diets,
+        intolerance_sets,
+        pages=args.pages,
+        page_size=min(args.page_size, MAX_PAGE_SIZE),
+        quota=args.quota,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint
+    )
+
+    print(f"Catalog warm-up complete! :) {totals}")
+    print(f"Spoonacular client: {get_spoonacular_stats()['client']}")